@@ -3,63 +3,29 @@ AI Advisor module using Google Gemini API
 Generates insights, summaries, and suggestions based on user financial data
 """
 import os
-import google.generativeai as genai
 from datetime import datetime, timedelta
-from database import get_db_connection
+from database import month_days
+from correlations import get_correlations
+from prompt_builder import build_insights_prompt, parse_insights_reply, INSIGHTS_GENERATION_CONFIG
+import ai_gateway
 
 # Configure Gemini API
 GEMINI_API_KEY = os.getenv('GEMINI_API_KEY', '')
-if GEMINI_API_KEY:
-    genai.configure(api_key=GEMINI_API_KEY)
+ai_gateway.configure(GEMINI_API_KEY)
 
 def get_monthly_data(user_id, year, month):
     """Fetch all user data for a specific month"""
-    conn = get_db_connection()
-    
-    # Get expenses
-    expenses = conn.execute('''
-        SELECT amount, category, description, date
-        FROM expenses
-        WHERE user_id = ? AND strftime('%Y', date) = ? AND strftime('%m', date) = ?
-        ORDER BY date
-    ''', (user_id, str(year), f'{month:02d}')).fetchall()
-    
-    # Get income
-    income = conn.execute('''
-        SELECT amount, source, date
-        FROM income
-        WHERE user_id = ? AND strftime('%Y', date) = ? AND strftime('%m', date) = ?
-        ORDER BY date
-    ''', (user_id, str(year), f'{month:02d}')).fetchall()
-    
-    # Get habits completion
-    habits = conn.execute('''
-        SELECT h.name, COUNT(hl.id) as completed_days
-        FROM habits h
-        LEFT JOIN habit_logs hl ON h.id = hl.habit_id 
-            AND hl.completed = 1
-            AND strftime('%Y', hl.date) = ?
-            AND strftime('%m', hl.date) = ?
-        WHERE h.user_id = ?
-        GROUP BY h.id, h.name
-    ''', (str(year), f'{month:02d}', user_id)).fetchall()
-    
-    conn.close()
-    
-    return {
-        'expenses': [dict(e) for e in expenses],
-        'income': [dict(i) for i in income],
-        'habits': [dict(h) for h in habits]
-    }
+    # Imported here: repositories imports insights_cache, which imports this module
+    from repositories import repos
+    return repos.stats.period_data(user_id, *month_days(year, month))
 
 def calculate_spending_by_category(expenses):
-    """Calculate total spending per category"""
+    """Calculate total spending per category (summed exactly in paise)"""
     categories = {}
     for expense in expenses:
         category = expense['category']
-        amount = expense['amount']
-        categories[category] = categories.get(category, 0) + amount
-    return categories
+        categories[category] = categories.get(category, 0) + expense['amount_paise']
+    return {category: paise / 100 for category, paise in categories.items()}
 
 def generate_ai_insights(user_id, year, month):
     """Generate AI-powered insights using Gemini"""
@@ -80,10 +46,10 @@ def generate_ai_insights(user_id, year, month):
     previous_data = get_monthly_data(user_id, prev_year, prev_month)
     
     # Calculate totals
-    total_expenses = sum(e['amount'] for e in current_data['expenses'])
-    total_income = sum(i['amount'] for i in current_data['income'])
-    prev_total_expenses = sum(e['amount'] for e in previous_data['expenses'])
-    prev_total_income = sum(i['amount'] for i in previous_data['income'])
+    total_expenses = sum(e['amount_paise'] for e in current_data['expenses']) / 100
+    total_income = sum(i['amount_paise'] for i in current_data['income']) / 100
+    prev_total_expenses = sum(e['amount_paise'] for e in previous_data['expenses']) / 100
+    prev_total_income = sum(i['amount_paise'] for i in previous_data['income']) / 100
     
     # Calculate category breakdown
     category_spending = calculate_spending_by_category(current_data['expenses'])
@@ -93,109 +59,62 @@ def generate_ai_insights(user_id, year, month):
     import calendar
     days_in_month = calendar.monthrange(year, month)[1]
     
-    habit_patterns = []
+    habit_statuses = []
     for habit in current_data['habits']:
         completed_days = habit['completed_days']
         completion_rate = (completed_days / days_in_month) * 100 if days_in_month > 0 else 0
         
         # Classify regularity
         if completion_rate >= 70:
-            status = "Regular (tracked consistently)"
+            status = "regular"
         elif completion_rate >= 40:
-            status = "Moderate (tracked some days)"
+            status = "moderate"
         elif completion_rate > 0:
-            status = "Irregular (tracked sporadically)"
+            status = "irregular"
         else:
-            status = "Not tracked"
+            status = "not tracked"
         
-        habit_patterns.append(f"- {habit['name']}: {status}")
+        habit_statuses.append((habit['name'], status))
     
-    habits_summary = chr(10).join(habit_patterns) if habit_patterns else "- No habits tracked this month"
+    current_stats = {
+        'total_income': total_income,
+        'total_expenses': total_expenses,
+        'net_balance': total_income - total_expenses,
+        'category_spending': category_spending
+    }
+    previous_stats = {
+        'total_income': prev_total_income,
+        'total_expenses': prev_total_expenses,
+        'net_balance': prev_total_income - prev_total_expenses,
+        'category_spending': prev_category_spending
+    }
     
-    # Create prompt for Gemini
-    prompt = f"""You are a friendly financial advisor helping a student understand their spending habits.
-
-Current Month ({year}-{month:02d}):
-- Total Income: ₹{total_income:.2f}
-- Total Expenses: ₹{total_expenses:.2f}
-- Net Balance: ₹{total_income - total_expenses:.2f}
-
-Category Breakdown:
-{chr(10).join([f'- {cat}: ₹{amt:.2f}' for cat, amt in category_spending.items()])}
-
-Habit Tracking Pattern:
-{habits_summary}
-
-Previous Month ({prev_year}-{prev_month:02d}):
-- Total Income: ₹{prev_total_income:.2f}
-- Total Expenses: ₹{prev_total_expenses:.2f}
-
-Please provide:
-1. A brief, encouraging summary of their financial situation (2-3 sentences)
-2. A comparison with the previous month (1-2 sentences)
-3. Three specific, actionable suggestions to improve spending or habits
-
-IMPORTANT: When discussing habits, comment on their regularity/consistency patterns (e.g., "You're maintaining consistent habits" or "Try to establish a more regular routine"), but do NOT mention specific numbers or day counts for habits.
-
-Keep your tone friendly, supportive, and student-focused. Don't make predictions about future spending or provide financial guarantees. Focus on practical advice based on the data shown.
-"""
+    # Strongest habit/spending links over the last few months (cached per month)
+    habit_links = get_correlations(user_id, year, month)['findings']
+    
+    # Compact, token-budgeted prompt asking for JSON back
+    prompt = build_insights_prompt(
+        year, month, current_stats,
+        dict(previous_stats, year=prev_year, month=prev_month),
+        habit_statuses, habit_links
+    )
     
     try:
-        model = genai.GenerativeModel('models/gemini-2.5-flash')
-        response = model.generate_content(prompt)
-        ai_text = response.text
-        
-        # Parse the response (basic parsing)
-        lines = ai_text.split('\n')
-        summary_section = []
-        suggestions_section = []
-        comparison_section = []
-        
-        current_section = None
-        for line in lines:
-            line = line.strip()
-            if not line:
-                continue
-            if 'summary' in line.lower() or 'financial situation' in line.lower():
-                current_section = 'summary'
-                continue
-            elif 'comparison' in line.lower() or 'previous month' in line.lower():
-                current_section = 'comparison'
-                continue
-            elif 'suggestion' in line.lower() or 'improve' in line.lower():
-                current_section = 'suggestions'
-                continue
-            
-            if current_section == 'summary':
-                summary_section.append(line)
-            elif current_section == 'comparison':
-                comparison_section.append(line)
-            elif current_section == 'suggestions':
-                suggestions_section.append(line)
-        
-        # If parsing fails, use the entire response as summary
-        if not summary_section:
-            summary_section = [ai_text[:500]]
-        
-        return {
-            'summary': ' '.join(summary_section) or ai_text[:300],
-            'suggestions': suggestions_section if suggestions_section else ['Track your expenses daily', 'Set a budget for each category', 'Try to maintain your good habits'],
-            'comparison': ' '.join(comparison_section) if comparison_section else f"Previous month expenses: ₹{prev_total_expenses:.2f}, Current: ₹{total_expenses:.2f}",
-            'current_stats': {
-                'total_income': total_income,
-                'total_expenses': total_expenses,
-                'net_balance': total_income - total_expenses,
-                'category_spending': category_spending
-            },
-            'previous_stats': {
-                'total_income': prev_total_income,
-                'total_expenses': prev_total_expenses,
-                'net_balance': prev_total_income - prev_total_expenses,
-                'category_spending': prev_category_spending
-            }
-        }
+        # Concurrent requests for the same user and month share one upstream call
+        response = ai_gateway.generate_content(
+            prompt,
+            coalesce_key=('insights', user_id, year, month),
+            generation_config=INSIGHTS_GENERATION_CONFIG,
+            purpose='insights'
+        )
+        insights = parse_insights_reply(response.text)
+        insights['ai_generated'] = True
+        insights['current_stats'] = current_stats
+        insights['previous_stats'] = previous_stats
+        return insights
     
     except Exception as e:
+        # A reply that fails the schema falls back here too rather than being regenerated
         print(f"AI generation error: {e}")
         return {
             'summary': f'This month you spent ₹{total_expenses:.2f} and earned ₹{total_income:.2f}. Your net balance is ₹{total_income - total_expenses:.2f}.',
@@ -205,16 +124,7 @@ Keep your tone friendly, supportive, and student-focused. Don't make predictions
                 'Maintain consistency with your habits'
             ],
             'comparison': f'Last month you spent ₹{prev_total_expenses:.2f}. This month: ₹{total_expenses:.2f}',
-            'current_stats': {
-                'total_income': total_income,
-                'total_expenses': total_expenses,
-                'net_balance': total_income - total_expenses,
-                'category_spending': category_spending
-            },
-            'previous_stats': {
-                'total_income': prev_total_income,
-                'total_expenses': prev_total_expenses,
-                'net_balance': prev_total_income - prev_total_expenses,
-                'category_spending': prev_category_spending
-            }
+            'ai_generated': False,
+            'current_stats': current_stats,
+            'previous_stats': previous_stats
         }
@@ -0,0 +1,308 @@
+"""
+AI gateway for Gemini calls
+Wraps every model call with a deadline, jittered retries within a retry budget,
+a circuit breaker and single-flight coalescing of identical concurrent requests.
+generate_content_async is the same gateway for async handlers (asgi.py).
+"""
+import asyncio
+import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+import requests
+import google.generativeai as genai
+from google.api_core import exceptions as api_exceptions
+
+MODEL_NAME = 'models/gemini-2.5-flash'
+
+# Gateway settings (seconds unless noted), overridable from the environment
+AI_CALL_TIMEOUT = float(os.getenv('AI_CALL_TIMEOUT', '20'))
+AI_MAX_ATTEMPTS = int(os.getenv('AI_MAX_ATTEMPTS', '3'))
+AI_RETRY_BASE_DELAY = float(os.getenv('AI_RETRY_BASE_DELAY', '0.5'))
+AI_RETRY_BUDGET_RATIO = float(os.getenv('AI_RETRY_BUDGET_RATIO', '0.2'))
+AI_BREAKER_THRESHOLD = int(os.getenv('AI_BREAKER_THRESHOLD', '5'))
+AI_BREAKER_RESET = float(os.getenv('AI_BREAKER_RESET', '30'))
+AI_REST_THREADS = int(os.getenv('AI_REST_THREADS', '64'))
+
+# Errors worth another attempt: upstream overload, timeouts and dropped connections
+RETRYABLE_ERRORS = (
+    api_exceptions.DeadlineExceeded,
+    api_exceptions.ServiceUnavailable,
+    api_exceptions.ResourceExhausted,
+    api_exceptions.TooManyRequests,
+    api_exceptions.InternalServerError,
+    api_exceptions.BadGateway,
+    api_exceptions.GatewayTimeout,
+    requests.exceptions.Timeout,
+    requests.exceptions.ConnectionError,
+    TimeoutError,
+    ConnectionError,
+)
+
+# Errors that count against the circuit breaker: the model could not be reached or failed (5xx).
+# Rate limits and other 4xx, and responses we could not use, mean the upstream is answering
+BREAKER_ERRORS = (
+    api_exceptions.ServerError,
+    requests.exceptions.Timeout,
+    requests.exceptions.ConnectionError,
+    TimeoutError,
+    ConnectionError,
+)
+
+
+class AIUnavailable(Exception):
+    """Raised when the model could not answer in time; callers should use their fallback"""
+
+
+# google-generativeai only has an async client for gRPC; REST calls from async code go to threads
+_rest_transport = False
+_rest_executor = ThreadPoolExecutor(max_workers=AI_REST_THREADS, thread_name_prefix='ai-rest')
+
+
+def configure(api_key):
+    """Configure the Gemini client, optionally pointing it at GEMINI_API_ENDPOINT"""
+    global _rest_transport
+    if not api_key:
+        return False
+
+    options = {'api_key': api_key}
+    endpoint = os.getenv('GEMINI_API_ENDPOINT', '')
+    if endpoint:
+        # e.g. http://127.0.0.1:8089 for fake_gemini_server.py
+        options['transport'] = 'rest'
+        options['client_options'] = {'api_endpoint': endpoint}
+    genai.configure(**options)
+    _rest_transport = bool(endpoint)
+    return True
+
+
+class CircuitBreaker:
+    """Opens after consecutive failures, then lets a single probe through once reset_timeout passes"""
+
+    def __init__(self, failure_threshold, reset_timeout):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = 'closed'
+        self.failures = 0
+        self.opened_at = 0.0
+        self._probe_in_flight = False
+        self._lock = threading.Lock()
+
+    def allow(self):
+        """Return True if a call may go upstream right now"""
+        with self._lock:
+            if self.state == 'closed':
+                return True
+            if self.state == 'open' and time.monotonic() - self.opened_at < self.reset_timeout:
+                return False
+            if self._probe_in_flight:
+                return False
+            self.state = 'half_open'
+            self._probe_in_flight = True
+            return True
+
+    def record_success(self):
+        with self._lock:
+            if self.state != 'closed':
+                print("AI circuit breaker closed")
+            self.state = 'closed'
+            self.failures = 0
+            self._probe_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self._probe_in_flight = False
+            if self.state == 'half_open' or self.failures >= self.failure_threshold:
+                if self.state != 'open':
+                    print(f"AI circuit breaker opened after {self.failures} failures")
+                self.state = 'open'
+                self.opened_at = time.monotonic()
+
+
+class RetryBudget:
+    """Token bucket that caps retries to a fraction of first attempts"""
+
+    def __init__(self, ratio, max_tokens=10.0):
+        self.ratio = ratio
+        self.max_tokens = max_tokens
+        self.tokens = max_tokens
+        self._lock = threading.Lock()
+
+    def deposit(self):
+        with self._lock:
+            self.tokens = min(self.max_tokens, self.tokens + self.ratio)
+
+    def withdraw(self):
+        with self._lock:
+            if self.tokens < 1:
+                return False
+            self.tokens -= 1
+            return True
+
+
+class _Flight:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """Run fn once per key; concurrent callers with the same key wait for and share its result"""
+
+    def __init__(self):
+        self._flights = {}
+        self._lock = threading.Lock()
+
+    def do(self, key, fn):
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = _Flight()
+                self._flights[key] = flight
+
+        if not leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.result
+
+        try:
+            flight.result = fn()
+            return flight.result
+        except Exception as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._flights[key]
+            flight.done.set()
+
+
+breaker = CircuitBreaker(AI_BREAKER_THRESHOLD, AI_BREAKER_RESET)
+retry_budget = RetryBudget(AI_RETRY_BUDGET_RATIO)
+_single_flight = SingleFlight()
+
+# Running prompt/completion token counts per purpose, e.g. {'insights': {'calls': 3, ...}}
+token_usage = {}
+_usage_lock = threading.Lock()
+
+
+def record_usage(purpose, response):
+    """Add the response's token counts to token_usage and log them"""
+    usage = getattr(response, 'usage_metadata', None)
+    prompt_tokens = getattr(usage, 'prompt_token_count', 0) or 0
+    completion_tokens = getattr(usage, 'candidates_token_count', 0) or 0
+
+    with _usage_lock:
+        totals = token_usage.setdefault(purpose, {'calls': 0, 'prompt_tokens': 0, 'completion_tokens': 0})
+        totals['calls'] += 1
+        totals['prompt_tokens'] += prompt_tokens
+        totals['completion_tokens'] += completion_tokens
+    print(f"AI usage [{purpose}]: prompt={prompt_tokens} completion={completion_tokens} tokens")
+
+
+def _record_error(error):
+    """Report a failed call to the breaker: a failure for outages, otherwise the upstream answered"""
+    if isinstance(error, BREAKER_ERRORS):
+        breaker.record_failure()
+    else:
+        breaker.record_success()
+
+
+def _retry_delay(attempt, deadline, error):
+    """Full-jitter backoff before the next attempt; AIUnavailable once attempts, time or retry budget run out"""
+    delay = random.uniform(0, AI_RETRY_BASE_DELAY * (2 ** (attempt - 1)))
+    out_of_time = time.monotonic() + delay >= deadline
+    if attempt >= AI_MAX_ATTEMPTS or out_of_time or not retry_budget.withdraw():
+        _record_error(error)
+        raise AIUnavailable(f'AI call failed after {attempt} attempt(s): {error}') from error
+    print(f"AI call attempt {attempt} failed ({error}), retrying in {delay:.2f}s")
+    return delay
+
+
+def _call_with_retries(prompt, timeout, generation_config, purpose):
+    """One logical model call: retried with full jitter until it succeeds, the deadline passes or the budget runs out"""
+    if not breaker.allow():
+        raise AIUnavailable('AI circuit breaker is open')
+
+    deadline = time.monotonic() + (timeout or AI_CALL_TIMEOUT)
+    retry_budget.deposit()
+    model = genai.GenerativeModel(MODEL_NAME, generation_config=generation_config)
+    attempt = 0
+
+    while True:
+        attempt += 1
+        remaining = deadline - time.monotonic()
+        try:
+            if remaining <= 0:
+                raise TimeoutError('AI call deadline exceeded')
+            response = model.generate_content(
+                prompt,
+                request_options={'timeout': remaining, 'retry': None}
+            )
+            breaker.record_success()
+            record_usage(purpose, response)
+            return response
+        except RETRYABLE_ERRORS as e:
+            time.sleep(_retry_delay(attempt, deadline, e))
+        except Exception as e:
+            # Bad request, auth or safety errors will not improve with retries
+            _record_error(e)
+            raise
+
+
+async def _call_with_retries_async(prompt, timeout, generation_config, purpose):
+    """_call_with_retries for the event loop: awaits the model and the backoff instead of blocking a thread"""
+    if not breaker.allow():
+        raise AIUnavailable('AI circuit breaker is open')
+
+    deadline = time.monotonic() + (timeout or AI_CALL_TIMEOUT)
+    retry_budget.deposit()
+    model = genai.GenerativeModel(MODEL_NAME, generation_config=generation_config)
+    attempt = 0
+
+    while True:
+        attempt += 1
+        remaining = deadline - time.monotonic()
+        try:
+            if remaining <= 0:
+                raise TimeoutError('AI call deadline exceeded')
+            request_options = {'timeout': remaining, 'retry': None}
+            if _rest_transport:
+                call = asyncio.get_running_loop().run_in_executor(
+                    _rest_executor, lambda: model.generate_content(prompt, request_options=request_options)
+                )
+            else:
+                call = model.generate_content_async(prompt, request_options=request_options)
+            response = await asyncio.wait_for(call, remaining)
+            breaker.record_success()
+            record_usage(purpose, response)
+            return response
+        except RETRYABLE_ERRORS as e:
+            await asyncio.sleep(_retry_delay(attempt, deadline, e))
+        except Exception as e:
+            _record_error(e)
+            raise
+
+
+def generate_content(prompt, coalesce_key=None, timeout=None, generation_config=None, purpose='general'):
+    """
+    Call the model through the gateway and return the Gemini response.
+    Calls sharing a coalesce_key while one is in flight reuse that call's result.
+    Raises AIUnavailable when the breaker is open or the deadline/retries are exhausted.
+    """
+    def call():
+        return _call_with_retries(prompt, timeout, generation_config, purpose)
+
+    if coalesce_key is None:
+        return call()
+    return _single_flight.do(coalesce_key, call)
+
+
+async def generate_content_async(prompt, timeout=None, generation_config=None, purpose='general'):
+    """Async generate_content (without coalescing) for handlers running on an event loop"""
+    return await _call_with_retries_async(prompt, timeout, generation_config, purpose)
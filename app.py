@@ -2,29 +2,55 @@
 FinHabits Flask Application
 A beginner-friendly web app connecting daily habits with spending behavior
 """
-from flask import Flask, render_template, request, jsonify, session, redirect, url_for
+from flask import Flask, Response, render_template, request, jsonify, send_file, session, redirect, url_for
 from werkzeug.security import generate_password_hash, check_password_hash
 from datetime import datetime, timedelta
 from dotenv import load_dotenv
+import io
+import json
 import os
-from database import get_db, init_db
-from ai_advisor import generate_ai_insights
-import google.generativeai as genai
+import queue
+from database import (get_db, get_read_db, init_db, assign_shard, to_paise, from_paise, to_day, from_day,
+                      month_days, API_DATE, CATEGORY_NAME)
+from insights_cache import get_or_generate_insights
+from correlations import get_correlations
+from recurring import materialize as materialize_recurring, get_rules, add_rule, delete_rule
+from budgets import budget_status, set_budget, delete_budget, get_alerts, mark_alerts_seen, parse_month
+from savings import (goal_status, get_goal, add_goal, update_goal, delete_goal, add_contribution,
+                     delete_contribution)
+from search import search as search_entries
+from repositories import repos
+from timeslots import heatmap
+from timeseries import parse_range, series
+from sync import get_changes, SYNC_PAGE_SIZE
+from reports import request_report, report_file
+from live import LiveBroker, format_event, LIVE_HEARTBEAT_SECONDS
+from responses import rows_response, json_response, compress_response
+from profiler import init_profiler
+from statement_import import import_statement
+from prompt_builder import build_chatbot_prompt, CHATBOT_MAX_EXPENSE_ROWS, CHATBOT_MAX_INCOME_ROWS
+import ai_gateway
 
 # Load environment variables from .env file
 load_dotenv()
 
 # Configure Gemini API globally (like ai_advisor.py does)
 GEMINI_API_KEY = os.getenv('GEMINI_API_KEY', '')
-if GEMINI_API_KEY:
-    genai.configure(api_key=GEMINI_API_KEY)
+if ai_gateway.configure(GEMINI_API_KEY):
     print(f"Gemini API configured globally with key: {GEMINI_API_KEY[:10]}...")
 else:
     print("WARNING: GEMINI_API_KEY not found in environment")
 
+AI_NOT_CONFIGURED = ("I'm sorry, but AI features are not configured. Please set up your GEMINI_API_KEY "
+                     "to enable personalized financial advice.")
+
 app = Flask(__name__)
 # Use a consistent secret key for dev, or random for prod
 app.secret_key = os.environ.get('SECRET_KEY', os.urandom(24))
+# Large JSON bodies are gzip/brotli-compressed when the client accepts it
+app.after_request(compress_response)
+# Opt-in sampling profiler (PROFILE_SAMPLE_RATE / PROFILE_TOKEN), off by default
+init_profiler(app)
 
 # Initialize database on startup
 init_db()
@@ -86,19 +112,13 @@ def signup():
                     'INSERT INTO users (username, email, password_hash) VALUES (?, ?, ?)',
                     (username, email, password_hash)
                 )
-                conn.commit()
-                
-                # Initialize default habits for new user
                 user = conn.execute('SELECT id FROM users WHERE email = ?', (email,)).fetchone()
                 user_id = user['id']
-                
-                default_habits = ['Study', 'Coding', 'Exercise']
-                for habit_name in default_habits:
-                    conn.execute(
-                        'INSERT INTO habits (user_id, name, is_custom) VALUES (?, ?, ?)',
-                        (user_id, habit_name, False)
-                    )
+                assign_shard(conn, user_id)
                 conn.commit()
+            
+            # Initialize default habits for new user (in the user's shard)
+            repos.habits.add(user_id, ['Study', 'Coding', 'Exercise'], is_custom=False)
                 
             return jsonify({'success': True, 'message': 'Account created successfully'})
         except Exception as e:
@@ -137,6 +157,104 @@ def insights_page():
 
 # ==================== CHATBOT API ====================
 
+def load_chatbot_context(user_id, user_message):
+    """Last 30 days of the user's data as a chatbot prompt, plus the totals the fallback reply uses"""
+    # Fetch user's financial data (last 30 days) - Optimized for speed
+    today = datetime.now()
+    one_month_ago = today - timedelta(days=30)
+    day_filter = to_day(one_month_ago.date())
+    
+    with get_db(user_id) as conn:
+        # Totals and per-category sums come from aggregates, not from every row
+        expense_totals = conn.execute('''
+            SELECT COALESCE(SUM(amount_paise), 0) as total, COUNT(*) as count
+            FROM expenses
+            WHERE user_id = ? AND day >= ?
+        ''', (user_id, day_filter)).fetchone()
+        
+        income_totals = conn.execute('''
+            SELECT COALESCE(SUM(amount_paise), 0) as total, COUNT(*) as count
+            FROM income
+            WHERE user_id = ? AND day >= ?
+        ''', (user_id, day_filter)).fetchone()
+        
+        categories = conn.execute('''
+            SELECT c.name as category, SUM(e.amount_paise) as total
+            FROM expenses e
+            JOIN categories c ON c.id = e.category_id
+            WHERE e.user_id = ? AND e.day >= ?
+            GROUP BY e.category_id
+        ''', (user_id, day_filter)).fetchall()
+        
+        # Only the most recent rows are embedded in the prompt
+        expenses = conn.execute(f'''
+            SELECT amount_paise / 100.0 as amount, {CATEGORY_NAME.format('expenses.category_id')} as category,
+                   description, {API_DATE.format('day')} as date
+            FROM expenses
+            WHERE user_id = ? AND day >= ?
+            ORDER BY day DESC
+            LIMIT ?
+        ''', (user_id, day_filter, CHATBOT_MAX_EXPENSE_ROWS)).fetchall()
+        
+        income = conn.execute(f'''
+            SELECT amount_paise / 100.0 as amount, {CATEGORY_NAME.format('income.source_id')} as source,
+                   {API_DATE.format('day')} as date
+            FROM income
+            WHERE user_id = ? AND day >= ?
+            ORDER BY day DESC
+            LIMIT ?
+        ''', (user_id, day_filter, CHATBOT_MAX_INCOME_ROWS)).fetchall()
+        
+        # Get habits
+        habits = conn.execute('''
+            SELECT h.name, COUNT(CASE WHEN hl.completed = 1 THEN 1 END) as completed_days,
+                   COUNT(hl.id) as total_tracked_days
+            FROM habits h
+            LEFT JOIN habit_logs hl ON h.id = hl.habit_id AND hl.day >= ?
+            WHERE h.user_id = ?
+            GROUP BY h.id, h.name
+        ''', (day_filter, user_id)).fetchall()
+    
+    # Calculate statistics
+    total_expenses = from_paise(expense_totals['total'])
+    total_income = from_paise(income_totals['total'])
+    net_balance = total_income - total_expenses
+    category_spending = {row['category']: from_paise(row['total']) for row in categories}
+    
+    # Build token-budgeted context for AI
+    context = build_chatbot_prompt(
+        user_message,
+        today.strftime('%Y-%m-%d'),
+        {
+            'total_income': total_income,
+            'total_expenses': total_expenses,
+            'income_count': income_totals['count'],
+            'expense_count': expense_totals['count']
+        },
+        category_spending,
+        income,
+        expenses,
+        habits
+    )
+    
+    return context, {
+        'total_expenses': total_expenses,
+        'total_income': total_income,
+        'net_balance': net_balance,
+        'category_spending': category_spending
+    }
+
+def chatbot_fallback(totals):
+    """Plain summary sent instead of an AI answer when the model is unavailable"""
+    category_spending = totals['category_spending']
+    top_category = max(category_spending, key=category_spending.get) if category_spending else None
+    fallback = (f"I can't reach the AI advisor right now, but here is your last 30 days: "
+                f"you spent ₹{totals['total_expenses']:,.2f} and earned ₹{totals['total_income']:,.2f} "
+                f"(net ₹{totals['net_balance']:,.2f}).")
+    if top_category:
+        fallback += f" Your biggest category was {top_category} at ₹{category_spending[top_category]:,.2f}."
+    return fallback
+
 @app.route('/api/chatbot', methods=['POST'])
 def chatbot():
     """Context-aware financial advisor chatbot"""
@@ -152,93 +270,23 @@ def chatbot():
     
     if not GEMINI_API_KEY:
         return jsonify({
-            'response': "I'm sorry, but AI features are not configured. Please set up your GEMINI_API_KEY to enable personalized financial advice.",
+            'response': AI_NOT_CONFIGURED,
             'is_relevant': False
         })
     
     try:
-        # Fetch user's financial data (last 30 days) - Optimized for speed
-        today = datetime.now()
-        one_month_ago = today - timedelta(days=30)
-        date_filter = one_month_ago.strftime('%Y-%m-%d')
+        context, totals = load_chatbot_context(user_id, user_message)
         
-        with get_db() as conn:
-            # Get expenses
-            expenses = conn.execute('''
-                SELECT amount, category, description, date
-                FROM expenses
-                WHERE user_id = ? AND date >= ?
-                ORDER BY date DESC
-            ''', (user_id, date_filter)).fetchall()
-            
-            # Get income
-            income = conn.execute('''
-                SELECT amount, source, date
-                FROM income
-                WHERE user_id = ? AND date >= ?
-                ORDER BY date DESC
-            ''', (user_id, date_filter)).fetchall()
-            
-            # Get habits
-            habits = conn.execute('''
-                SELECT h.name, COUNT(CASE WHEN hl.completed = 1 THEN 1 END) as completed_days,
-                       COUNT(hl.id) as total_tracked_days
-                FROM habits h
-                LEFT JOIN habit_logs hl ON h.id = hl.habit_id AND hl.date >= ?
-                WHERE h.user_id = ?
-                GROUP BY h.id, h.name
-            ''', (date_filter, user_id)).fetchall()
-        
-        # Calculate statistics
-        total_expenses = sum(e['amount'] for e in expenses)
-        total_income = sum(i['amount'] for i in income)
-        net_balance = total_income - total_expenses
-        
-        # Category breakdown
-        category_spending = {}
-        for exp in expenses:
-            cat = exp['category']
-            category_spending[cat] = category_spending.get(cat, 0) + exp['amount']
-        
-        # Build context for AI
-        context = f"""You are a personal financial advisor chatbot helping a user manage their finances.
-
-USER'S FINANCIAL DATA (Last 3 months):
-
-INCOME:
-- Total Income: ₹{total_income:,.2f}
-- Number of income entries: {len(income)}
-{chr(10).join([f"  - {i['source']}: ₹{i['amount']:,.2f} on {i['date']}" for i in income[:5]])}
-{f"  ... and {len(income) - 5} more entries" if len(income) > 5 else ""}
-
-EXPENSES:
-- Total Expenses: ₹{total_expenses:,.2f}
-- Net Balance: ₹{net_balance:,.2f} {"(Positive - Saving money!)" if net_balance > 0 else "(Negative - Spending more than earning)"}
-- Number of expense entries: {len(expenses)}
-
-SPENDING BY CATEGORY:
-{chr(10).join([f"  - {cat}: ₹{amt:,.2f} ({(amt/total_expenses*100 if total_expenses > 0 else 0):.1f}%)" for cat, amt in sorted(category_spending.items(), key=lambda x: x[1], reverse=True)])}
-
-RECENT EXPENSES:
-{chr(10).join([f"  - {e['category']}: ₹{e['amount']:,.2f} on {e['date']} ({e['description']})" for e in expenses[:10]])}
-{f"  ... and {len(expenses) - 10} more expenses" if len(expenses) > 10 else ""}
-
-HABITS:
-{chr(10).join([f"  - {h['name']}: {h['completed_days']} days completed out of {h['total_tracked_days']} tracked" for h in habits]) if habits else "  No habits tracked yet"}
-
-Current Date: {today.strftime('%Y-%m-%d')}
-
-Based on this data, answer the user's question with specific, personalized advice. Use actual numbers from their data.
-CRITICAL: Keep your response concise, strictly between 50 to 80 words. Be friendly, supportive, and actionable.
-
-User's Question: {user_message}
-
-Your Response:"""
-        
-        # Call Gemini AI
-        model = genai.GenerativeModel('models/gemini-2.5-flash')
-        response = model.generate_content(context)
-        ai_response = response.text
+        # Call Gemini AI through the gateway (deadline, retries, circuit breaker)
+        try:
+            response = ai_gateway.generate_content(context, purpose='chatbot')
+            ai_response = response.text
+        except ai_gateway.AIUnavailable as e:
+            print(f"Chatbot falling back: {e}")
+            return jsonify({
+                'response': chatbot_fallback(totals),
+                'is_relevant': False
+            })
         
         return jsonify({
             'response': ai_response,
@@ -279,12 +327,7 @@ def expenses():
             if date_obj > datetime.now().date():
                 return jsonify({'error': 'Cannot add expenses for future dates'}), 400
             
-            with get_db() as conn:
-                conn.execute(
-                    'INSERT INTO expenses (user_id, amount, category, description, date) VALUES (?, ?, ?, ?, ?)',
-                    (user_id, amount, category, description, date)
-                )
-                conn.commit()
+            repos.expenses.add(user_id, to_paise(amount), category, description, to_day(date))
             
             return jsonify({'success': True, 'message': 'Expense added'})
         
@@ -292,21 +335,16 @@ def expenses():
             date = request.args.get('date', datetime.now().strftime('%Y-%m-%d'))
             month = request.args.get('month')
             
-            with get_db() as conn:
-                if month:  # Get all expenses for a month
-                    year, month_num = month.split('-')
-                    expenses_data = conn.execute('''
-                        SELECT * FROM expenses 
-                        WHERE user_id = ? AND strftime('%Y', date) = ? AND strftime('%m', date) = ?
-                        ORDER BY date DESC
-                    ''', (user_id, year, month_num)).fetchall()
-                else:  # Get expenses for a specific date
-                    expenses_data = conn.execute(
-                        'SELECT * FROM expenses WHERE user_id = ? AND date = ? ORDER BY id DESC',
-                        (user_id, date)
-                    ).fetchall()
+            # Recurring entries are written lazily, up to the end of the day or month being viewed
+            repos.materialize(user_id, month_days(*month.split('-'))[1] if month else to_day(date) + 1)
+            
+            if month:  # Get all expenses for a month
+                year, month_num = month.split('-')
+                expenses_data = repos.expenses.for_range(user_id, *month_days(year, month_num))
+            else:  # Get expenses for a specific date
+                expenses_data = repos.expenses.for_day(user_id, to_day(date))
             
-            return jsonify([dict(e) for e in expenses_data])
+            return rows_response(expenses_data)
             
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -320,36 +358,30 @@ def update_delete_expense(expense_id):
     user_id = session['user_id']
     
     try:
-        with get_db() as conn:
-            # Verify ownership
-            expense = conn.execute('SELECT * FROM expenses WHERE id = ? AND user_id = ?', 
-                                 (expense_id, user_id)).fetchone()
-            if not expense:
-                return jsonify({'error': 'Expense not found or unauthorized'}), 404
+        # Verify ownership
+        if not repos.expenses.get(user_id, expense_id):
+            return jsonify({'error': 'Expense not found or unauthorized'}), 404
+        
+        if request.method == 'PUT':
+            data = request.json
+            amount = data.get('amount')
+            category = data.get('category')
+            description = data.get('description', '')
+            date = data.get('date')
             
-            if request.method == 'PUT':
-                data = request.json
-                amount = data.get('amount')
-                category = data.get('category')
-                description = data.get('description', '')
-                date = data.get('date')
-                
-                # Validate date is not in the future
-                date_obj = datetime.strptime(date, '%Y-%m-%d').date()
-                if date_obj > datetime.now().date():
-                    return jsonify({'error': 'Cannot set expenses for future dates'}), 400
-                
-                conn.execute(
-                    'UPDATE expenses SET amount = ?, category = ?, description = ?, date = ? WHERE id = ?',
-                    (amount, category, description, date, expense_id)
-                )
-                conn.commit()
-                return jsonify({'success': True, 'message': 'Expense updated'})
+            # Validate date is not in the future
+            date_obj = datetime.strptime(date, '%Y-%m-%d').date()
+            if date_obj > datetime.now().date():
+                return jsonify({'error': 'Cannot set expenses for future dates'}), 400
             
-            elif request.method == 'DELETE':
-                conn.execute('DELETE FROM expenses WHERE id = ?', (expense_id,))
-                conn.commit()
-                return jsonify({'success': True, 'message': 'Expense deleted'})
+            if not repos.expenses.update(user_id, expense_id, to_paise(amount), category, description, to_day(date)):
+                return jsonify({'error': 'Expense not found or unauthorized'}), 404
+            return jsonify({'success': True, 'message': 'Expense updated'})
+        
+        elif request.method == 'DELETE':
+            if not repos.expenses.delete(user_id, expense_id):
+                return jsonify({'error': 'Expense not found or unauthorized'}), 404
+            return jsonify({'success': True, 'message': 'Expense deleted'})
     
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -377,12 +409,7 @@ def income():
             if date_obj > datetime.now().date():
                 return jsonify({'error': 'Cannot add income for future dates'}), 400
             
-            with get_db() as conn:
-                conn.execute(
-                    'INSERT INTO income (user_id, amount, source, date) VALUES (?, ?, ?, ?)',
-                    (user_id, amount, source, date)
-                )
-                conn.commit()
+            repos.income.add(user_id, to_paise(amount), source, to_day(date))
             
             return jsonify({'success': True, 'message': 'Income added'})
         
@@ -390,21 +417,16 @@ def income():
             date = request.args.get('date', datetime.now().strftime('%Y-%m-%d'))
             month = request.args.get('month')
             
-            with get_db() as conn:
-                if month:
-                    year, month_num = month.split('-')
-                    income_data = conn.execute('''
-                        SELECT * FROM income 
-                        WHERE user_id = ? AND strftime('%Y', date) = ? AND strftime('%m', date) = ?
-                        ORDER BY date DESC
-                    ''', (user_id, year, month_num)).fetchall()
-                else:
-                    income_data = conn.execute(
-                        'SELECT * FROM income WHERE user_id = ? AND date = ? ORDER BY id DESC',
-                        (user_id, date)
-                    ).fetchall()
+            # Recurring entries are written lazily, up to the end of the day or month being viewed
+            repos.materialize(user_id, month_days(*month.split('-'))[1] if month else to_day(date) + 1)
             
-            return jsonify([dict(i) for i in income_data])
+            if month:
+                year, month_num = month.split('-')
+                income_data = repos.income.for_range(user_id, *month_days(year, month_num))
+            else:
+                income_data = repos.income.for_day(user_id, to_day(date))
+            
+            return rows_response(income_data)
             
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -418,36 +440,79 @@ def update_delete_income(income_id):
     user_id = session['user_id']
     
     try:
-        with get_db() as conn:
-            # Verify ownership
-            income = conn.execute('SELECT * FROM income WHERE id = ? AND user_id = ?', 
-                                (income_id, user_id)).fetchone()
-            if not income:
-                return jsonify({'error': 'Income not found or unauthorized'}), 404
+        # Verify ownership
+        if not repos.income.get(user_id, income_id):
+            return jsonify({'error': 'Income not found or unauthorized'}), 404
+        
+        if request.method == 'PUT':
+            data = request.json
+            amount = data.get('amount')
+            source = data.get('source')
+            date = data.get('date')
             
-            if request.method == 'PUT':
-                data = request.json
-                amount = data.get('amount')
-                source = data.get('source')
-                date = data.get('date')
-                
-                # Validate date is not in the future
-                date_obj = datetime.strptime(date, '%Y-%m-%d').date()
-                if date_obj > datetime.now().date():
-                    return jsonify({'error': 'Cannot set income for future dates'}), 400
-                
-                conn.execute(
-                    'UPDATE income SET amount = ?, source = ?, date = ? WHERE id = ?',
-                    (amount, source, date, income_id)
-                )
-                conn.commit()
-                return jsonify({'success': True, 'message': 'Income updated'})
+            # Validate date is not in the future
+            date_obj = datetime.strptime(date, '%Y-%m-%d').date()
+            if date_obj > datetime.now().date():
+                return jsonify({'error': 'Cannot set income for future dates'}), 400
             
-            elif request.method == 'DELETE':
-                conn.execute('DELETE FROM income WHERE id = ?', (income_id,))
-                conn.commit()
-                return jsonify({'success': True, 'message': 'Income deleted'})
+            if not repos.income.update(user_id, income_id, to_paise(amount), source, to_day(date)):
+                return jsonify({'error': 'Income not found or unauthorized'}), 404
+            return jsonify({'success': True, 'message': 'Income updated'})
+        
+        elif request.method == 'DELETE':
+            if not repos.income.delete(user_id, income_id):
+                return jsonify({'error': 'Income not found or unauthorized'}), 404
+            return jsonify({'success': True, 'message': 'Income deleted'})
+    
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+# ==================== RECURRING API ====================
+
+@app.route('/api/recurring', methods=['GET', 'POST'])
+def recurring():
+    """Get or add recurring expense/income rules"""
+    if 'user_id' not in session:
+        return jsonify({'error': 'Unauthorized'}), 401
+    
+    user_id = session['user_id']
+    
+    try:
+        if request.method == 'POST':
+            data = request.json
+            kind = data.get('type', 'expense')
+            rule_id = add_rule(
+                user_id, kind,
+                amount=data.get('amount'),
+                category=data.get('category') if kind == 'expense' else data.get('source'),
+                description=data.get('description', ''),
+                frequency=data.get('frequency', 'monthly'),
+                every=data.get('every', 1),
+                start_date=data.get('start_date'),
+                end_date=data.get('end_date')
+            )
+            return jsonify({'success': True, 'message': 'Recurring entry added', 'id': rule_id})
+        
+        else:  # GET
+            return jsonify(get_rules(user_id))
     
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/recurring/<int:rule_id>', methods=['DELETE'])
+def stop_recurring(rule_id):
+    """Stop a recurring rule; entries it already added are kept"""
+    if 'user_id' not in session:
+        return jsonify({'error': 'Unauthorized'}), 401
+    
+    user_id = session['user_id']
+    
+    try:
+        if not delete_rule(user_id, rule_id):
+            return jsonify({'error': 'Recurring entry not found or unauthorized'}), 404
+        return jsonify({'success': True, 'message': 'Recurring entry stopped'})
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -466,23 +531,12 @@ def habits():
             data = request.json
             habit_name = data.get('name')
             
-            with get_db() as conn:
-                conn.execute(
-                    'INSERT INTO habits (user_id, name, is_custom) VALUES (?, ?, ?)',
-                    (user_id, habit_name, True)
-                )
-                conn.commit()
+            repos.habits.add(user_id, [habit_name])
             
             return jsonify({'success': True, 'message': 'Habit added'})
         
         else:  # GET
-            with get_db() as conn:
-                habits_data = conn.execute(
-                    'SELECT * FROM habits WHERE user_id = ? ORDER BY id',
-                    (user_id,)
-                ).fetchall()
-            
-            return jsonify([dict(h) for h in habits_data])
+            return rows_response(repos.habits.list(user_id))
             
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -507,36 +561,16 @@ def habit_log():
             if date_obj > datetime.now().date():
                 return jsonify({'error': 'Cannot log habits for future dates'}), 400
             
-            # Get detailed tracking fields
-            duration_minutes = data.get('duration_minutes', 0)
-            time_slots = data.get('time_slots', '')
-            topic = data.get('topic', '')
-            tasks = data.get('tasks', '')
-            notes = data.get('notes', '')
-            
-            with get_db() as conn:
-                # Check if log exists
-                existing = conn.execute(
-                    'SELECT * FROM habit_logs WHERE habit_id = ? AND date = ?',
-                    (habit_id, date)
-                ).fetchone()
-                
-                if existing:
-                    # Update with all fields
-                    conn.execute('''
-                        UPDATE habit_logs 
-                        SET completed = ?, duration_minutes = ?, time_slots = ?, topic = ?, tasks = ?, notes = ?
-                        WHERE habit_id = ? AND date = ?
-                    ''', (completed, duration_minutes, time_slots, topic, tasks, notes, habit_id, date))
-                else:
-                    # Insert with all fields
-                    conn.execute('''
-                        INSERT INTO habit_logs 
-                        (habit_id, user_id, date, completed, duration_minutes, time_slots, topic, tasks, notes) 
-                        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-                    ''', (habit_id, user_id, date, completed, duration_minutes, time_slots, topic, tasks, notes))
-                
-                conn.commit()
+            # Insert or update the day's log with all detailed tracking fields
+            repos.habit_logs.save(
+                user_id, habit_id, to_day(date),
+                completed=completed,
+                duration_minutes=data.get('duration_minutes', 0),
+                time_slots=data.get('time_slots', ''),
+                topic=data.get('topic', ''),
+                tasks=data.get('tasks', ''),
+                notes=data.get('notes', '')
+            )
             
             return jsonify({'success': True})
         
@@ -544,31 +578,75 @@ def habit_log():
             date = request.args.get('date', datetime.now().strftime('%Y-%m-%d'))
             month = request.args.get('month')
             
-            with get_db() as conn:
-                if month:
-                    year, month_num = month.split('-')
-                    logs = conn.execute('''
-                        SELECT hl.*, h.name 
-                        FROM habit_logs hl
-                        JOIN habits h ON hl.habit_id = h.id
-                        WHERE hl.user_id = ? AND strftime('%Y', hl.date) = ? AND strftime('%m', hl.date) = ?
-                        ORDER BY hl.date DESC
-                    ''', (user_id, year, month_num)).fetchall()
-                else:
-                    logs = conn.execute('''
-                        SELECT hl.*, h.name 
-                        FROM habit_logs hl
-                        JOIN habits h ON hl.habit_id = h.id
-                        WHERE hl.user_id = ? AND hl.date = ?
-                    ''', (user_id, date)).fetchall()
+            if month:
+                year, month_num = month.split('-')
+                logs = repos.habit_logs.for_range(user_id, *month_days(year, month_num))
+            else:
+                logs = repos.habit_logs.for_day(user_id, to_day(date))
             
-            return jsonify([dict(l) for l in logs])
+            return rows_response(logs)
             
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/habits/heatmap')
+def habit_heatmap():
+    """Minutes per weekday and hour of day from the logged time slots, over the last year by default"""
+    if 'user_id' not in session:
+        return jsonify({'error': 'Unauthorized'}), 401
+    
+    user_id = session['user_id']
+    
+    try:
+        # Inclusive YYYY-MM-DD bounds
+        date_to = request.args.get('to', datetime.now().strftime('%Y-%m-%d'))
+        date_from = request.args.get('from', from_day(to_day(date_to) - 364))
+        habit_id = request.args.get('habit_id', type=int)
+        start_day, end_day = to_day(date_from), to_day(date_to) + 1
+        if start_day >= end_day:
+            return jsonify({'error': "'from' must not be after 'to'"}), 400
+        
+        counts = repos.stats.slot_counts(user_id, start_day, end_day, habit_id)
+        return jsonify({'from': from_day(start_day), 'to': from_day(end_day - 1), 'habit_id': habit_id,
+                        **heatmap(counts)})
+        
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
 # ==================== STREAK API ====================
 
+def current_streak(days, today):
+    """Consecutive completed days (newest first) ending today, or yesterday when today is not logged yet"""
+    streak = 0
+    for day in days:
+        # Only count from today or yesterday
+        if streak == 0 and day < (today - 1):
+            break
+        
+        expected_day = today - streak
+        # Adjustment if user hasn't logged today yet but logged yesterday
+        if streak == 0 and day == (today - 1):
+            expected_day = today - 1
+        
+        if day == expected_day:
+            streak += 1
+        elif day > expected_day:
+            # Skip duplicate entries for same day if any
+            continue
+        else:
+            break
+    return streak
+
+def load_streaks(user_id):
+    """Current streak of every habit (consecutive completed days up to today or yesterday)"""
+    today = to_day(datetime.now().date())
+    return [
+        {'habit_id': habit['id'], 'habit_name': habit['name'], 'current_streak': current_streak(days, today)}
+        for habit, days in repos.stats.completed_days(user_id)
+    ]
+
 @app.route('/api/streaks')
 def streaks():
     """Calculate streaks for habits"""
@@ -578,57 +656,7 @@ def streaks():
     user_id = session['user_id']
     
     try:
-        with get_db() as conn:
-            # Get all habits
-            habits_data = conn.execute(
-                'SELECT * FROM habits WHERE user_id = ?',
-                (user_id,)
-            ).fetchall()
-            
-            streaks_data = []
-            
-            for habit in habits_data:
-                habit_id = habit['id']
-                
-                # Get recent logs ordered by date descending
-                logs = conn.execute('''
-                    SELECT date, completed FROM habit_logs
-                    WHERE habit_id = ? AND completed = 1
-                    ORDER BY date DESC
-                ''', (habit_id,)).fetchall()
-                
-                # Calculate current streak
-                current_streak = 0
-                today = datetime.now().date()
-                
-                if logs:
-                    for log in logs:
-                        log_date = datetime.strptime(log['date'], '%Y-%m-%d').date()
-                        
-                        # Only count from today or yesterday
-                        if current_streak == 0 and log_date < (today - timedelta(days=1)):
-                            break
-                            
-                        expected_date = today - timedelta(days=current_streak)
-                        # Adjustment if user hasn't logged today yet but logged yesterday
-                        if current_streak == 0 and log_date == (today - timedelta(days=1)):
-                            expected_date = today - timedelta(days=1)
-                        
-                        if log_date == expected_date:
-                            current_streak += 1
-                        elif log_date > expected_date:
-                            # Skip duplicate entries for same day if any
-                            continue
-                        else:
-                            break
-                
-                streaks_data.append({
-                    'habit_id': habit_id,
-                    'habit_name': habit['name'],
-                    'current_streak': current_streak
-                })
-        
-        return jsonify(streaks_data)
+        return jsonify(load_streaks(user_id))
         
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -644,28 +672,16 @@ def calendar_data(year, month):
     user_id = session['user_id']
     
     try:
-        with get_db() as conn:
-            # Get daily expense totals
-            daily_expenses = conn.execute('''
-                SELECT date, SUM(amount) as total
-                FROM expenses
-                WHERE user_id = ? AND strftime('%Y', date) = ? AND strftime('%m', date) = ?
-                GROUP BY date
-            ''', (user_id, year, month)).fetchall()
-            
-            # Get habit completion counts per day
-            daily_habits = conn.execute('''
-                SELECT date, COUNT(*) as completed_count
-                FROM habit_logs
-                WHERE user_id = ? AND completed = 1 
-                AND strftime('%Y', date) = ? AND strftime('%m', date) = ?
-                GROUP BY date
-            ''', (user_id, year, month)).fetchall()
+        start_day, end_day = month_days(year, month)
+        repos.materialize(user_id, end_day)
+        
+        # Daily expense totals and habit completion counts per day
+        daily_expenses, daily_habits = repos.stats.daily(user_id, start_day, end_day)
         
         # Format data
         calendar_info = {
-            'expenses': {row['date']: row['total'] for row in daily_expenses},
-            'habits': {row['date']: row['completed_count'] for row in daily_habits}
+            'expenses': {from_day(day): from_paise(total) for day, total in daily_expenses.items()},
+            'habits': {from_day(day): count for day, count in daily_habits.items()}
         }
         
         return jsonify(calendar_info)
@@ -684,13 +700,207 @@ def get_insights(year, month):
     user_id = session['user_id']
     
     try:
-        insights = generate_ai_insights(user_id, int(year), int(month))
+        # Usually a cache hit: precompute_insights.py fills the cache ahead of time
+        refresh = request.args.get('refresh') == '1'
+        materialize_recurring(user_id, month_days(year, month)[1])
+        insights = get_or_generate_insights(user_id, int(year), int(month), refresh=refresh)
         return jsonify(insights)
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/analytics/correlations/<year>/<month>')
+def habit_spending_correlations(year, month):
+    """How habits line up with spending over the 90 days ending with the month"""
+    if 'user_id' not in session:
+        return jsonify({'error': 'Unauthorized'}), 401
+    
+    user_id = session['user_id']
+    
+    try:
+        refresh = request.args.get('refresh') == '1'
+        materialize_recurring(user_id, month_days(year, month)[1])
+        return jsonify(get_correlations(user_id, int(year), int(month), refresh=refresh))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+# ==================== BUDGETS API ====================
+
+@app.route('/api/budgets', methods=['GET', 'POST'])
+def budgets():
+    """Get budget status for a month (?month=YYYY-MM) or set a category's monthly limit"""
+    if 'user_id' not in session:
+        return jsonify({'error': 'Unauthorized'}), 401
+    
+    user_id = session['user_id']
+    
+    try:
+        if request.method == 'POST':
+            data = request.json
+            set_budget(user_id, data.get('category'), data.get('limit'))
+            return jsonify({'success': True, 'message': 'Budget saved'})
+        
+        else:  # GET
+            year, month = parse_month(request.args.get('month'))
+            materialize_recurring(user_id, month_days(year, month)[1])
+            return jsonify(budget_status(user_id, year, month))
+    
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/budgets/<category>', methods=['DELETE'])
+def remove_budget(category):
+    """Delete a category's budget"""
+    if 'user_id' not in session:
+        return jsonify({'error': 'Unauthorized'}), 401
+    
+    user_id = session['user_id']
+    
+    try:
+        if not delete_budget(user_id, category):
+            return jsonify({'error': 'Budget not found'}), 404
+        return jsonify({'success': True, 'message': 'Budget deleted'})
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/budgets/alerts', methods=['GET', 'POST'])
+def budget_alerts():
+    """Get unseen threshold alerts (?all=1 for every alert) or mark alerts as seen"""
+    if 'user_id' not in session:
+        return jsonify({'error': 'Unauthorized'}), 401
+    
+    user_id = session['user_id']
+    
+    try:
+        if request.method == 'POST':
+            ids = (request.json or {}).get('ids')
+            changed = mark_alerts_seen(user_id, [int(i) for i in ids] if ids else None)
+            return jsonify({'success': True, 'marked': changed})
+        
+        else:  # GET
+            return jsonify(get_alerts(user_id, unseen_only=request.args.get('all') != '1'))
+    
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+# ==================== SAVINGS GOALS API ====================
+
+@app.route('/api/savings/goals', methods=['GET', 'POST'])
+def savings_goals():
+    """Get every goal with its progress and projected completion, or create a goal"""
+    if 'user_id' not in session:
+        return jsonify({'error': 'Unauthorized'}), 401
+    
+    user_id = session['user_id']
+    
+    try:
+        if request.method == 'POST':
+            data = request.json
+            goal_id = add_goal(user_id, data.get('name'), data.get('target'), data.get('target_date'))
+            return jsonify({'success': True, 'message': 'Goal created', 'id': goal_id})
+        
+        else:  # GET
+            return jsonify(goal_status(user_id))
+    
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/savings/goals/<int:goal_id>', methods=['GET', 'PUT', 'DELETE'])
+def savings_goal(goal_id):
+    """Get a goal with its recent contributions, update it, or delete it with its contributions"""
+    if 'user_id' not in session:
+        return jsonify({'error': 'Unauthorized'}), 401
+    
+    user_id = session['user_id']
+    
+    try:
+        if request.method == 'PUT':
+            data = request.json
+            if not update_goal(user_id, goal_id, data.get('name'), data.get('target'), data.get('target_date')):
+                return jsonify({'error': 'Goal not found'}), 404
+            return jsonify({'success': True, 'message': 'Goal updated'})
+        
+        elif request.method == 'DELETE':
+            if not delete_goal(user_id, goal_id):
+                return jsonify({'error': 'Goal not found'}), 404
+            return jsonify({'success': True, 'message': 'Goal deleted'})
+        
+        else:  # GET
+            goal = get_goal(user_id, goal_id)
+            if goal is None:
+                return jsonify({'error': 'Goal not found'}), 404
+            return jsonify(goal)
+    
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/savings/goals/<int:goal_id>/contributions', methods=['POST'])
+def savings_contribution(goal_id):
+    """Add to a goal's savings (a negative amount is a withdrawal)"""
+    if 'user_id' not in session:
+        return jsonify({'error': 'Unauthorized'}), 401
+    
+    user_id = session['user_id']
+    
+    try:
+        data = request.json
+        if not add_contribution(user_id, goal_id, data.get('amount'), data.get('date')):
+            return jsonify({'error': 'Goal not found'}), 404
+        return jsonify({'success': True, 'message': 'Contribution added'})
+    
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/savings/contributions/<int:contribution_id>', methods=['DELETE'])
+def remove_savings_contribution(contribution_id):
+    """Delete a contribution"""
+    if 'user_id' not in session:
+        return jsonify({'error': 'Unauthorized'}), 401
+    
+    user_id = session['user_id']
+    
+    try:
+        if not delete_contribution(user_id, contribution_id):
+            return jsonify({'error': 'Contribution not found'}), 404
+        return jsonify({'success': True, 'message': 'Contribution deleted'})
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
 # ==================== STATS API ====================
 
+def load_today_stats(user_id, materialize=True):
+    """
+    Today's spending, this month's spending and income, and this month's days with every habit done.
+    With materialize=False it only reads: due recurring entries are left for the next request
+    """
+    today = to_day(datetime.now().date())
+    
+    if materialize:
+        repos.materialize(user_id)
+    
+    start_day, end_day = month_days(datetime.now().year, datetime.now().month)
+    stats = repos.stats.today(user_id, today, start_day, end_day)
+    
+    return {
+        'today_spending': from_paise(stats['day_expenses_paise']),
+        'month_spending': from_paise(stats['expenses_paise']),
+        'month_income': from_paise(stats['income_paise']),
+        'habits_completed_today': stats['all_habits_days']
+    }
+
 @app.route('/api/stats/today')
 def today_stats():
     """Get today's quick stats"""
@@ -698,65 +908,9 @@ def today_stats():
         return jsonify({'error': 'Unauthorized'}), 401
     
     user_id = session['user_id']
-    today = datetime.now().strftime('%Y-%m-%d')
     
     try:
-        with get_db() as conn:
-            # Today's expenses
-            today_expenses = conn.execute(
-                'SELECT SUM(amount) as total FROM expenses WHERE user_id = ? AND date = ?',
-                (user_id, today)
-            ).fetchone()
-            
-            # This month's expenses
-            year = datetime.now().year
-            month = datetime.now().month
-            month_expenses = conn.execute('''
-                SELECT SUM(amount) as total FROM expenses 
-                WHERE user_id = ? AND strftime('%Y', date) = ? AND strftime('%m', date) = ?
-            ''', (user_id, str(year), f'{month:02d}')).fetchone()
-            
-            # This month's income
-            month_income = conn.execute('''
-                SELECT SUM(amount) as total FROM income 
-                WHERE user_id = ? AND strftime('%Y', date) = ? AND strftime('%m', date) = ?
-            ''', (user_id, str(year), f'{month:02d}')).fetchone()
-            
-            # Habits completed - count days where ALL habits were completed
-            # Step 1: Get total number of habits for this user
-            total_habits = conn.execute(
-                'SELECT COUNT(*) as count FROM habits WHERE user_id = ?',
-                (user_id,)
-            ).fetchone()
-            
-            total_habits_count = total_habits['count'] or 0
-            
-            # Step 2: Count days in current month where completed habits = total habits
-            # Only count if user has at least one habit
-            habits_completed_days = 0
-            if total_habits_count > 0:
-                habits_completed_days_result = conn.execute('''
-                    SELECT COUNT(DISTINCT date) as days_count
-                    FROM (
-                        SELECT date, COUNT(*) as completed_count
-                        FROM habit_logs
-                        WHERE user_id = ? 
-                        AND completed = 1
-                        AND strftime('%Y', date) = ?
-                        AND strftime('%m', date) = ?
-                        GROUP BY date
-                        HAVING completed_count = ?
-                    )
-                ''', (user_id, str(year), f'{month:02d}', total_habits_count)).fetchone()
-                
-                habits_completed_days = habits_completed_days_result['days_count'] or 0
-        
-        return jsonify({
-            'today_spending': today_expenses['total'] or 0,
-            'month_spending': month_expenses['total'] or 0,
-            'month_income': month_income['total'] or 0,
-            'habits_completed_today': habits_completed_days
-        })
+        return jsonify(load_today_stats(user_id))
         
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -770,79 +924,26 @@ def all_time_stats():
     user_id = session['user_id']
     
     try:
-        with get_db() as conn:
-            # Total expenses
-            total_expenses = conn.execute(
-                'SELECT SUM(amount) as total FROM expenses WHERE user_id = ?',
-                (user_id,)
-            ).fetchone()
-            
-            # Total income
-            total_income = conn.execute(
-                'SELECT SUM(amount) as total FROM income WHERE user_id = ?',
-                (user_id,)
-            ).fetchone()
-            
-            # Total habit logs
-            total_habit_logs = conn.execute(
-                'SELECT COUNT(*) as count FROM habit_logs WHERE user_id = ? AND completed = 1',
-                (user_id,)
-            ).fetchone()
-            
-            # Account created date
+        repos.materialize(user_id)
+        
+        # Account created date (users live in the directory database)
+        with get_read_db() as conn:
             user_info = conn.execute(
                 'SELECT created_at FROM users WHERE id = ?',
                 (user_id,)
             ).fetchone()
-            
-            # Calculate current streak (max streak across all habits)
-            habits = conn.execute(
-                'SELECT id FROM habits WHERE user_id = ?',
-                (user_id,)
-            ).fetchall()
-            
-            max_streak = 0
-            today = datetime.now().date()
-            
-            for habit in habits:
-                habit_id = habit['id']
-                
-                # Get recent logs ordered by date descending
-                logs = conn.execute('''
-                    SELECT date FROM habit_logs
-                    WHERE habit_id = ? AND completed = 1
-                    ORDER BY date DESC
-                ''', (habit_id,)).fetchall()
-                
-                # Calculate current streak
-                current_streak = 0
-                
-                if logs:
-                    for log in logs:
-                        log_date = datetime.strptime(log['date'], '%Y-%m-%d').date()
-                        
-                        # Only count from today or yesterday
-                        if current_streak == 0 and log_date < (today - timedelta(days=1)):
-                            break
-                            
-                        expected_date = today - timedelta(days=current_streak)
-                        # Adjustment if user hasn't logged today yet but logged yesterday
-                        if current_streak == 0 and log_date == (today - timedelta(days=1)):
-                            expected_date = today - timedelta(days=1)
-                        
-                        if log_date == expected_date:
-                            current_streak += 1
-                        elif log_date > expected_date:
-                            continue
-                        else:
-                            break
-                
-                max_streak = max(max_streak, current_streak)
+        
+        # Totals cover the hot tables plus every yearly archive
+        totals = repos.stats.totals(user_id)
+        
+        # Current streak is the best one across all habits
+        today = to_day(datetime.now().date())
+        max_streak = max([current_streak(days, today) for _, days in repos.stats.completed_days(user_id)], default=0)
         
         return jsonify({
-            'total_expenses': total_expenses['total'] or 0,
-            'total_income': total_income['total'] or 0,
-            'total_habit_logs': total_habit_logs['count'] or 0,
+            'total_expenses': from_paise(totals['expenses_paise']),
+            'total_income': from_paise(totals['income_paise']),
+            'total_habit_logs': totals['completed_logs'],
             'current_streak': max_streak,
             'account_created': user_info['created_at'] if user_info else None
         })
@@ -850,6 +951,30 @@ def all_time_stats():
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/stats/series')
+def stats_series():
+    """Spending, income and completed habits per day, week, month or year (default: the last 12 months)"""
+    if 'user_id' not in session:
+        return jsonify({'error': 'Unauthorized'}), 401
+    
+    user_id = session['user_id']
+    
+    try:
+        # Inclusive YYYY-MM-DD bounds; category filters spending, habit_id filters habit completions
+        start_day, end_day, granularity = parse_range(request.args.get('from'), request.args.get('to'),
+                                                      request.args.get('granularity'))
+        category = request.args.get('category') or None
+        habit_id = request.args.get('habit_id', type=int)
+        
+        repos.materialize(user_id, end_day)
+        totals = repos.stats.series(user_id, start_day, end_day, granularity, category, habit_id)
+        return jsonify({**series(totals, start_day, end_day, granularity), 'category': category, 'habit_id': habit_id})
+        
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
 @app.route('/api/expenses/all')
 def all_expenses():
     """Get all expenses for data export"""
@@ -859,13 +984,8 @@ def all_expenses():
     user_id = session['user_id']
     
     try:
-        with get_db() as conn:
-            expenses_data = conn.execute(
-                'SELECT * FROM expenses WHERE user_id = ? ORDER BY date DESC',
-                (user_id,)
-            ).fetchall()
-        
-        return jsonify([dict(e) for e in expenses_data])
+        repos.materialize(user_id)
+        return rows_response(repos.expenses.all(user_id))
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -878,13 +998,8 @@ def all_income():
     user_id = session['user_id']
     
     try:
-        with get_db() as conn:
-            income_data = conn.execute(
-                'SELECT * FROM income WHERE user_id = ? ORDER BY date DESC',
-                (user_id,)
-            ).fetchall()
-        
-        return jsonify([dict(i) for i in income_data])
+        repos.materialize(user_id)
+        return rows_response(repos.income.all(user_id))
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -897,19 +1012,183 @@ def all_habit_logs():
     user_id = session['user_id']
     
     try:
-        with get_db() as conn:
-            logs = conn.execute('''
-                SELECT hl.*, h.name 
-                FROM habit_logs hl
-                JOIN habits h ON hl.habit_id = h.id
-                WHERE hl.user_id = ?
-                ORDER BY hl.date DESC
-            ''', (user_id,)).fetchall()
+        return rows_response(repos.habit_logs.all(user_id))
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/import', methods=['POST'])
+def import_transactions():
+    """Import a CSV or OFX bank statement into expenses and income"""
+    if 'user_id' not in session:
+        return jsonify({'error': 'Unauthorized'}), 401
+    
+    user_id = session['user_id']
+    
+    try:
+        upload = request.files.get('file')
+        if not upload:
+            return jsonify({'error': 'Statement file is required'}), 400
+        
+        fmt = request.form.get('format') or ('ofx' if upload.filename.lower().endswith(('.ofx', '.qfx')) else 'csv')
+        mapping = json.loads(request.form.get('mapping') or '{}')
+        
+        # Read the upload as a text stream so rows are parsed as they arrive
+        stream = io.TextIOWrapper(upload.stream, encoding='utf-8-sig', errors='replace', newline='')
+        report = import_statement(
+            user_id, stream, fmt,
+            mapping=mapping,
+            date_format=request.form.get('date_format'),
+            kind=request.form.get('kind', 'auto')
+        )
+        return jsonify({'success': True, **report})
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/search')
+def search():
+    """Full-text search across expenses, income and habit logs"""
+    if 'user_id' not in session:
+        return jsonify({'error': 'Unauthorized'}), 401
+    
+    user_id = session['user_id']
+    
+    try:
+        query = request.args.get('q', '').strip()
+        if not query:
+            return jsonify({'error': 'Search query is required'}), 400
         
-        return jsonify([dict(l) for l in logs])
+        results = search_entries(
+            user_id, query,
+            kind=request.args.get('type'),
+            category=request.args.get('category'),
+            date_from=request.args.get('from'),
+            date_to=request.args.get('to'),
+            page=request.args.get('page', 1, type=int),
+            per_page=request.args.get('per_page', 20, type=int)
+        )
+        return jsonify(results)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+# ==================== SYNC API ====================
+
+@app.route('/api/sync')
+def sync_changes():
+    """Expenses, income, habits and habit logs changed since ?cursor= (all of them without one)"""
+    if 'user_id' not in session:
+        return jsonify({'error': 'Unauthorized'}), 401
+    
+    user_id = session['user_id']
+    
+    try:
+        materialize_recurring(user_id)
+        return json_response(get_changes(
+            user_id,
+            cursor=request.args.get('cursor'),
+            limit=request.args.get('limit', SYNC_PAGE_SIZE, type=int)
+        ))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+# ==================== REPORTS API ====================
+
+@app.route('/api/reports', methods=['POST'])
+def create_report():
+    """Start rendering the PDF report of the user's current data, or point at the cached one"""
+    if 'user_id' not in session:
+        return jsonify({'error': 'Unauthorized'}), 401
+    
+    user_id = session['user_id']
+    
+    try:
+        materialize_recurring(user_id)
+        report = request_report(user_id)
+        return jsonify(report), 200 if report['status'] == 'ready' else 202
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/reports/<version>')
+def download_report(version):
+    """A rendered report; supports Range and conditional requests"""
+    if 'user_id' not in session:
+        return jsonify({'error': 'Unauthorized'}), 401
+    
+    user_id = session['user_id']
+    
+    try:
+        path = report_file(user_id, version)
+        if path is None:
+            return jsonify({'error': 'Report not found'}), 404
+        
+        return send_file(
+            path,
+            mimetype='application/pdf',
+            as_attachment=True,
+            download_name=f"finhabits-report-{datetime.now().strftime('%Y-%m-%d')}.pdf",
+            conditional=True,
+            etag=version
+        )
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+# ==================== LIVE UPDATES API ====================
+
+def live_snapshot(user_id, streaks=True):
+    """Stats sent to live streams, with streaks keyed by habit id; read-only, as the broker's poller calls it"""
+    stats = load_today_stats(user_id, materialize=False)
+    if streaks:
+        stats['streaks'] = {streak['habit_id']: streak for streak in load_streaks(user_id)}
+    return stats
+
+live_broker = LiveBroker(live_snapshot)
+
+def subscribe_live(user_id, deliver):
+    """Write the user's due recurring entries on the request path, then subscribe the stream"""
+    repos.materialize(user_id)
+    return live_broker.subscribe(user_id, deliver)
+
+@app.route('/api/live')
+def live_updates():
+    """
+    Server-Sent Events stream of the user's stats: all of them first, then only what changes.
+    Each open stream holds one WSGI worker thread for as long as the page is open, so a gthread
+    worker with 16 threads serves at most 16 dashboards and nothing else; asgi.py serves this
+    route without a thread per stream
+    """
+    if 'user_id' not in session:
+        return jsonify({'error': 'Unauthorized'}), 401
+    
+    user_id = session['user_id']
+    messages = queue.Queue()
+    
+    try:
+        unsubscribe = subscribe_live(user_id, lambda event, data: messages.put((event, data)))
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+    
+    def stream():
+        try:
+            while True:
+                try:
+                    event, data = messages.get(timeout=LIVE_HEARTBEAT_SECONDS)
+                except queue.Empty:
+                    yield ': keep-alive\n\n'
+                    continue
+                yield format_event(event, data)
+        finally:
+            unsubscribe()
+    
+    return Response(stream(), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
 if __name__ == '__main__':
     print("✨ FinHabits is running at http://localhost:5000")
     print("📊 Track your habits and spending wisely!")
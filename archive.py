@@ -0,0 +1,203 @@
+"""
+Archive closed years into per-year database files
+Moves expenses, income and habit logs dated before the cutoff year out of the hot tables of
+every shard into finhabits_archive<YEAR>.db, so the working set stays small and cached.
+Exports, search and all-time stats keep including archived entries; archived entries can no
+longer be edited or deleted, and the calendar, monthly views and budget status only show hot data.
+
+    python archive.py                  # archive everything before last year
+    python archive.py --before 2024    # archive 2023 and earlier
+    python archive.py --list           # show the archive files and their row counts
+
+Each year is copied and deleted from the hot tables in one write transaction, so an entry
+edited meanwhile is either archived in its new state or waits for the next run. In WAL mode
+a commit is atomic per file only: a crash mid-commit can leave a year copied but not deleted,
+and an interrupted run can simply be started again.
+"""
+import argparse
+import os
+import sqlite3
+import time
+from datetime import date
+
+from database import (init_db, all_shards, get_shard_connection, archive_path, archive_years, to_day,
+                      CATEGORY_NAME, SEARCH_INDEX_MODULE)
+
+# table -> (archive columns, the same values selected from the hot table)
+ARCHIVE_COLUMNS = {
+    'expenses': (
+        'id, user_id, amount_paise, category, description, day, created_at',
+        f"id, user_id, amount_paise, {CATEGORY_NAME.format('expenses.category_id')}, description, day, created_at"
+    ),
+    'income': (
+        'id, user_id, amount_paise, source, day, created_at',
+        f"id, user_id, amount_paise, {CATEGORY_NAME.format('income.source_id')}, day, created_at"
+    ),
+    'habit_logs': (
+        'id, habit_id, user_id, day, completed, duration_minutes, time_slots, topic, tasks, notes, created_at, habit_name',
+        'id, habit_id, user_id, day, completed, duration_minutes, time_slots, topic, tasks, notes, created_at, '
+        '(SELECT name FROM habits WHERE habits.id = habit_logs.habit_id)'
+    )
+}
+
+# Search entries for archived rows, like database.SEARCH_SOURCES but keyed by the archive rowid
+# (ids from different shards can collide) and tagged with names instead of ids
+ARCHIVE_SEARCH = {
+    'expenses': ('expense', 0, "'expense ' || COALESCE(a.category, '')",
+                 "COALESCE(a.category, '') || ' ' || COALESCE(a.description, '')"),
+    'income': ('income', 1, "'income ' || COALESCE(a.source, '')", "COALESCE(a.source, '')"),
+    'habit_logs': ('habit', 2, "'habit ' || COALESCE(a.habit_name, '')",
+                   "COALESCE(a.habit_name, '') || ' ' || COALESCE(a.topic, '') || ' ' || "
+                   "COALESCE(a.tasks, '') || ' ' || COALESCE(a.notes, '')")
+}
+
+ARCHIVE_SCHEMA = (
+    '''CREATE TABLE IF NOT EXISTS arc.expenses (
+        id INTEGER NOT NULL, user_id INTEGER NOT NULL, amount_paise INTEGER NOT NULL,
+        category TEXT, description TEXT, day INTEGER NOT NULL, created_at TIMESTAMP
+    )''',
+    '''CREATE TABLE IF NOT EXISTS arc.income (
+        id INTEGER NOT NULL, user_id INTEGER NOT NULL, amount_paise INTEGER NOT NULL,
+        source TEXT, day INTEGER NOT NULL, created_at TIMESTAMP
+    )''',
+    '''CREATE TABLE IF NOT EXISTS arc.habit_logs (
+        id INTEGER NOT NULL, habit_id INTEGER, user_id INTEGER NOT NULL, day INTEGER NOT NULL,
+        completed BOOLEAN, duration_minutes INTEGER, time_slots TEXT, topic TEXT, tasks TEXT,
+        notes TEXT, created_at TIMESTAMP, habit_name TEXT
+    )''',
+    'CREATE INDEX IF NOT EXISTS arc.idx_expenses_user_day ON expenses (user_id, day, amount_paise)',
+    'CREATE INDEX IF NOT EXISTS arc.idx_expenses_user_id ON expenses (user_id, id)',
+    'CREATE INDEX IF NOT EXISTS arc.idx_income_user_day ON income (user_id, day, amount_paise)',
+    'CREATE INDEX IF NOT EXISTS arc.idx_income_user_id ON income (user_id, id)',
+    'CREATE INDEX IF NOT EXISTS arc.idx_habit_logs_user_day ON habit_logs (user_id, day, completed)',
+    'CREATE INDEX IF NOT EXISTS arc.idx_habit_logs_user_id ON habit_logs (user_id, id)',
+    f'CREATE VIRTUAL TABLE IF NOT EXISTS arc.search_index USING {SEARCH_INDEX_MODULE}'
+)
+
+
+def year_days(year):
+    """[start, end) day numbers covering a calendar year"""
+    return to_day(date(year, 1, 1)), to_day(date(year + 1, 1, 1))
+
+
+def hot_years(conn, before):
+    """Years before the cutoff that still have rows in conn's hot tables"""
+    rows = conn.execute(f'''
+        SELECT DISTINCT CAST(strftime('%Y', day * 86400, 'unixepoch') AS INTEGER) FROM (
+            {' UNION '.join(f'SELECT DISTINCT day FROM {table} WHERE day < ?' for table in ARCHIVE_COLUMNS)}
+        )
+    ''', (to_day(date(before, 1, 1)),) * len(ARCHIVE_COLUMNS)).fetchall()
+    return sorted(row[0] for row in rows)
+
+
+def mark_archived(conn, user_id):
+    """
+    Make the user's sync clients start over: their local copies still hold the archived entries.
+    A marker entry moves the user's change_log to a new seq, and cursors from before it reset
+    """
+    seq = conn.execute(
+        "INSERT OR REPLACE INTO main.change_log (user_id, tbl, row_id) VALUES (?, 'archive', ?)", (user_id, user_id)
+    ).lastrowid
+    conn.execute('INSERT OR REPLACE INTO main.sync_resets (user_id, seq) VALUES (?, ?)', (user_id, seq))
+
+
+def archive_year(conn, year):
+    """Move one year's rows from conn's hot tables into the year's archive file; returns rows moved per table"""
+    start, end = year_days(year)
+    conn.execute('ATTACH DATABASE ? AS arc', (archive_path(year),))
+    try:
+        for statement in ARCHIVE_SCHEMA:
+            conn.execute(statement)
+
+        # Copy and delete under one write lock, so no edit lands between the two
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            for table, (columns, values) in ARCHIVE_COLUMNS.items():
+                kind, offset, tags, body = ARCHIVE_SEARCH[table]
+                # Copies left by an interrupted earlier run may predate an edit: replace them
+                stale = f'''
+                    SELECT a.rowid FROM arc.{table} a JOIN main.{table} h
+                        ON h.user_id = a.user_id AND h.id = a.id AND h.day = a.day
+                    WHERE h.day >= ? AND h.day < ?
+                '''
+                conn.execute(f'DELETE FROM arc.search_index WHERE rowid IN (SELECT rowid * 4 + {offset} FROM ({stale}))',
+                             (start, end))
+                conn.execute(f'DELETE FROM arc.{table} WHERE rowid IN ({stale})', (start, end))
+                last_rowid = conn.execute(f'SELECT COALESCE(MAX(rowid), 0) FROM arc.{table}').fetchone()[0]
+                conn.execute(f'''
+                    INSERT INTO arc.{table} ({columns})
+                    SELECT {values} FROM main.{table} WHERE day >= ? AND day < ?
+                ''', (start, end))
+                conn.execute(f'''
+                    INSERT INTO arc.search_index (rowid, owner, tags, body, kind, ref_id, day)
+                    SELECT a.rowid * 4 + {offset}, 'u' || a.user_id, {tags}, {body}, '{kind}', a.rowid, a.day
+                    FROM arc.{table} a WHERE a.rowid > ?
+                ''', (last_rowid,))
+
+            # The hot search triggers drop the matching index entries. A move is not a deletion, so the
+            # tombstones the sync triggers write for it are dropped too (sync.py skips archives)
+            last_seq = conn.execute('SELECT COALESCE(MAX(seq), 0) FROM main.change_log').fetchone()[0]
+            user_ids = {row[0] for table in ARCHIVE_COLUMNS for row in conn.execute(
+                f'SELECT DISTINCT user_id FROM main.{table} WHERE day >= ? AND day < ?', (start, end))}
+            moved = {table: conn.execute(f'DELETE FROM main.{table} WHERE day >= ? AND day < ?', (start, end)).rowcount
+                     for table in ARCHIVE_COLUMNS}
+            conn.execute('DELETE FROM main.change_log WHERE seq > ?', (last_seq,))
+            for user_id in user_ids:
+                mark_archived(conn, user_id)
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+    finally:
+        conn.execute('DETACH DATABASE arc')
+    return moved
+
+
+def archive(before):
+    init_db()
+    print(f"🗄️  Archiving entries dated before {before}")
+    started = time.monotonic()
+    total = 0
+    for shard in all_shards():
+        conn = get_shard_connection(shard)
+        try:
+            for year in hot_years(conn, before):
+                moved = archive_year(conn, year)
+                total += sum(moved.values())
+                detail = ', '.join(f'{count} {table}' for table, count in moved.items())
+                print(f"   ✅ {shard} {year}: {detail}")
+        finally:
+            conn.close()
+    print(f"\n✅ Archived {total} entries in {time.monotonic() - started:.1f}s")
+
+
+def list_archives():
+    years = archive_years()
+    if not years:
+        print("No archive files yet")
+        return
+    for year in years:
+        path = archive_path(year)
+        conn = sqlite3.connect(f'file:{path}?mode=ro', uri=True)
+        try:
+            counts = ', '.join(f'{conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]} {table}'
+                               for table in ARCHIVE_COLUMNS)
+        finally:
+            conn.close()
+        print(f"   {year}: {path} ({os.path.getsize(path) // 1024} KiB) - {counts}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Move closed years into yearly archive databases')
+    parser.add_argument('--before', type=int, default=date.today().year - 1,
+                        help='archive entries dated before this year (default: last year)')
+    parser.add_argument('--list', action='store_true', help='list the archive files and exit')
+    args = parser.parse_args()
+    if args.list:
+        list_archives()
+    else:
+        archive(args.before)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,179 @@
+"""
+Async serving mode (ASGI)
+The chatbot is a native async handler: its SQLite reads run on a small bounded thread
+pool and the Gemini call awaits the async client, so one process can keep hundreds of
+slow chatbot requests in flight. The live stats stream (/api/live) is async too, so an
+open dashboard costs a queue rather than a thread. Every other route is the regular
+Flask app, run through a2wsgi on its own bounded thread pool, so CRUD requests never
+queue behind AI calls.
+
+    uvicorn asgi:app --port 5000
+    gunicorn asgi:app -k uvicorn.workers.UvicornWorker -w 2
+"""
+import asyncio
+import json
+import os
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from http.cookies import SimpleCookie
+
+from a2wsgi import WSGIMiddleware
+from itsdangerous import BadSignature
+
+from app import (app as flask_app, load_chatbot_context, chatbot_fallback, subscribe_live, GEMINI_API_KEY,
+                 AI_NOT_CONFIGURED)
+from live import format_event, LIVE_HEARTBEAT_SECONDS
+import ai_gateway
+
+DB_THREADS = int(os.getenv('ASGI_DB_THREADS', '8'))        # SQLite work of the async handlers
+WSGI_THREADS = int(os.getenv('ASGI_WSGI_THREADS', '32'))   # Flask requests handled at once
+MAX_BODY_BYTES = 64 * 1024
+
+db_executor = ThreadPoolExecutor(max_workers=DB_THREADS, thread_name_prefix='asgi-db')
+wsgi_app = WSGIMiddleware(flask_app, workers=WSGI_THREADS)
+
+
+def session_user_id(scope):
+    """user_id from the Flask session cookie, read the same way Flask's cookie session does"""
+    cookies = SimpleCookie()
+    for name, value in scope['headers']:
+        if name == b'cookie':
+            cookies.load(value.decode('latin-1'))
+    morsel = cookies.get(flask_app.config['SESSION_COOKIE_NAME'])
+    serializer = flask_app.session_interface.get_signing_serializer(flask_app)
+    if morsel is None or serializer is None:
+        return None
+    try:
+        max_age = int(flask_app.permanent_session_lifetime.total_seconds())
+        return serializer.loads(morsel.value, max_age=max_age).get('user_id')
+    except BadSignature:
+        return None
+
+
+async def read_json(receive):
+    """Request body parsed as JSON; ValueError if it is too large or not JSON"""
+    body = b''
+    while True:
+        message = await receive()
+        body += message.get('body', b'')
+        if len(body) > MAX_BODY_BYTES:
+            raise ValueError('Request body too large')
+        if not message.get('more_body'):
+            break
+    return json.loads(body or b'{}')
+
+
+async def send_json(send, payload, status=200):
+    body = json.dumps(payload).encode()
+    await send({
+        'type': 'http.response.start',
+        'status': status,
+        'headers': [(b'content-type', b'application/json'), (b'content-length', str(len(body)).encode())]
+    })
+    await send({'type': 'http.response.body', 'body': body})
+
+
+async def chatbot(scope, receive, send):
+    """Async twin of app.chatbot: same checks, context and fallback, awaiting the model"""
+    user_id = session_user_id(scope)
+    if user_id is None:
+        return await send_json(send, {'error': 'Unauthorized'}, 401)
+
+    try:
+        data = await read_json(receive)
+    except ValueError:
+        return await send_json(send, {'error': 'Invalid request body'}, 400)
+    user_message = str(data.get('message', '')).strip()
+
+    if not user_message:
+        return await send_json(send, {'error': 'Message is required'}, 400)
+
+    if not GEMINI_API_KEY:
+        return await send_json(send, {'response': AI_NOT_CONFIGURED, 'is_relevant': False})
+
+    try:
+        loop = asyncio.get_running_loop()
+        context, totals = await loop.run_in_executor(db_executor, load_chatbot_context, user_id, user_message)
+
+        try:
+            response = await ai_gateway.generate_content_async(context, purpose='chatbot')
+        except ai_gateway.AIUnavailable as e:
+            print(f"Chatbot falling back: {e}")
+            return await send_json(send, {'response': chatbot_fallback(totals), 'is_relevant': False})
+
+        return await send_json(send, {'response': response.text, 'is_relevant': True})
+
+    except Exception as e:
+        print(f"Chatbot error: {e}")
+        traceback.print_exc()
+        return await send_json(send, {
+            'response': f"I apologize, but I encountered an error: {e}",
+            'is_relevant': False
+        }, 500)
+
+
+async def wait_disconnect(receive):
+    while (await receive())['type'] != 'http.disconnect':
+        pass
+
+
+async def live_updates(scope, receive, send):
+    """Async twin of app.live_updates: an idle stream holds no thread, only a queue"""
+    user_id = session_user_id(scope)
+    if user_id is None:
+        return await send_json(send, {'error': 'Unauthorized'}, 401)
+
+    loop = asyncio.get_running_loop()
+    messages = asyncio.Queue()
+
+    def deliver(event, data):
+        loop.call_soon_threadsafe(messages.put_nowait, (event, data))
+
+    unsubscribe = await loop.run_in_executor(db_executor, subscribe_live, user_id, deliver)
+    try:
+        await send({
+            'type': 'http.response.start',
+            'status': 200,
+            'headers': [(b'content-type', b'text/event-stream; charset=utf-8'), (b'cache-control', b'no-cache'),
+                        (b'x-accel-buffering', b'no')]
+        })
+        disconnected = asyncio.ensure_future(wait_disconnect(receive))
+        while True:
+            message = asyncio.ensure_future(messages.get())
+            done, _ = await asyncio.wait({message, disconnected}, timeout=LIVE_HEARTBEAT_SECONDS,
+                                         return_when=asyncio.FIRST_COMPLETED)
+            if message not in done:
+                message.cancel()
+            if disconnected in done:
+                return
+            chunk = format_event(*message.result()) if message in done else ': keep-alive\n\n'
+            await send({'type': 'http.response.body', 'body': chunk.encode(), 'more_body': True})
+    finally:
+        unsubscribe()
+
+
+# (method, path) -> async handler; everything else goes to Flask
+ASYNC_ROUTES = {
+    ('POST', '/api/chatbot'): chatbot,
+    ('GET', '/api/live'): live_updates
+}
+
+
+async def lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            db_executor.shutdown(wait=True)
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+
+async def app(scope, receive, send):
+    if scope['type'] == 'lifespan':
+        return await lifespan(receive, send)
+    handler = ASYNC_ROUTES.get((scope.get('method'), scope.get('path')))
+    if scope['type'] == 'http' and handler:
+        return await handler(scope, receive, send)
+    return await wsgi_app(scope, receive, send)
@@ -0,0 +1,176 @@
+"""
+Monthly category budgets and threshold alerts
+Spend per category and month lives in category_spend, which the expense triggers in
+database.py update in the same transaction as every insert, update and delete, so
+budget status is a lookup per category rather than a scan of the month's expenses.
+
+    python budgets.py rebuild      # recount the spend counters from the expenses tables
+"""
+import sys
+from datetime import date
+from database import (get_db, get_read_db, get_shard_connection, all_shards, init_db, get_category_id,
+                      rebuild_category_spend, budget_alert_sql, to_paise, from_paise, BUDGET_THRESHOLDS)
+
+
+def month_key(year, month):
+    """category_spend month key, e.g. 2025, 3 -> 202503"""
+    year, month = int(year), int(month)
+    if not 1 <= month <= 12:
+        raise ValueError('Month must be between 1 and 12')
+    return year * 100 + month
+
+
+def parse_month(value):
+    """'YYYY-MM' (default: the current month) -> (year, month)"""
+    if not value:
+        today = date.today()
+        return today.year, today.month
+    try:
+        year, month = value.split('-')
+        month_key(year, month)
+        return int(year), int(month)
+    except ValueError:
+        raise ValueError('Month must be in YYYY-MM format')
+
+
+def _status(percent):
+    if percent >= 100:
+        return 'over'
+    if percent >= BUDGET_THRESHOLDS[0]:
+        return 'warning'
+    return 'ok'
+
+
+def _alert(row):
+    return {
+        'id': row['id'],
+        'category': row['category'],
+        'month': f"{row['month'] // 100}-{row['month'] % 100:02d}",
+        'threshold': row['threshold'],
+        'spent': from_paise(row['spent_paise']),
+        'limit': from_paise(row['limit_paise']),
+        'seen': bool(row['seen']),
+        'created_at': row['created_at']
+    }
+
+
+def budget_status(user_id, year, month):
+    """Every budget with the month's spend, plus the month's total spend and alerts"""
+    key = month_key(year, month)
+    with get_read_db(user_id) as conn:
+        rows = conn.execute('''
+            SELECT c.name AS category, b.limit_paise, COALESCE(s.spent_paise, 0) AS spent_paise
+            FROM budgets b
+            JOIN categories c ON c.id = b.category_id
+            LEFT JOIN category_spend s ON s.user_id = b.user_id AND s.category_id = b.category_id AND s.month = ?
+            WHERE b.user_id = ?
+            ORDER BY c.name
+        ''', (key, user_id)).fetchall()
+        total = conn.execute(
+            'SELECT SUM(spent_paise) FROM category_spend WHERE user_id = ? AND month = ?', (user_id, key)
+        ).fetchone()[0]
+        alerts = conn.execute('''
+            SELECT a.*, c.name AS category FROM budget_alerts a
+            JOIN categories c ON c.id = a.category_id
+            WHERE a.user_id = ? AND a.month = ?
+            ORDER BY a.created_at, a.id
+        ''', (user_id, key)).fetchall()
+
+    budgets = []
+    for row in rows:
+        percent = round(row['spent_paise'] * 100 / row['limit_paise'], 1)
+        budgets.append({
+            'category': row['category'],
+            'limit': from_paise(row['limit_paise']),
+            'spent': from_paise(row['spent_paise']),
+            'remaining': from_paise(row['limit_paise'] - row['spent_paise']),
+            'percent': percent,
+            'status': _status(percent)
+        })
+    return {
+        'month': f'{year}-{month:02d}',
+        'budgets': budgets,
+        'total_spent': from_paise(total),
+        'alerts': [_alert(row) for row in alerts]
+    }
+
+
+def set_budget(user_id, category, limit):
+    """Create or change a category's monthly limit; alerts for the current month are re-evaluated"""
+    limit_paise = to_paise(limit)
+    if limit_paise <= 0:
+        raise ValueError('Budget limit must be greater than zero')
+    today = date.today()
+    with get_db(user_id) as conn:
+        category_id = get_category_id(conn, user_id, 'expense', category)
+        conn.execute('''
+            INSERT INTO budgets (user_id, category_id, limit_paise) VALUES (?, ?, ?)
+            ON CONFLICT (user_id, category_id) DO UPDATE SET limit_paise = excluded.limit_paise
+        ''', (user_id, category_id, limit_paise))
+        params = {'user_id': user_id, 'category_id': category_id, 'month': month_key(today.year, today.month)}
+        for statement in budget_alert_sql(':user_id', ':category_id', ':month'):
+            conn.execute(statement, params)
+        conn.commit()
+
+
+def delete_budget(user_id, category):
+    """Remove a category's budget and its alerts; returns False if it had none"""
+    with get_db(user_id) as conn:
+        deleted = conn.execute('''
+            DELETE FROM budgets WHERE user_id = ? AND category_id = (
+                SELECT id FROM categories WHERE user_id = ? AND kind = 'expense' AND name = ?
+            )
+        ''', (user_id, user_id, category)).rowcount
+        conn.execute('''
+            DELETE FROM budget_alerts WHERE user_id = ? AND category_id NOT IN (
+                SELECT category_id FROM budgets WHERE user_id = ?
+            )
+        ''', (user_id, user_id))
+        conn.commit()
+    return deleted > 0
+
+
+def get_alerts(user_id, unseen_only=True):
+    """Threshold crossings, newest first"""
+    with get_read_db(user_id) as conn:
+        rows = conn.execute(f'''
+            SELECT a.*, c.name AS category FROM budget_alerts a
+            JOIN categories c ON c.id = a.category_id
+            WHERE a.user_id = ? {'AND a.seen = 0' if unseen_only else ''}
+            ORDER BY a.created_at DESC, a.id DESC
+        ''', (user_id,)).fetchall()
+    return [_alert(row) for row in rows]
+
+
+def mark_alerts_seen(user_id, ids=None):
+    """Mark the given alerts (default: all of them) as seen; returns how many changed"""
+    with get_db(user_id) as conn:
+        if ids:
+            placeholders = ','.join('?' * len(ids))
+            changed = conn.execute(
+                f'UPDATE budget_alerts SET seen = 1 WHERE user_id = ? AND seen = 0 AND id IN ({placeholders})',
+                (user_id, *ids)
+            ).rowcount
+        else:
+            changed = conn.execute(
+                'UPDATE budget_alerts SET seen = 1 WHERE user_id = ? AND seen = 0', (user_id,)
+            ).rowcount
+        conn.commit()
+    return changed
+
+
+if __name__ == '__main__':
+    if sys.argv[1:] != ['rebuild']:
+        print("Usage: python budgets.py rebuild")
+        sys.exit(1)
+
+    init_db()
+    count = 0
+    for shard in all_shards():
+        conn = get_shard_connection(shard)
+        try:
+            count += rebuild_category_spend(conn)
+            conn.commit()
+        finally:
+            conn.close()
+    print(f"✅ Rebuilt {count} category spend counters")
@@ -0,0 +1,202 @@
+"""
+Habit vs spending correlations
+Lines a user's days up as arrays (spending per category, habit completion, minutes spent)
+and computes correlations, lagged effects and day-of-week profiles in one NumPy pass.
+Results are cached per month in correlation_cache and feed the insights prompt.
+"""
+import json
+from datetime import date, timedelta
+
+import numpy as np
+
+from database import get_db, get_read_db, month_days, from_day, to_day
+
+# Days of history ending with the month that each analysis looks at
+WINDOW_DAYS = 90
+# Spending up to this many days after a habit day is compared too
+MAX_LAG = 3
+# A habit needs at least this many done and this many skipped days to be compared
+MIN_DAYS = 5
+MIN_CORRELATION = 0.3
+MAX_FINDINGS = 10
+WEEKDAYS = ['Mon', 'Tue', 'Wed', 'Thu', 'Fri', 'Sat', 'Sun']
+TOTAL = 'total'
+
+
+def _positions(ids, values):
+    """Row of each value in the sorted ids array, plus a mask of the values that were found"""
+    if len(ids) == 0:
+        return np.zeros(0, dtype=np.int64), np.zeros(len(values), dtype=bool)
+    positions = np.minimum(np.searchsorted(ids, values), len(ids) - 1)
+    found = ids[positions] == values
+    return positions[found], found
+
+
+def load_daily_arrays(conn, user_id, start_day, end_day):
+    """
+    Per-day arrays over [start_day, end_day):
+    spend (categories + total, days) in paise, done (habits, days) as 0/1, minutes (habits, days).
+    Returns (category names, habit names, spend, done, minutes).
+    """
+    days = end_day - start_day
+    categories = {row[0]: row[1] for row in conn.execute(
+        "SELECT id, name FROM categories WHERE user_id = ? AND kind = 'expense' ORDER BY id", (user_id,)
+    )}
+    habits = {row[0]: row[1] for row in conn.execute(
+        'SELECT id, name FROM habits WHERE user_id = ? ORDER BY id', (user_id,)
+    )}
+
+    spend = np.zeros((len(categories) + 1, days))
+    rows = np.array(conn.execute('''
+        SELECT day, category_id, SUM(amount_paise) FROM expenses
+        WHERE user_id = ? AND day >= ? AND day < ?
+        GROUP BY day, category_id
+    ''', (user_id, start_day, end_day)).fetchall(), dtype=np.int64).reshape(-1, 3)
+    positions, found = _positions(np.array(list(categories), dtype=np.int64), rows[:, 1])
+    spend[positions, rows[found, 0] - start_day] = rows[found, 2]
+    spend[-1] = spend[:-1].sum(axis=0)
+
+    done = np.zeros((len(habits), days))
+    minutes = np.zeros((len(habits), days))
+    rows = np.array(conn.execute('''
+        SELECT day, habit_id, MAX(completed), SUM(COALESCE(duration_minutes, 0)) FROM habit_logs
+        WHERE user_id = ? AND day >= ? AND day < ?
+        GROUP BY day, habit_id
+    ''', (user_id, start_day, end_day)).fetchall(), dtype=np.int64).reshape(-1, 4)
+    positions, found = _positions(np.array(list(habits), dtype=np.int64), rows[:, 1])
+    done[positions, rows[found, 0] - start_day] = rows[found, 2] > 0
+    minutes[positions, rows[found, 0] - start_day] = rows[found, 3]
+
+    return list(categories.values()) + [TOTAL], list(habits.values()), spend, done, minutes
+
+
+def _standardize(rows):
+    """Centre each row and scale it to unit length; rows that never vary become NaN"""
+    centered = rows - rows.mean(axis=1, keepdims=True)
+    norms = np.sqrt((centered ** 2).sum(axis=1, keepdims=True))
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return centered / norms
+
+
+def correlate(a, b):
+    """Pearson correlation of every row of a with every row of b"""
+    return _standardize(a) @ _standardize(b).T
+
+
+def analyze(categories, habits, spend, done, minutes, start_day):
+    """Correlations, lagged effects and day-of-week profiles for one set of daily arrays"""
+    days = spend.shape[1]
+    lags = range(min(MAX_LAG, max(days - 2, 0)) + 1)
+
+    # (lag, habit, category): r, and average spending lag days after done vs skipped days
+    r = np.full((len(lags), len(habits), len(categories)), np.nan)
+    spend_done = np.zeros_like(r)
+    spend_skipped = np.zeros_like(r)
+    for lag in lags:
+        d = done[:, :days - lag]
+        s = spend[:, lag:]
+        done_days = d.sum(axis=1, keepdims=True)
+        skipped_days = d.shape[1] - done_days
+        with np.errstate(invalid='ignore', divide='ignore'):
+            r[lag] = correlate(d, s)
+            spend_done[lag] = (d @ s.T) / done_days
+            spend_skipped[lag] = ((1 - d) @ s.T) / skipped_days
+
+    # Best lag per habit/category pair, among habits with enough done and skipped days
+    done_days = done.sum(axis=1)
+    comparable = (done_days >= MIN_DAYS) & (days - done_days >= MIN_DAYS)
+    strength = np.where(np.isnan(r), 0, np.abs(r))
+    strength[:, ~comparable, :] = 0
+    best_lag = strength.argmax(axis=0)
+    habit_idx, category_idx = np.nonzero(strength.max(axis=0) >= MIN_CORRELATION)
+    order = np.argsort(-strength.max(axis=0)[habit_idx, category_idx])[:MAX_FINDINGS]
+
+    findings = []
+    for h, c in zip(habit_idx[order], category_idx[order]):
+        lag = best_lag[h, c]
+        findings.append({
+            'habit': habits[h],
+            'category': categories[c],
+            'lag_days': int(lag),
+            'correlation': round(float(r[lag, h, c]), 2),
+            'avg_spend_done': round(float(spend_done[lag, h, c]) / 100, 2),
+            'avg_spend_skipped': round(float(spend_skipped[lag, h, c]) / 100, 2)
+        })
+
+    # Minutes spent on a habit vs total spending that day
+    with np.errstate(invalid='ignore', divide='ignore'):
+        duration_r = correlate(minutes, spend[-1:])[:, 0]
+    duration = [
+        {'habit': habits[h], 'correlation': round(float(duration_r[h]), 2)}
+        for h in np.argsort(-np.nan_to_num(np.abs(duration_r)))
+        if not np.isnan(duration_r[h]) and abs(duration_r[h]) >= MIN_CORRELATION
+    ]
+
+    # 1970-01-01 was a Thursday, so (day + 3) % 7 is 0 for Monday
+    weekday = (np.arange(start_day, start_day + days) + 3) % 7
+    weekday_counts = np.maximum(np.bincount(weekday, minlength=7), 1)
+    per_weekday = np.eye(7)[weekday]
+    day_of_week = {
+        'days': WEEKDAYS,
+        'spending': [round(v / 100, 2) for v in (spend[-1] @ per_weekday / weekday_counts).tolist()],
+        'habits': {
+            name: [round(v, 2) for v in rates]
+            for name, rates in zip(habits, (done @ per_weekday / weekday_counts).tolist())
+        }
+    }
+
+    return {'findings': findings, 'duration': duration, 'day_of_week': day_of_week}
+
+
+def analysis_window(year, month, today=None):
+    """[start, end) days analysed for a month: WINDOW_DAYS ending with the month, or today for the current one"""
+    _, end_day = month_days(year, month)
+    end_day = min(end_day, to_day((today or date.today()) + timedelta(days=1)))
+    return end_day - WINDOW_DAYS, end_day
+
+
+def compute_correlations(user_id, year, month):
+    start_day, end_day = analysis_window(year, month)
+    with get_read_db(user_id) as conn:
+        arrays = load_daily_arrays(conn, user_id, start_day, end_day)
+    result = analyze(*arrays, start_day)
+    result.update({
+        'year': year,
+        'month': month,
+        'window': {'from': from_day(start_day), 'to': from_day(end_day - 1), 'days': end_day - start_day}
+    })
+    return result
+
+
+def get_correlations(user_id, year, month, refresh=False):
+    """Correlations for a month, from correlation_cache when its window is still current"""
+    start_day, end_day = analysis_window(year, month)
+    if not refresh:
+        with get_db(user_id) as conn:
+            row = conn.execute(
+                'SELECT payload FROM correlation_cache WHERE user_id = ? AND year = ? AND month = ? AND end_day = ?',
+                (user_id, year, month, end_day)
+            ).fetchone()
+        if row:
+            return json.loads(row['payload'])
+
+    result = compute_correlations(user_id, year, month)
+    with get_db(user_id) as conn:
+        conn.execute('''
+            INSERT OR REPLACE INTO correlation_cache (user_id, year, month, start_day, end_day, payload)
+            VALUES (?, ?, ?, ?, ?, ?)
+        ''', (user_id, year, month, start_day, end_day, json.dumps(result)))
+        conn.commit()
+    return result
+
+
+def invalidate_correlations(conn, user_id, *dates):
+    """Drop cached correlations whose window overlaps the month of any of the given YYYY-MM-DD dates"""
+    for changed in dates:
+        if not changed:
+            continue
+        start_day, end_day = month_days(str(changed)[:4], str(changed)[5:7])
+        conn.execute(
+            'DELETE FROM correlation_cache WHERE user_id = ? AND start_day < ? AND end_day > ?',
+            (user_id, end_day, start_day)
+        )
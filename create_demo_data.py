@@ -6,6 +6,7 @@ import sqlite3
 import random
 from datetime import datetime, timedelta
 from werkzeug.security import generate_password_hash
+from database import init_db, get_db, get_db_connection, assign_shard, to_paise, to_day, get_category_id
 
 DB_PATH = 'finhabits.db'
 
@@ -56,11 +57,15 @@ def create_demo_user(cursor):
         print(f"⚠️  User '{DEMO_USERNAME}' already exists. Deleting old data...")
         user_id = existing_user[0]
         
-        # Delete existing data
-        cursor.execute('DELETE FROM expenses WHERE user_id = ?', (user_id,))
-        cursor.execute('DELETE FROM income WHERE user_id = ?', (user_id,))
-        cursor.execute('DELETE FROM habit_logs WHERE user_id = ?', (user_id,))
-        cursor.execute('DELETE FROM habits WHERE user_id = ?', (user_id,))
+        # Delete existing data (from the user's shard), then the account
+        with get_db(user_id) as shard_conn:
+            shard_conn.execute('DELETE FROM expenses WHERE user_id = ?', (user_id,))
+            shard_conn.execute('DELETE FROM income WHERE user_id = ?', (user_id,))
+            shard_conn.execute('DELETE FROM habit_logs WHERE user_id = ?', (user_id,))
+            shard_conn.execute('DELETE FROM habits WHERE user_id = ?', (user_id,))
+            shard_conn.execute('DELETE FROM categories WHERE user_id = ?', (user_id,))
+            shard_conn.commit()
+        cursor.execute('DELETE FROM user_shards WHERE user_id = ?', (user_id,))
         cursor.execute('DELETE FROM users WHERE id = ?', (user_id,))
         print("   ✅ Deleted old demo data")
     
@@ -69,7 +74,9 @@ def create_demo_user(cursor):
         VALUES (?, ?, ?, ?)
     ''', (DEMO_USERNAME, demo_email, hashed_password, START_DATE))
     
-    return cursor.lastrowid
+    user_id = cursor.lastrowid
+    assign_shard(cursor.connection, user_id)
+    return user_id
 
 def create_habits(cursor, user_id):
     """Create habit entries"""
@@ -99,9 +106,10 @@ def generate_expenses(cursor, user_id):
             description = random.choice(descriptions)
             
             cursor.execute('''
-                INSERT INTO expenses (user_id, amount, category, description, date, created_at)
+                INSERT INTO expenses (user_id, amount_paise, category_id, description, day, created_at)
                 VALUES (?, ?, ?, ?, ?, ?)
-            ''', (user_id, amount, category, description, current_date.date(), current_date))
+            ''', (user_id, to_paise(amount), get_category_id(cursor.connection, user_id, 'expense', category),
+                  description, to_day(current_date.date()), current_date))
             expense_count += 1
         
         current_date += timedelta(days=1)
@@ -128,9 +136,10 @@ def generate_income(cursor, user_id):
                 # Add some variation
                 amount = base_amount + random.randint(-200, 200)
                 cursor.execute('''
-                    INSERT INTO income (user_id, amount, source, date, created_at)
+                    INSERT INTO income (user_id, amount_paise, source_id, day, created_at)
                     VALUES (?, ?, ?, ?, ?)
-                ''', (user_id, amount, source, current_date.date(), current_date))
+                ''', (user_id, to_paise(amount), get_category_id(cursor.connection, user_id, 'income', source),
+                      to_day(current_date.date()), current_date))
                 income_count += 1
         
         current_date += timedelta(days=1)
@@ -169,10 +178,10 @@ def generate_habit_logs(cursor, user_id, habit_ids):
                 topic = random.choice(topics.get(habit_name, ['General']))
                 
                 cursor.execute('''
-                    INSERT INTO habit_logs (user_id, habit_id, date, completed, 
+                    INSERT INTO habit_logs (user_id, habit_id, day, completed, 
                                            duration_minutes, topic, created_at)
                     VALUES (?, ?, ?, ?, ?, ?, ?)
-                ''', (user_id, habit_id, current_date.date(), 1, 
+                ''', (user_id, habit_id, to_day(current_date.date()), 1, 
                       duration, topic, current_date))
                 log_count += 1
         
@@ -187,6 +196,8 @@ def main():
     print(f"\n📅 Date Range: {START_DATE.date()} to {END_DATE.date()}")
     print(f"👤 Demo User: {DEMO_USERNAME} (Password: {DEMO_PASSWORD})\n")
     
+    # Make sure the schema (and integer storage layout) is current
+    init_db()
     conn = sqlite3.connect(DB_PATH)
     cursor = conn.cursor()
     
@@ -194,8 +205,14 @@ def main():
         # Create demo user
         print("1️⃣  Creating demo user account...")
         user_id = create_demo_user(cursor)
+        conn.commit()
         print(f"   ✅ User created (ID: {user_id})")
         
+        # Everything else goes into the user's shard
+        conn.close()
+        conn = get_db_connection(user_id)
+        cursor = conn.cursor()
+        
         # Create habits
         print("\n2️⃣  Setting up habits...")
         habit_ids = create_habits(cursor, user_id)
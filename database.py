@@ -1,44 +1,778 @@
 """
 Database initialization and helper functions for FinHabits
 """
+import glob
+import os
 import sqlite3
+import threading
+import zlib
+from collections import OrderedDict
 from contextlib import contextmanager
+from datetime import date, datetime, timedelta
+from decimal import Decimal, ROUND_HALF_UP
+
+from timeslots import parse_time_slots
 
 DB_PATH = 'finhabits.db'
 
-def get_db_connection():
+# Sharding: '0' keeps every user in DB_PATH, a number N spreads users over N shard files,
+# 'user' gives each user their own file. DB_PATH always stays the directory holding users and
+# user_shards; users with no user_shards row (everyone before sharding) live in DB_PATH too.
+SHARDS = os.getenv('SHARDS', '0')
+MAIN_SHARD = 'main'
+
+# Tables holding per-user rows, parents before the tables that reference them
+# (category_spend and change_log are left out: triggers maintain them as rows are copied or deleted)
+USER_TABLES = ('categories', 'habits', 'expenses', 'income', 'habit_logs', 'recurring_rules', 'budgets',
+               'budget_alerts', 'savings_goals', 'savings', 'insights_cache', 'correlation_cache')
+
+# Money is stored as integer paise and dates as integer days since 1970-01-01.
+# The API keeps speaking rupees and YYYY-MM-DD; these helpers convert at the boundary.
+EPOCH = date(1970, 1, 1)
+
+# SQL expressions that present stored values in the API's shape
+API_DATE = "date({} * 86400, 'unixepoch')"
+CATEGORY_NAME = "(SELECT name FROM categories WHERE categories.id = {})"
+EXPENSE_FIELDS = (
+    f"id, user_id, amount_paise / 100.0 AS amount, {CATEGORY_NAME.format('expenses.category_id')} AS category, "
+    f"description, {API_DATE.format('day')} AS date, created_at"
+)
+INCOME_FIELDS = (
+    f"id, user_id, amount_paise / 100.0 AS amount, {CATEGORY_NAME.format('income.source_id')} AS source, "
+    f"{API_DATE.format('day')} AS date, created_at"
+)
+HABIT_LOG_FIELDS = (
+    f"hl.id, hl.habit_id, hl.user_id, {API_DATE.format('hl.day')} AS date, hl.completed, "
+    "hl.duration_minutes, hl.time_slots, hl.topic, hl.tasks, hl.notes, hl.created_at"
+)
+
+def to_paise(amount):
+    """Convert a rupee amount (number or numeric string) to integer paise"""
+    return int((Decimal(str(amount)) * 100).quantize(Decimal('1'), rounding=ROUND_HALF_UP))
+
+def from_paise(paise):
+    """Convert integer paise back to rupees for the API"""
+    return (paise or 0) / 100
+
+def to_day(date_str):
+    """Convert a YYYY-MM-DD string (or date) to days since 1970-01-01"""
+    if isinstance(date_str, date):
+        return (date_str - EPOCH).days
+    return (datetime.strptime(str(date_str)[:10], '%Y-%m-%d').date() - EPOCH).days
+
+def from_day(day):
+    """Convert days since 1970-01-01 back to YYYY-MM-DD"""
+    return (EPOCH + timedelta(days=day)).isoformat()
+
+def month_days(year, month):
+    """Return the [start, end) day numbers covering a calendar month"""
+    year, month = int(year), int(month)
+    start = date(year, month, 1)
+    end = date(year + 1, 1, 1) if month == 12 else date(year, month + 1, 1)
+    return (start - EPOCH).days, (end - EPOCH).days
+
+def get_category_id(conn, user_id, kind, name):
+    """Return the user's dictionary id for an expense category or income source ('expense'/'income'), adding it on first use"""
+    if name is None:
+        raise ValueError(f'{"Category" if kind == "expense" else "Source"} is required')
+    
+    query = 'SELECT id FROM categories WHERE user_id = ? AND kind = ? AND name = ?'
+    row = conn.execute(query, (user_id, kind, name)).fetchone()
+    if row is None:
+        conn.execute('INSERT OR IGNORE INTO categories (user_id, kind, name) VALUES (?, ?, ?)', (user_id, kind, name))
+        row = conn.execute(query, (user_id, kind, name)).fetchone()
+    return row[0]
+
+def connect(path):
     """Create and return a database connection with proper timeout and settings"""
-    conn = sqlite3.connect(DB_PATH, timeout=30.0, check_same_thread=False)
+    conn = sqlite3.connect(path, timeout=30.0, check_same_thread=False)
     conn.row_factory = sqlite3.Row  # Enable column access by name
+    # New files reuse free pages via PRAGMA incremental_vacuum (maintenance.py); no-op on existing files
+    conn.execute('PRAGMA auto_vacuum=INCREMENTAL')
     # Enable WAL mode for better concurrent access
     conn.execute('PRAGMA journal_mode=WAL')
     # Set busy timeout to handle concurrent access
     conn.execute('PRAGMA busy_timeout=30000')
     return conn
 
+def shard_path(shard):
+    """File holding a shard, e.g. finhabits_shard3.db or finhabits_user42.db next to DB_PATH"""
+    if shard == MAIN_SHARD:
+        return DB_PATH
+    base, ext = os.path.splitext(DB_PATH)
+    return f'{base}_{shard}{ext}'
+
+def hash_shard(user_id, shards=None):
+    """Shard a user belongs on under the given (default: configured) SHARDS setting"""
+    shards = str(shards if shards is not None else SHARDS)
+    if shards in ('', '0', '1'):
+        return MAIN_SHARD
+    if shards == 'user':
+        return f'user{user_id}'
+    # crc32 rather than hash(): stable across processes and Python versions
+    return f'shard{zlib.crc32(str(user_id).encode()) % int(shards)}'
+
+_user_shards = {}
+_ready_shards = set()
+_shard_lock = threading.Lock()
+
+def shard_for_user(user_id):
+    """Shard currently holding a user's rows, from the user_shards directory (cached per process)"""
+    shard = _user_shards.get(user_id)
+    if shard is None:
+        conn = connect(DB_PATH)
+        try:
+            row = conn.execute('SELECT shard FROM user_shards WHERE user_id = ?', (user_id,)).fetchone()
+        finally:
+            conn.close()
+        shard = row['shard'] if row else MAIN_SHARD
+        _user_shards[user_id] = shard
+    return shard
+
+def assign_shard(conn, user_id, shard=None):
+    """Record a user's shard in the directory (on conn, a DB_PATH connection); defaults to hash_shard"""
+    shard = shard or hash_shard(user_id)
+    conn.execute('INSERT OR REPLACE INTO user_shards (user_id, shard) VALUES (?, ?)', (user_id, shard))
+    _user_shards[user_id] = shard
+    return shard
+
+def all_shards():
+    """Every shard that may hold user rows: DB_PATH plus each shard named in the directory"""
+    conn = connect(DB_PATH)
+    try:
+        rows = conn.execute('SELECT DISTINCT shard FROM user_shards').fetchall()
+    finally:
+        conn.close()
+    return [MAIN_SHARD] + sorted({row['shard'] for row in rows} - {MAIN_SHARD})
+
+def get_shard_connection(shard):
+    """Connection to a shard file, creating its tables the first time this process opens it"""
+    conn = connect(shard_path(shard))
+    if shard not in _ready_shards:
+        with _shard_lock:
+            if shard not in _ready_shards:
+                create_user_tables(conn)
+                conn.commit()
+                _ready_shards.add(shard)
+    return conn
+
+def get_db_connection(user_id=None):
+    """Connection to the user's shard, or to the directory database (users) when user_id is None"""
+    if user_id is None:
+        return connect(DB_PATH)
+    return get_shard_connection(shard_for_user(user_id))
+
 @contextmanager
-def get_db():
+def get_db(user_id=None):
     """Context manager for database connections to ensure closing"""
-    conn = get_db_connection()
+    conn = get_db_connection(user_id)
     try:
         yield conn
     finally:
         conn.close()
 
-def init_db():
-    """Initialize database with required tables"""
-    # Use direct connection for initialization
-    conn = get_db_connection()
+# Analytics reads get their own read-only connections with a bigger page cache and mmap.
+# They are kept per thread and per file so the cache stays warm across requests; each thread keeps
+# at most READ_CONNECTIONS of them (one per shard file, so with SHARDS=user one per recent user)
+# and closes the least recently used one beyond that.
+READ_CACHE_KIB = int(os.getenv('READ_CACHE_KIB', '65536'))
+READ_MMAP_BYTES = int(os.getenv('READ_MMAP_BYTES', str(256 * 1024 * 1024)))
+READ_CONNECTIONS = int(os.getenv('READ_CONNECTIONS', '8'))
+_read_local = threading.local()
+
+def connect_readonly(path):
+    """Read-only connection (mode=ro, query_only) tuned for large scans"""
+    conn = sqlite3.connect(f'file:{path}?mode=ro', uri=True, timeout=30.0, check_same_thread=False)
+    conn.row_factory = sqlite3.Row
+    conn.execute('PRAGMA query_only=ON')
+    conn.execute('PRAGMA busy_timeout=30000')
+    conn.execute(f'PRAGMA cache_size=-{READ_CACHE_KIB}')
+    conn.execute(f'PRAGMA mmap_size={READ_MMAP_BYTES}')
+    return conn
+
+def close_read_connections():
+    """Close this thread's pooled read connections; get_read_db opens new ones when next needed"""
+    connections = getattr(_read_local, 'connections', None)
+    while connections:
+        connections.popitem()[1].close()
+
+@contextmanager
+def get_read_db(user_id=None, archives=False):
+    """
+    Read-only snapshot of the user's shard (or the directory when user_id is None).
+    Every query inside the block sees the same committed state. The read transaction
+    ends on exit, so it holds back WAL checkpoints only for the length of the block.
+    In WAL mode writers never wait for it. With archives=True the yearly archive files
+    are attached as archive<YEAR> (see attached_archives).
+    """
+    shard = MAIN_SHARD if user_id is None else shard_for_user(user_id)
+    if shard not in _ready_shards:
+        # A read-only connection cannot create the shard's tables, so open it normally once
+        get_shard_connection(shard).close()
+
+    path = shard_path(shard)
+    connections = getattr(_read_local, 'connections', None)
+    if connections is None:
+        connections = _read_local.connections = OrderedDict()
+        _read_local.in_use = set()
+    conn = connections.get(path)
+    if conn is None:
+        conn = connections[path] = connect_readonly(path)
+        # Least recently used first; a connection inside an enclosing block stays open
+        idle = [other for other in connections if other != path and other not in _read_local.in_use]
+        for other in idle[:max(len(connections) - max(READ_CONNECTIONS, 1), 0)]:
+            connections.pop(other).close()
+    else:
+        connections.move_to_end(path)
+
+    if archives:
+        attached = set(attached_archives(conn))
+        for year in archive_years():
+            if f'archive{year}' not in attached:
+                conn.execute(f'ATTACH DATABASE ? AS archive{year}', (f'file:{archive_path(year)}?mode=ro',))
+
+    conn.execute('BEGIN')
+    _read_local.in_use.add(path)
+    try:
+        yield conn
+    finally:
+        _read_local.in_use.discard(path)
+        conn.rollback()
+
+# Closed years can be moved out of the hot tables into one file per year (see archive.py).
+# Archive rows keep category, source and habit names instead of ids, so one file serves every shard.
+ARCHIVE_EXPENSE_FIELDS = (
+    f"id, user_id, amount_paise / 100.0 AS amount, category, description, {API_DATE.format('day')} AS date, created_at"
+)
+ARCHIVE_INCOME_FIELDS = f"id, user_id, amount_paise / 100.0 AS amount, source, {API_DATE.format('day')} AS date, created_at"
+ARCHIVE_HABIT_LOG_FIELDS = HABIT_LOG_FIELDS + ', hl.habit_name AS name'
+
+def archive_path(year):
+    """Archive file for a year, e.g. finhabits_archive2023.db next to DB_PATH"""
+    base, ext = os.path.splitext(DB_PATH)
+    return f'{base}_archive{int(year)}{ext}'
+
+def archive_years():
+    """Years that have an archive file on disk, oldest first"""
+    base, ext = os.path.splitext(DB_PATH)
+    years = []
+    for path in glob.glob(f'{base}_archive*{ext}'):
+        year = path[len(base) + len('_archive'):len(path) - len(ext)]
+        if year.isdigit():
+            years.append(int(year))
+    return sorted(years)
+
+def attached_archives(conn):
+    """Schema names of the archives attached to conn, oldest first"""
+    return sorted(row[1] for row in conn.execute('PRAGMA database_list') if row[1].startswith('archive'))
+
+def with_archives(hot_query, archive_query, schemas):
+    """UNION ALL of hot_query and archive_query run against each archive schema ({db} in archive_query)"""
+    return ' UNION ALL '.join([hot_query] + [archive_query.format(db=schema) for schema in schemas])
+
+def _columns(cursor, table):
+    cursor.execute(f'PRAGMA table_info({table})')
+    return [column[1] for column in cursor.fetchall()]
+
+def upgrade_to_integer_storage(conn):
+    """
+    Rebuild tables still using REAL amounts and DATE text into the integer layout.
+    Safe to call repeatedly; returns the list of tables that were converted.
+    """
+    cursor = conn.cursor()
+    conn.create_function('to_paise', 1, to_paise, deterministic=True)
+    conn.create_function('to_day', 1, to_day, deterministic=True)
+
+    # table -> (new column definitions, copy expressions matching them)
+    layouts = {
+        'expenses': (
+            '''id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            amount_paise INTEGER NOT NULL,
+            category TEXT NOT NULL,
+            description TEXT,
+            day INTEGER NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (user_id) REFERENCES users (id)''',
+            'id, user_id, to_paise(amount), category, description, to_day(date), created_at'
+        ),
+        'income': (
+            '''id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            amount_paise INTEGER NOT NULL,
+            source TEXT NOT NULL,
+            day INTEGER NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (user_id) REFERENCES users (id)''',
+            'id, user_id, to_paise(amount), source, to_day(date), created_at'
+        ),
+        'savings': (
+            '''id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            amount_paise INTEGER NOT NULL,
+            goal TEXT,
+            day INTEGER NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (user_id) REFERENCES users (id)''',
+            'id, user_id, to_paise(amount), goal, to_day(date), created_at'
+        ),
+        'habit_logs': (
+            '''id INTEGER PRIMARY KEY AUTOINCREMENT,
+            habit_id INTEGER NOT NULL,
+            user_id INTEGER NOT NULL,
+            day INTEGER NOT NULL,
+            completed BOOLEAN DEFAULT 0,
+            duration_minutes INTEGER DEFAULT 0,
+            time_slots TEXT,
+            topic TEXT,
+            tasks TEXT,
+            notes TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (habit_id) REFERENCES habits (id),
+            FOREIGN KEY (user_id) REFERENCES users (id),
+            UNIQUE(habit_id, day)''',
+            'id, habit_id, user_id, to_day(date), completed, duration_minutes, time_slots, topic, tasks, notes, created_at'
+        )
+    }
+
+    # Tables that exist and still have a text date column
+    pending = [table for table in layouts if 'date' in _columns(cursor, table)]
+    if not pending:
+        return []
+
+    cursor.execute('BEGIN')
+    try:
+        for table in pending:
+            definition, copy_columns = layouts[table]
+            target = copy_columns.replace('to_paise(amount)', 'amount_paise').replace('to_day(date)', 'day')
+            cursor.execute(f'CREATE TABLE {table}_new ({definition})')
+            cursor.execute(f'INSERT INTO {table}_new ({target}) SELECT {copy_columns} FROM {table}')
+            cursor.execute(f'DROP TABLE {table}')
+            cursor.execute(f'ALTER TABLE {table}_new RENAME TO {table}')
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+
+    return pending
+
+def upgrade_to_category_ids(conn):
+    """
+    Move free-text expenses.category and income.source into the per-user categories dictionary.
+    Safe to call repeatedly; returns the list of tables that were converted.
+    """
+    cursor = conn.cursor()
+    pending = [table for table, column in (('expenses', 'category'), ('income', 'source'))
+               if column in _columns(cursor, table)]
+    if not pending:
+        return []
+
+    cursor.execute('BEGIN')
+    try:
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS categories (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                user_id INTEGER NOT NULL,
+                kind TEXT NOT NULL,
+                name TEXT NOT NULL,
+                FOREIGN KEY (user_id) REFERENCES users (id),
+                UNIQUE(user_id, kind, name)
+            )
+        ''')
+
+        if 'expenses' in pending:
+            cursor.execute('''
+                INSERT OR IGNORE INTO categories (user_id, kind, name)
+                SELECT DISTINCT user_id, 'expense', category FROM expenses
+            ''')
+            cursor.execute('''
+                CREATE TABLE expenses_new (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    user_id INTEGER NOT NULL,
+                    amount_paise INTEGER NOT NULL,
+                    category_id INTEGER NOT NULL,
+                    description TEXT,
+                    day INTEGER NOT NULL,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    FOREIGN KEY (user_id) REFERENCES users (id),
+                    FOREIGN KEY (category_id) REFERENCES categories (id)
+                )
+            ''')
+            cursor.execute('''
+                INSERT INTO expenses_new (id, user_id, amount_paise, category_id, description, day, created_at)
+                SELECT e.id, e.user_id, e.amount_paise, c.id, e.description, e.day, e.created_at
+                FROM expenses e
+                JOIN categories c ON c.user_id = e.user_id AND c.kind = 'expense' AND c.name = e.category
+            ''')
+            cursor.execute('DROP TABLE expenses')
+            cursor.execute('ALTER TABLE expenses_new RENAME TO expenses')
+
+        if 'income' in pending:
+            cursor.execute('''
+                INSERT OR IGNORE INTO categories (user_id, kind, name)
+                SELECT DISTINCT user_id, 'income', source FROM income
+            ''')
+            cursor.execute('''
+                CREATE TABLE income_new (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    user_id INTEGER NOT NULL,
+                    amount_paise INTEGER NOT NULL,
+                    source_id INTEGER NOT NULL,
+                    day INTEGER NOT NULL,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    FOREIGN KEY (user_id) REFERENCES users (id),
+                    FOREIGN KEY (source_id) REFERENCES categories (id)
+                )
+            ''')
+            cursor.execute('''
+                INSERT INTO income_new (id, user_id, amount_paise, source_id, day, created_at)
+                SELECT i.id, i.user_id, i.amount_paise, c.id, i.day, i.created_at
+                FROM income i
+                JOIN categories c ON c.user_id = i.user_id AND c.kind = 'income' AND c.name = i.source
+            ''')
+            cursor.execute('DROP TABLE income')
+            cursor.execute('ALTER TABLE income_new RENAME TO income')
+
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+
+    return pending
+
+def add_slot_bits(conn):
+    """Add habit_logs.slot_bits (see timeslots.py) to older databases and fill it from time_slots"""
+    if 'slot_bits' in _columns(conn.cursor(), 'habit_logs'):
+        return
+    conn.execute('ALTER TABLE habit_logs ADD COLUMN slot_bits INTEGER NOT NULL DEFAULT 0')
+    rows = conn.execute("SELECT id, time_slots FROM habit_logs WHERE time_slots != ''").fetchall()
+    updates = [(parse_time_slots(row[1]), row[0]) for row in rows]
+    conn.executemany('UPDATE habit_logs SET slot_bits = ? WHERE id = ?', [update for update in updates if update[0]])
+    conn.commit()
+    print(f"Added habit time slot bitmaps ({sum(1 for bits, _ in updates if bits)} logs)")
+
+def create_indexes(conn):
+    """Covering indexes so per-user range scans and sums never touch the table rows"""
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_expenses_user_day ON expenses (user_id, day, amount_paise, category_id)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_income_user_day ON income (user_id, day, amount_paise, source_id)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_habit_logs_user_day ON habit_logs (user_id, day, completed)')
+
+# Full-text search sources: kind -> (table, rowid offset, tags expression, searchable text expression).
+# Every indexed row gets rowid = id * 4 + offset so triggers can find it again without a scan.
+# owner ('u<user_id>') and tags ('<kind> c<category_id>') are indexed tokens, which turns the
+# user, type and category filters into posting-list lookups inside the MATCH.
+SEARCH_SOURCES = {
+    'expense': (
+        'expenses', 0,
+        "'expense c' || {row}.category_id",
+        "COALESCE((SELECT name FROM categories WHERE id = {row}.category_id), '') || ' ' || COALESCE({row}.description, '')"
+    ),
+    'income': (
+        'income', 1,
+        "'income c' || {row}.source_id",
+        "COALESCE((SELECT name FROM categories WHERE id = {row}.source_id), '')"
+    ),
+    'habit': (
+        'habit_logs', 2,
+        "'habit h' || {row}.habit_id",
+        "COALESCE((SELECT name FROM habits WHERE id = {row}.habit_id), '') || ' ' || "
+        "COALESCE({row}.topic, '') || ' ' || COALESCE({row}.tasks, '') || ' ' || COALESCE({row}.notes, '')"
+    )
+}
+
+SEARCH_INDEX_MODULE = "fts5(owner, tags, body, kind UNINDEXED, ref_id UNINDEXED, day UNINDEXED, prefix = '2 3')"
+
+def _search_select(kind, row):
+    """SELECT list producing one search_index row for the given source row alias"""
+    table, offset, tags, body = SEARCH_SOURCES[kind]
+    return (f"{row}.id * 4 + {offset}, 'u' || {row}.user_id, {tags.format(row=row)}, "
+            f"{body.format(row=row)}, '{kind}', {row}.id, {row}.day")
+
+def rebuild_search_index(conn):
+    """Repopulate search_index from the source tables; returns the number of indexed rows"""
+    conn.execute('DELETE FROM search_index')
+    for kind, (table, _, _, _) in SEARCH_SOURCES.items():
+        conn.execute(f'''
+            INSERT INTO search_index (rowid, owner, tags, body, kind, ref_id, day)
+            SELECT {_search_select(kind, table)} FROM {table}
+        ''')
+    conn.execute("INSERT INTO search_index (search_index) VALUES ('optimize')")
+    return conn.execute('SELECT COUNT(*) FROM search_index').fetchone()[0]
+
+def create_search_index(conn):
+    """Create the FTS5 search index and the triggers that keep it in sync; builds it on first creation"""
+    exists = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'search_index'"
+    ).fetchone()
+    conn.execute(f'CREATE VIRTUAL TABLE IF NOT EXISTS search_index USING {SEARCH_INDEX_MODULE}')
+
+    for kind, (table, offset, _, _) in SEARCH_SOURCES.items():
+        insert = (f'INSERT INTO search_index (rowid, owner, tags, body, kind, ref_id, day) '
+                  f'SELECT {_search_select(kind, "new")};')
+        delete = f'DELETE FROM search_index WHERE rowid = old.id * 4 + {offset};'
+        conn.execute(f'CREATE TRIGGER IF NOT EXISTS {table}_search_insert AFTER INSERT ON {table} BEGIN {insert} END')
+        conn.execute(f'CREATE TRIGGER IF NOT EXISTS {table}_search_delete AFTER DELETE ON {table} BEGIN {delete} END')
+        conn.execute(f'CREATE TRIGGER IF NOT EXISTS {table}_search_update AFTER UPDATE ON {table} BEGIN {delete} {insert} END')
+
+    if not exists:
+        count = rebuild_search_index(conn)
+        print(f"Built search index ({count} entries)")
+
+# Budgets: spend per category and month (YYYYMM) is kept in category_spend by triggers on expenses,
+# in the same transaction as the write. An alert row is recorded the first time a month's spend
+# reaches each percentage of the category's limit, and dropped again if spend falls back below it.
+BUDGET_THRESHOLDS = (80, 100)
+MONTH_KEY = "CAST(strftime('%Y%m', {} * 86400, 'unixepoch') AS INTEGER)"
+
+def budget_alert_sql(user_id, category_id, month):
+    """Statements that bring budget_alerts in line with category_spend for one category and month"""
+    spent = (f'COALESCE((SELECT spent_paise FROM category_spend '
+             f'WHERE user_id = {user_id} AND category_id = {category_id} AND month = {month}), 0)')
+    limit = f'(SELECT limit_paise FROM budgets WHERE user_id = {user_id} AND category_id = {category_id})'
+    thresholds = ', '.join(f'({t})' for t in BUDGET_THRESHOLDS)
+    return (
+        f'''DELETE FROM budget_alerts
+            WHERE user_id = {user_id} AND category_id = {category_id} AND month = {month}
+              AND {spent} * 100 < {limit} * threshold;''',
+        f'''INSERT OR IGNORE INTO budget_alerts (user_id, category_id, month, threshold, spent_paise, limit_paise)
+            SELECT b.user_id, b.category_id, s.month, t.column1, s.spent_paise, b.limit_paise
+            FROM budgets b
+            JOIN category_spend s ON s.user_id = b.user_id AND s.category_id = b.category_id AND s.month = {month}
+            JOIN (VALUES {thresholds}) t ON s.spent_paise * 100 >= b.limit_paise * t.column1
+            WHERE b.user_id = {user_id} AND b.category_id = {category_id};'''
+    )
+
+def _category_spend_sql(row, sign):
+    """Trigger statements adding (sign '') or removing (sign '-') an expense row's amount"""
+    month = MONTH_KEY.format(f'{row}.day')
+    return ' '.join((
+        f'''INSERT INTO category_spend (user_id, category_id, month, spent_paise)
+            VALUES ({row}.user_id, {row}.category_id, {month}, {sign}{row}.amount_paise)
+            ON CONFLICT (user_id, category_id, month) DO UPDATE SET spent_paise = spent_paise + excluded.spent_paise;''',
+        f'''DELETE FROM category_spend
+            WHERE user_id = {row}.user_id AND category_id = {row}.category_id AND month = {month} AND spent_paise = 0;''',
+    ) + budget_alert_sql(f'{row}.user_id', f'{row}.category_id', month))
+
+def rebuild_category_spend(conn):
+    """Recount category_spend from the expenses table; returns the number of counters"""
+    conn.execute('DELETE FROM category_spend')
+    conn.execute(f'''
+        INSERT INTO category_spend (user_id, category_id, month, spent_paise)
+        SELECT user_id, category_id, {MONTH_KEY.format('day')}, SUM(amount_paise) FROM expenses
+        GROUP BY 1, 2, 3 HAVING SUM(amount_paise) != 0
+    ''')
+    return conn.execute('SELECT COUNT(*) FROM category_spend').fetchone()[0]
+
+def create_budget_tables(conn):
+    """Create the budget tables and the expense triggers that keep spend counters current"""
+    exists = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'category_spend'"
+    ).fetchone()
+
+    # Monthly spending limit per expense category
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS budgets (
+            user_id INTEGER NOT NULL,
+            category_id INTEGER NOT NULL,
+            limit_paise INTEGER NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (user_id, category_id),
+            FOREIGN KEY (user_id) REFERENCES users (id),
+            FOREIGN KEY (category_id) REFERENCES categories (id)
+        )
+    ''')
+
+    # Running spend per category and month, so budget status never scans expenses
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS category_spend (
+            user_id INTEGER NOT NULL,
+            category_id INTEGER NOT NULL,
+            month INTEGER NOT NULL,
+            spent_paise INTEGER NOT NULL,
+            PRIMARY KEY (user_id, category_id, month)
+        ) WITHOUT ROWID
+    ''')
+
+    # Threshold crossings, one per category, month and threshold
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS budget_alerts (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            category_id INTEGER NOT NULL,
+            month INTEGER NOT NULL,
+            threshold INTEGER NOT NULL,
+            spent_paise INTEGER NOT NULL,
+            limit_paise INTEGER NOT NULL,
+            seen BOOLEAN DEFAULT 0,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (user_id) REFERENCES users (id),
+            FOREIGN KEY (category_id) REFERENCES categories (id),
+            UNIQUE(user_id, category_id, month, threshold)
+        )
+    ''')
+
+    add, remove = _category_spend_sql('new', ''), _category_spend_sql('old', '-')
+    conn.execute(f'CREATE TRIGGER IF NOT EXISTS expenses_spend_insert AFTER INSERT ON expenses BEGIN {add} END')
+    conn.execute(f'CREATE TRIGGER IF NOT EXISTS expenses_spend_delete AFTER DELETE ON expenses BEGIN {remove} END')
+    conn.execute(f'CREATE TRIGGER IF NOT EXISTS expenses_spend_update '
+                 f'AFTER UPDATE OF amount_paise, category_id, day ON expenses BEGIN {remove} {add} END')
+
+    if not exists:
+        count = rebuild_category_spend(conn)
+        print(f"Built category spend counters ({count} entries)")
+
+# Tables whose changes are recorded in change_log for delta sync (see sync.py)
+SYNC_TABLES = ('expenses', 'income', 'habits', 'habit_logs')
+
+def _change_log_sql(table, row, deleted):
+    """Trigger body moving a row's change_log entry to the end of the log (one entry per row)"""
+    return (f"DELETE FROM change_log WHERE tbl = '{table}' AND row_id = {row}.id; "
+            f"INSERT INTO change_log (user_id, tbl, row_id, deleted) VALUES ({row}.user_id, '{table}', {row}.id, {deleted});")
+
+def create_sync_tables(conn):
+    """Create the change log, its triggers and the per-user sync reset points"""
+    exists = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'change_log'"
+    ).fetchone()
+
+    # Latest change of every synced row; deleted rows stay as tombstones. seq is the sync cursor.
+    # archive.py adds one 'archive' entry per user (row_id is the user id) to mark a reset point
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS change_log (
+            seq INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            tbl TEXT NOT NULL,
+            row_id INTEGER NOT NULL,
+            deleted BOOLEAN NOT NULL DEFAULT 0,
+            UNIQUE(tbl, row_id)
+        )
+    ''')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_change_log_user_seq ON change_log (user_id, seq)')
+
+    # Cursors below seq cannot be continued (the user's rows were copied in with new ids, or
+    # a year of them was archived)
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS sync_resets (
+            user_id INTEGER PRIMARY KEY,
+            seq INTEGER NOT NULL
+        )
+    ''')
+
+    for table in SYNC_TABLES:
+        conn.execute(f'CREATE TRIGGER IF NOT EXISTS {table}_sync_insert AFTER INSERT ON {table} '
+                     f'BEGIN {_change_log_sql(table, "new", 0)} END')
+        conn.execute(f'CREATE TRIGGER IF NOT EXISTS {table}_sync_update AFTER UPDATE ON {table} '
+                     f'BEGIN {_change_log_sql(table, "new", 0)} END')
+        conn.execute(f'CREATE TRIGGER IF NOT EXISTS {table}_sync_delete AFTER DELETE ON {table} '
+                     f'BEGIN {_change_log_sql(table, "old", 1)} END')
+
+    if not exists:
+        for table in SYNC_TABLES:
+            conn.execute(f"INSERT INTO change_log (user_id, tbl, row_id) SELECT user_id, '{table}', id FROM {table}")
+        count = conn.execute('SELECT COUNT(*) FROM change_log').fetchone()[0]
+        print(f"Built sync change log ({count} entries)")
+
+def _savings_total_sql(row, sign):
+    """Trigger statement adding (sign '+') or removing (sign '-') a contribution from its goal's totals"""
+    start_day = f'MIN(start_day, {row}.day)' if sign == '+' else 'start_day'
+    return (f'UPDATE savings_goals SET saved_paise = saved_paise {sign} {row}.amount_paise, '
+            f'contributions = contributions {sign} 1, start_day = {start_day} WHERE id = {row}.goal_id;')
+
+def rebuild_savings_totals(conn):
+    """Recount every goal's totals from the savings table; returns the number of goals"""
+    conn.execute('''
+        UPDATE savings_goals SET
+            saved_paise = COALESCE((SELECT SUM(amount_paise) FROM savings WHERE goal_id = savings_goals.id), 0),
+            contributions = (SELECT COUNT(*) FROM savings WHERE goal_id = savings_goals.id),
+            start_day = MIN(start_day, COALESCE((SELECT MIN(day) FROM savings WHERE goal_id = savings_goals.id),
+                                                start_day))
+    ''')
+    return conn.execute('SELECT COUNT(*) FROM savings_goals').fetchone()[0]
+
+def create_savings_tables(conn):
+    """Create savings goals, their contributions and the triggers that keep each goal's totals current"""
+    exists = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'savings_goals'"
+    ).fetchone()
+
+    # target_day is an optional deadline; saved_paise and contributions are running totals of the
+    # goal's contributions and start_day the earliest of its creation and contribution days
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS savings_goals (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            name TEXT NOT NULL,
+            target_paise INTEGER NOT NULL,
+            target_day INTEGER,
+            start_day INTEGER NOT NULL,
+            saved_paise INTEGER NOT NULL DEFAULT 0,
+            contributions INTEGER NOT NULL DEFAULT 0,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (user_id) REFERENCES users (id),
+            UNIQUE(user_id, name)
+        )
+    ''')
+
+    # Contributions to a goal (negative amounts are withdrawals); goal is the free-text name
+    # rows carried before savings_goals existed
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS savings (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            amount_paise INTEGER NOT NULL,
+            goal TEXT,
+            day INTEGER NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            goal_id INTEGER REFERENCES savings_goals (id),
+            FOREIGN KEY (user_id) REFERENCES users (id)
+        )
+    ''')
+    if 'goal_id' not in _columns(conn.cursor(), 'savings'):
+        # Savings from migrate_savings.py: every goal name becomes a goal without a target
+        conn.execute('ALTER TABLE savings ADD COLUMN goal_id INTEGER REFERENCES savings_goals (id)')
+        name = "COALESCE(NULLIF(goal, ''), 'Savings')"
+        conn.execute(f'''
+            INSERT OR IGNORE INTO savings_goals (user_id, name, target_paise, start_day)
+            SELECT user_id, {name}, 0, MIN(day) FROM savings GROUP BY 1, 2
+        ''')
+        conn.execute(f'''
+            UPDATE savings SET goal_id = (
+                SELECT id FROM savings_goals g WHERE g.user_id = savings.user_id AND g.name = {name}
+            )
+        ''')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_savings_goal_day ON savings (goal_id, day)')
+
+    add, remove = _savings_total_sql('new', '+'), _savings_total_sql('old', '-')
+    conn.execute(f'CREATE TRIGGER IF NOT EXISTS savings_total_insert AFTER INSERT ON savings BEGIN {add} END')
+    conn.execute(f'CREATE TRIGGER IF NOT EXISTS savings_total_delete AFTER DELETE ON savings BEGIN {remove} END')
+    conn.execute(f'CREATE TRIGGER IF NOT EXISTS savings_total_update '
+                 f'AFTER UPDATE OF amount_paise, goal_id, day ON savings BEGIN {remove} {add} END')
+
+    if not exists:
+        count = rebuild_savings_totals(conn)
+        print(f"Built savings goal totals ({count} goals)")
+
+def create_user_tables(conn):
+    """Create (and upgrade) the per-user tables in a main or shard database"""
     cursor = conn.cursor()
     
-    # Users table
+    # Older databases store REAL amounts and text dates; convert them first
+    converted = upgrade_to_integer_storage(conn)
+    if converted:
+        print(f"Converted {', '.join(converted)} to integer amount/day storage")
+    converted = upgrade_to_category_ids(conn)
+    if converted:
+        print(f"Moved {', '.join(converted)} names into the categories dictionary")
+    
+    # Per-user dictionary of expense categories and income sources
     cursor.execute('''
-        CREATE TABLE IF NOT EXISTS users (
+        CREATE TABLE IF NOT EXISTS categories (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
-            username TEXT UNIQUE NOT NULL,
-            email TEXT UNIQUE NOT NULL,
-            password_hash TEXT NOT NULL,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            user_id INTEGER NOT NULL,
+            kind TEXT NOT NULL,
+            name TEXT NOT NULL,
+            FOREIGN KEY (user_id) REFERENCES users (id),
+            UNIQUE(user_id, kind, name)
         )
     ''')
     
@@ -47,12 +781,13 @@ def init_db():
         CREATE TABLE IF NOT EXISTS expenses (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
             user_id INTEGER NOT NULL,
-            amount REAL NOT NULL,
-            category TEXT NOT NULL,
+            amount_paise INTEGER NOT NULL,
+            category_id INTEGER NOT NULL,
             description TEXT,
-            date DATE NOT NULL,
+            day INTEGER NOT NULL,
             created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            FOREIGN KEY (user_id) REFERENCES users (id)
+            FOREIGN KEY (user_id) REFERENCES users (id),
+            FOREIGN KEY (category_id) REFERENCES categories (id)
         )
     ''')
     
@@ -61,11 +796,12 @@ def init_db():
         CREATE TABLE IF NOT EXISTS income (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
             user_id INTEGER NOT NULL,
-            amount REAL NOT NULL,
-            source TEXT NOT NULL,
-            date DATE NOT NULL,
+            amount_paise INTEGER NOT NULL,
+            source_id INTEGER NOT NULL,
+            day INTEGER NOT NULL,
             created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            FOREIGN KEY (user_id) REFERENCES users (id)
+            FOREIGN KEY (user_id) REFERENCES users (id),
+            FOREIGN KEY (source_id) REFERENCES categories (id)
         )
     ''')
     
@@ -87,22 +823,112 @@ def init_db():
             id INTEGER PRIMARY KEY AUTOINCREMENT,
             habit_id INTEGER NOT NULL,
             user_id INTEGER NOT NULL,
-            date DATE NOT NULL,
+            day INTEGER NOT NULL,
             completed BOOLEAN DEFAULT 0,
             duration_minutes INTEGER DEFAULT 0,
             time_slots TEXT,
             topic TEXT,
             tasks TEXT,
             notes TEXT,
+            slot_bits INTEGER NOT NULL DEFAULT 0,
             created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
             FOREIGN KEY (habit_id) REFERENCES habits (id),
             FOREIGN KEY (user_id) REFERENCES users (id),
-            UNIQUE(habit_id, date)
+            UNIQUE(habit_id, day)
+        )
+    ''')
+    add_slot_bits(conn)
+    
+    # Recurring expense/income rules; next_day is the next occurrence not yet written (NULL once ended)
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS recurring_rules (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            kind TEXT NOT NULL,
+            amount_paise INTEGER NOT NULL,
+            category_id INTEGER NOT NULL,
+            description TEXT,
+            frequency TEXT NOT NULL,
+            every INTEGER NOT NULL DEFAULT 1,
+            start_day INTEGER NOT NULL,
+            end_day INTEGER,
+            occurrences INTEGER NOT NULL DEFAULT 0,
+            next_day INTEGER,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (user_id) REFERENCES users (id),
+            FOREIGN KEY (category_id) REFERENCES categories (id)
+        )
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_recurring_rules_due ON recurring_rules (user_id, next_day)')
+    
+    create_indexes(conn)
+    create_search_index(conn)
+    create_budget_tables(conn)
+    create_sync_tables(conn)
+    create_savings_tables(conn)
+    
+    # Generated monthly insights, keyed by user and month
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS insights_cache (
+            user_id INTEGER NOT NULL,
+            year INTEGER NOT NULL,
+            month INTEGER NOT NULL,
+            payload TEXT NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (user_id, year, month),
+            FOREIGN KEY (user_id) REFERENCES users (id)
+        )
+    ''')
+
+    # Habit/spending correlations per month over the [start_day, end_day) window they cover
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS correlation_cache (
+            user_id INTEGER NOT NULL,
+            year INTEGER NOT NULL,
+            month INTEGER NOT NULL,
+            start_day INTEGER NOT NULL,
+            end_day INTEGER NOT NULL,
+            payload TEXT NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (user_id, year, month),
+            FOREIGN KEY (user_id) REFERENCES users (id)
+        )
+    ''')
+
+def init_db():
+    """Initialize database with required tables"""
+    # Use direct connection for initialization
+    conn = connect(DB_PATH)
+    cursor = conn.cursor()
+    
+    # Users table
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS users (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            username TEXT UNIQUE NOT NULL,
+            email TEXT UNIQUE NOT NULL,
+            password_hash TEXT NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
         )
     ''')
     
+    # Which shard file holds each user's rows (absent means DB_PATH itself)
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS user_shards (
+            user_id INTEGER PRIMARY KEY,
+            shard TEXT NOT NULL,
+            FOREIGN KEY (user_id) REFERENCES users (id)
+        )
+    ''')
+    
+    # DB_PATH also holds the rows of users that have not been moved to a shard
+    create_user_tables(conn)
     conn.commit()
     conn.close()
+    _ready_shards.add(MAIN_SHARD)
+    
+    for shard in all_shards():
+        get_shard_connection(shard).close()
     print("Database initialized successfully!")
 
 if __name__ == '__main__':
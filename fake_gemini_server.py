@@ -0,0 +1,89 @@
+"""
+Local fake Gemini server for exercising the AI gateway without the real API
+Start it, then run the app with GEMINI_API_ENDPOINT=http://127.0.0.1:8089
+
+    python fake_gemini_server.py --latency 5 --failure-rate 0.3
+"""
+import argparse
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+SETTINGS = {'latency': 0.0, 'failure_rate': 0.0, 'reply': 'This is a reply from the fake Gemini server.'}
+STATS = {'requests': 0, 'failures': 0}
+_stats_lock = threading.Lock()
+
+
+class FakeGeminiHandler(BaseHTTPRequestHandler):
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length', 0))
+        request_body = json.loads(self.rfile.read(length) or b'{}')
+        wants_json = request_body.get('generationConfig', {}).get('responseMimeType') == 'application/json'
+
+        with _stats_lock:
+            STATS['requests'] += 1
+            request_number = STATS['requests']
+
+        time.sleep(SETTINGS['latency'])
+
+        if random.random() < SETTINGS['failure_rate']:
+            with _stats_lock:
+                STATS['failures'] += 1
+            self._send(503, {'error': {'code': 503, 'message': 'Fake overload', 'status': 'UNAVAILABLE'}})
+            return
+
+        text = SETTINGS['reply']
+        if wants_json:
+            text = json.dumps({
+                'summary': text,
+                'comparison': 'About the same as last month.',
+                'suggestions': ['Set a weekly food budget', 'Log expenses daily', 'Keep your study routine']
+            })
+
+        self._send(200, {
+            'candidates': [{
+                'content': {'parts': [{'text': text}], 'role': 'model'},
+                'finishReason': 'STOP',
+                'index': 0
+            }],
+            'usageMetadata': {'promptTokenCount': length // 4, 'candidatesTokenCount': 12, 'totalTokenCount': length // 4 + 12}
+        })
+        print(f"#{request_number} {self.path} -> 200")
+
+    def do_GET(self):
+        # /stats lets a test check how many upstream calls were actually made
+        self._send(200, STATS)
+
+    def _send(self, status, payload):
+        body = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Fake Gemini generateContent server')
+    parser.add_argument('--port', type=int, default=8089)
+    parser.add_argument('--latency', type=float, default=0.0, help='seconds to wait before answering')
+    parser.add_argument('--failure-rate', type=float, default=0.0, help='fraction of requests answered with 503')
+    parser.add_argument('--reply', default=SETTINGS['reply'], help='text returned by the model')
+    args = parser.parse_args()
+
+    SETTINGS.update(latency=args.latency, failure_rate=args.failure_rate, reply=args.reply)
+    server = ThreadingHTTPServer(('127.0.0.1', args.port), FakeGeminiHandler)
+    print(f"🤖 Fake Gemini listening on http://127.0.0.1:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
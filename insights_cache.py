@@ -0,0 +1,62 @@
+"""
+Cache of generated monthly insights
+Rows live in the insights_cache table and are dropped whenever the month they describe changes
+"""
+import json
+from datetime import datetime
+from database import get_db
+from ai_advisor import generate_ai_insights
+from correlations import invalidate_correlations
+
+
+def get_cached_insights(user_id, year, month):
+    """Return cached insights for the month, or None"""
+    with get_db(user_id) as conn:
+        row = conn.execute(
+            'SELECT payload FROM insights_cache WHERE user_id = ? AND year = ? AND month = ?',
+            (user_id, year, month)
+        ).fetchone()
+    return json.loads(row['payload']) if row else None
+
+
+def store_insights(user_id, year, month, insights):
+    """Save insights for the month, replacing any previous entry"""
+    with get_db(user_id) as conn:
+        conn.execute(
+            'INSERT OR REPLACE INTO insights_cache (user_id, year, month, payload) VALUES (?, ?, ?, ?)',
+            (user_id, year, month, json.dumps(insights))
+        )
+        conn.commit()
+
+
+def invalidate_insights(conn, user_id, *dates):
+    """
+    Drop cached insights affected by a change on the given YYYY-MM-DD dates.
+    Each month is also compared against in the following month's insights, so both go,
+    as do cached correlations whose window covers the month.
+    Runs on the caller's connection so it commits together with the write.
+    """
+    invalidate_correlations(conn, user_id, *dates)
+    for date in dates:
+        if not date:
+            continue
+        day = datetime.strptime(str(date)[:10], '%Y-%m-%d')
+        next_year, next_month = (day.year + 1, 1) if day.month == 12 else (day.year, day.month + 1)
+        conn.execute('''
+            DELETE FROM insights_cache
+            WHERE user_id = ? AND ((year = ? AND month = ?) OR (year = ? AND month = ?))
+        ''', (user_id, day.year, day.month, next_year, next_month))
+
+
+def get_or_generate_insights(user_id, year, month, refresh=False):
+    """Serve insights from the cache, generating and caching them on a miss"""
+    if not refresh:
+        cached = get_cached_insights(user_id, year, month)
+        if cached is not None:
+            return cached
+
+    insights = generate_ai_insights(user_id, year, month)
+    # Fallback summaries are not cached so the next request tries the model again
+    if insights.get('ai_generated'):
+        store_insights(user_id, year, month, insights)
+    return insights
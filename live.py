@@ -0,0 +1,163 @@
+"""
+Live stat updates over Server-Sent Events
+Every write already lands in change_log (see sync.py) in the same transaction, so the
+database itself is the broker: one poller thread per worker process watches each shard's
+PRAGMA data_version (a cheap check that changes when any process commits) and, for the
+users with an open stream in this process, reads which of them changed, recomputes their
+stats once and sends each stream only the values that moved. Works unchanged across
+gunicorn workers, uvicorn workers and shards.
+"""
+import json
+import os
+import threading
+import time
+from datetime import date
+
+from database import connect_readonly, get_read_db, shard_for_user, shard_path
+
+LIVE_POLL_MS = float(os.getenv('LIVE_POLL_MS', '250'))
+LIVE_HEARTBEAT_SECONDS = 15     # comment line sent on idle streams so proxies keep them open
+HABIT_TABLES = ('habits', 'habit_logs')
+
+
+def format_event(event, data):
+    """One SSE message"""
+    return f"event: {event}\ndata: {json.dumps(data, separators=(',', ':'))}\n\n"
+
+
+def stat_delta(old, new):
+    """Values of new that differ from old; streaks (habit_id -> streak) are compared per habit"""
+    delta = {key: value for key, value in new.items() if key != 'streaks' and old.get(key) != value}
+    old_streaks = old.get('streaks', {})
+    streaks = [streak for habit_id, streak in new['streaks'].items() if old_streaks.get(habit_id) != streak]
+    if streaks:
+        delta['streaks'] = streaks
+    return delta
+
+
+class LiveBroker:
+    """
+    Fans stat changes out to this process's streams. snapshot(user_id, streaks) returns the
+    user's stats with 'streaks' as {habit_id: {...}}, or without it when streaks is False.
+    """
+
+    def __init__(self, snapshot, interval=LIVE_POLL_MS / 1000):
+        self.snapshot = snapshot
+        self.interval = interval
+        self._subscribers = {}    # user_id -> set of deliver(event, data) callables
+        self._last = {}           # user_id -> last snapshot sent to its streams
+        self._since = {}          # user_id -> change_log seq before its first snapshot, until the next poll
+        self._watch = {}          # shard path -> [connection, data_version, last change_log seq]
+        self._today = date.today()
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def subscribe(self, user_id, deliver):
+        """Register a stream; it gets the full stats first. Returns a function that unregisters it"""
+        # Commits after this seq may be missing from the snapshot; the next poll checks for them
+        with get_read_db(user_id) as conn:
+            since = conn.execute('SELECT COALESCE(MAX(seq), 0) FROM change_log').fetchone()[0]
+        current = self.snapshot(user_id, True)
+        with self._lock:
+            self._subscribers.setdefault(user_id, set()).add(deliver)
+            self._last[user_id] = current
+            self._since[user_id] = min(since, self._since.get(user_id, since))
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='live-broker', daemon=True)
+                self._thread.start()
+        deliver('stats', {**current, 'streaks': list(current['streaks'].values())})
+
+        def unsubscribe():
+            with self._lock:
+                streams = self._subscribers.get(user_id, set())
+                streams.discard(deliver)
+                if not streams:
+                    self._subscribers.pop(user_id, None)
+                    self._last.pop(user_id, None)
+                    self._since.pop(user_id, None)
+        return unsubscribe
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            try:
+                self.poll()
+            except Exception as e:
+                print(f"Live updates poll failed: {e}")
+
+    def poll(self):
+        """Publish the changes committed since the last poll"""
+        with self._lock:
+            user_ids = set(self._subscribers)
+            since, self._since = self._since, {}
+
+        if date.today() != self._today:
+            # Today's totals and streaks move at midnight without any write
+            self._today = date.today()
+            changed = {user_id: True for user_id in user_ids}
+        else:
+            changed = {}
+            by_path = {}
+            for user_id in user_ids:
+                by_path.setdefault(shard_path(shard_for_user(user_id)), set()).add(user_id)
+            for path, users in by_path.items():
+                changed.update(self._changed_users(path, users))
+                changed.update(self._changed_since(path, users, since, changed))
+
+        for user_id, habits in changed.items():
+            self.publish(user_id, habits)
+
+    def _changed_users(self, path, users):
+        """user_id -> whether habits changed, for the given users with commits since the last poll"""
+        watch = self._watch.get(path)
+        if watch is None:
+            conn = connect_readonly(path)
+            seq = conn.execute('SELECT COALESCE(MAX(seq), 0) FROM change_log').fetchone()[0]
+            self._watch[path] = [conn, conn.execute('PRAGMA data_version').fetchone()[0], seq]
+            return {}
+
+        conn, version, seq = watch
+        current = conn.execute('PRAGMA data_version').fetchone()[0]
+        if current == version:
+            return {}
+        rows = conn.execute(f'''
+            SELECT user_id, MAX(tbl IN {HABIT_TABLES}) AS habits, MAX(seq) AS seq
+            FROM change_log WHERE seq > ? GROUP BY user_id
+        ''', (seq,)).fetchall()
+        watch[1] = current
+        watch[2] = max([seq] + [row['seq'] for row in rows])
+        return {row['user_id']: bool(row['habits']) for row in rows if row['user_id'] in users}
+
+    def _changed_since(self, path, users, since, changed):
+        """
+        user_id -> whether habits changed, for newly subscribed users with commits after the seq read
+        before their first snapshot: the watch may have passed those commits before they subscribed
+        """
+        conn = self._watch[path][0]
+        result = {}
+        for user_id in users & since.keys():
+            habits = conn.execute(f'''
+                SELECT MAX(tbl IN {HABIT_TABLES}) FROM change_log WHERE user_id = ? AND seq > ?
+            ''', (user_id, since[user_id])).fetchone()[0]
+            if habits is not None:
+                result[user_id] = bool(habits) or changed.get(user_id, False)
+        return result
+
+    def publish(self, user_id, habits=True):
+        """Recompute a user's stats and send what changed to their streams"""
+        with self._lock:
+            old = self._last.get(user_id)
+        if old is None:
+            return
+        new = self.snapshot(user_id, habits)
+        if not habits:
+            new['streaks'] = old['streaks']
+        delta = stat_delta(old, new)
+        with self._lock:
+            if user_id not in self._last:
+                return
+            self._last[user_id] = new
+            streams = list(self._subscribers.get(user_id, ()))
+        if delta:
+            for deliver in streams:
+                deliver('stats', delta)
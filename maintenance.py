@@ -0,0 +1,301 @@
+"""
+Database maintenance: online backups, WAL checkpoints, planner statistics and vacuum
+Covers the main database, every shard file and the yearly archives.
+
+    python maintenance.py                        # run whatever is due (cron-friendly)
+    python maintenance.py --loop                 # stay running and run tasks when due
+    python maintenance.py --only backup          # run one task now (repeatable)
+
+Tasks and how often they come due:
+    checkpoint  every 15 min   PRAGMA wal_checkpoint(TRUNCATE) once writes pause
+    optimize    every 6 h      ANALYZE the first time, then PRAGMA optimize and an FTS merge
+    vacuum      daily          PRAGMA incremental_vacuum in small batches
+    backup      daily          sqlite3 backup API, copied in page batches into backups/<timestamp>/
+
+Every step keeps a short busy timeout and backs off while the app is writing, so
+maintenance waits for the app rather than the other way round. Last runs and
+durations are kept in .maintenance_state.json.
+"""
+import argparse
+import json
+import os
+import shutil
+import sqlite3
+import time
+from datetime import datetime
+
+from database import init_db, all_shards, shard_path, archive_path, archive_years
+
+TASK_INTERVALS = {
+    'checkpoint': 15 * 60,
+    'optimize': 6 * 3600,
+    'vacuum': 24 * 3600,
+    'backup': 24 * 3600
+}
+
+STATE_PATH = '.maintenance_state.json'
+BACKUP_DIR = os.getenv('BACKUP_DIR', 'backups')
+BACKUP_KEEP = int(os.getenv('BACKUP_KEEP', '7'))
+
+BUSY_TIMEOUT_MS = 2000      # how long one maintenance statement waits for a lock
+QUIET_SECONDS = 2.0         # no WAL writes for this long counts as a quiet window
+QUIET_WAIT_SECONDS = 60     # give up on a database if it never goes quiet
+BACKUP_PAGES = 1024         # pages copied per backup step
+BACKUP_PAUSE = 0.02         # pause between backup steps, grows while the source is busy
+BACKUP_MAX_RESTARTS = 3     # writes restart a paged backup; after this many, copy in one step
+VACUUM_PAGES = 256          # free pages released per incremental_vacuum batch
+VACUUM_PAUSE = 0.02         # pause between vacuum batches, grows while the app is writing
+
+
+def open_db(path):
+    """Autocommit connection with a short busy timeout, so maintenance gives way to the app"""
+    conn = sqlite3.connect(path, timeout=BUSY_TIMEOUT_MS / 1000, isolation_level=None)
+    conn.execute(f'PRAGMA busy_timeout={BUSY_TIMEOUT_MS}')
+    return conn
+
+
+def database_files():
+    """(name, path) of every database file to maintain"""
+    files = [(shard, shard_path(shard)) for shard in all_shards()]
+    files += [(f'archive{year}', archive_path(year)) for year in archive_years()]
+    return [(name, path) for name, path in files if os.path.exists(path)]
+
+
+def last_write_age(path):
+    """Seconds since the database (or its WAL) was last written"""
+    mtimes = [os.path.getmtime(p) for p in (path, path + '-wal') if os.path.exists(p)]
+    return time.time() - max(mtimes)
+
+
+def wait_for_quiet(path):
+    """Wait until nothing has written to the database for QUIET_SECONDS; False after QUIET_WAIT_SECONDS"""
+    deadline = time.monotonic() + QUIET_WAIT_SECONDS
+    while True:
+        age = last_write_age(path)
+        if age >= QUIET_SECONDS:
+            return True
+        if time.monotonic() + QUIET_SECONDS - age > deadline:
+            return False
+        time.sleep(QUIET_SECONDS - age)
+
+
+def checkpoint(path):
+    """Fold the WAL back into the database file and truncate it"""
+    conn = open_db(path)
+    try:
+        if conn.execute('PRAGMA journal_mode').fetchone()[0] != 'wal':
+            return 'not in WAL mode'
+        wal_path = path + '-wal'
+        wal_size = os.path.getsize(wal_path) if os.path.exists(wal_path) else 0
+        if not wait_for_quiet(path):
+            # Still copy what it can without waiting on readers or writers
+            busy, log_frames, done = conn.execute('PRAGMA wal_checkpoint(PASSIVE)').fetchone()
+            return f'never quiet, passive checkpoint of {done}/{log_frames} frames'
+        busy, log_frames, done = conn.execute('PRAGMA wal_checkpoint(TRUNCATE)').fetchone()
+        if busy:
+            return f'busy, checkpointed {done}/{log_frames} frames'
+        return f'WAL {wal_size // 1024} KiB -> 0'
+    finally:
+        conn.close()
+
+
+def optimize(path):
+    """Refresh planner statistics and merge full-text index segments"""
+    conn = open_db(path)
+    try:
+        has_stats = conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'sqlite_stat1'"
+        ).fetchone()
+        if has_stats:
+            # Only re-analyses tables whose size changed a lot, sampling at most 1000 rows per index
+            conn.execute('PRAGMA analysis_limit=1000')
+            conn.execute('PRAGMA optimize')
+            detail = 'PRAGMA optimize'
+        else:
+            conn.execute('ANALYZE')
+            detail = 'ANALYZE'
+        has_search = conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'search_index'"
+        ).fetchone()
+        if has_search:
+            conn.execute("INSERT INTO search_index (search_index, rank) VALUES ('merge', 500)")
+            detail += ', search index merge'
+        return detail
+    finally:
+        conn.close()
+
+
+def vacuum(path):
+    """Return free pages to the filesystem a batch at a time"""
+    conn = open_db(path)
+    try:
+        free_pages = conn.execute('PRAGMA freelist_count').fetchone()[0]
+        if free_pages == 0:
+            return 'no free pages'
+        if conn.execute('PRAGMA auto_vacuum').fetchone()[0] != 2:
+            # Files created before auto_vacuum=INCREMENTAL need one full VACUUM to switch over
+            if not wait_for_quiet(path):
+                return f'{free_pages} free pages, never quiet enough to convert'
+            conn.execute('PRAGMA auto_vacuum=INCREMENTAL')
+            conn.execute('VACUUM')
+            return f'converted to incremental auto_vacuum, released {free_pages} pages'
+
+        if not wait_for_quiet(path):
+            return f'{free_pages} free pages, never quiet'
+        released = 0
+        pause = VACUUM_PAUSE
+        data_version = conn.execute('PRAGMA data_version').fetchone()[0]
+        while free_pages > 0:
+            batch_started = time.monotonic()
+            # executescript steps the pragma to completion; execute() would free a single page
+            conn.executescript(f'PRAGMA incremental_vacuum({VACUUM_PAGES})')
+            batch_time = time.monotonic() - batch_started
+            remaining = conn.execute('PRAGMA freelist_count').fetchone()[0]
+            released += free_pages - remaining
+            free_pages = remaining
+            # data_version moves when another connection commits: the app is writing, so space batches out
+            version = conn.execute('PRAGMA data_version').fetchone()[0]
+            if version != data_version or batch_time > 0.25:
+                pause = min(pause * 2, 2.0)
+            else:
+                pause = max(pause / 2, VACUUM_PAUSE)
+            data_version = version
+            time.sleep(pause)
+        return f'released {released} pages'
+    finally:
+        conn.close()
+
+
+def backup(path, target_dir):
+    """Online copy of a live database through the backup API, in page batches"""
+    target = os.path.join(target_dir, os.path.basename(path))
+    tmp_target = target + '.tmp'
+    source = open_db(path)
+    stats = {'pause': BACKUP_PAUSE, 'remaining': None, 'restarts': 0, 'step_started': time.monotonic()}
+
+    def progress(status, remaining, total):
+        step_time = time.monotonic() - stats['step_started']
+        restarted = stats['remaining'] is not None and remaining >= stats['remaining']
+        if restarted:
+            # Another connection wrote to the source, so SQLite started the copy over
+            stats['restarts'] += 1
+            if stats['restarts'] > BACKUP_MAX_RESTARTS:
+                raise InterruptedError
+        stats['remaining'] = remaining
+        # Slow steps and restarts mean the source is busy: back off harder, then ease off again
+        if step_time > 0.25 or restarted:
+            stats['pause'] = min(stats['pause'] * 2, 2.0)
+        else:
+            stats['pause'] = max(stats['pause'] / 2, BACKUP_PAUSE)
+        time.sleep(stats['pause'])
+        stats['step_started'] = time.monotonic()
+
+    try:
+        target_conn = sqlite3.connect(tmp_target)
+        try:
+            try:
+                source.backup(target_conn, pages=BACKUP_PAGES, progress=progress, sleep=0.25)
+                mode = f'{BACKUP_PAGES}-page steps'
+            except InterruptedError:
+                # Too many writes to finish in steps: copy in one go (in WAL mode writers keep going)
+                source.backup(target_conn, pages=-1)
+                mode = 'single step'
+            page_count = target_conn.execute('PRAGMA page_count').fetchone()[0]
+        finally:
+            target_conn.close()
+        os.replace(tmp_target, target)
+    finally:
+        source.close()
+        if os.path.exists(tmp_target):
+            os.remove(tmp_target)
+    return f'{page_count} pages in {mode}, {stats["restarts"]} restarts -> {target}'
+
+
+def prune_backups(keep=BACKUP_KEEP):
+    """Delete all but the newest `keep` backup directories"""
+    if not os.path.isdir(BACKUP_DIR):
+        return
+    runs = sorted(d for d in os.listdir(BACKUP_DIR) if os.path.isdir(os.path.join(BACKUP_DIR, d)))
+    for old in runs[:-keep] if keep > 0 else []:
+        shutil.rmtree(os.path.join(BACKUP_DIR, old))
+        print(f"   🧹 removed old backup {old}")
+
+
+def load_state():
+    if os.path.exists(STATE_PATH):
+        with open(STATE_PATH) as f:
+            return json.load(f)
+    return {}
+
+
+def save_state(state):
+    tmp_path = STATE_PATH + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(state, f, indent=2, sort_keys=True)
+    os.replace(tmp_path, STATE_PATH)
+
+
+def run_task(task, state):
+    """Run one task over every database file and record when it ran and how long it took"""
+    print(f"🔧 {task}")
+    started = time.monotonic()
+    if task == 'backup':
+        target_dir = os.path.join(BACKUP_DIR, datetime.now().strftime('%Y%m%d-%H%M%S'))
+        os.makedirs(target_dir, exist_ok=True)
+
+    durations = {}
+    for name, path in database_files():
+        step_started = time.monotonic()
+        try:
+            if task == 'backup':
+                detail = backup(path, target_dir)
+            else:
+                detail = {'checkpoint': checkpoint, 'optimize': optimize, 'vacuum': vacuum}[task](path)
+            outcome = '✅'
+        except sqlite3.OperationalError as e:
+            # Typically "database is locked": leave it for the next run
+            detail = str(e)
+            outcome = '⚠️ '
+        durations[name] = round(time.monotonic() - step_started, 3)
+        print(f"   {outcome} {name}: {detail} ({durations[name]:.2f}s)")
+
+    if task == 'backup':
+        prune_backups()
+
+    elapsed = time.monotonic() - started
+    state[task] = {'last_run': time.time(), 'duration': round(elapsed, 3), 'databases': durations}
+    save_state(state)
+    print(f"   {task} finished in {elapsed:.2f}s")
+
+
+def due_tasks(state, now=None):
+    now = now or time.time()
+    return [task for task, interval in TASK_INTERVALS.items()
+            if now - state.get(task, {}).get('last_run', 0) >= interval]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Back up, checkpoint, analyse and vacuum the databases')
+    parser.add_argument('--only', action='append', choices=list(TASK_INTERVALS),
+                        help='run this task now, whether due or not (repeatable)')
+    parser.add_argument('--loop', action='store_true', help='keep running and run tasks as they come due')
+    args = parser.parse_args()
+
+    init_db()
+    state = load_state()
+    if args.only:
+        for task in args.only:
+            run_task(task, state)
+        return
+
+    while True:
+        for task in due_tasks(state):
+            run_task(task, state)
+        if not args.loop:
+            break
+        next_due = min(state[task]['last_run'] + interval for task, interval in TASK_INTERVALS.items())
+        time.sleep(max(next_due - time.time(), 1))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,42 @@
+"""
+Database migration to the per-user categories dictionary
+Replaces expenses.category and income.source text with ids into the categories table.
+Run this after stopping the app (the app also performs it on startup).
+"""
+import sqlite3
+
+from database import upgrade_to_integer_storage, upgrade_to_category_ids, create_indexes
+
+DB_PATH = 'finhabits.db'
+
+def migrate_database():
+    """Build the categories dictionary and point expenses/income at it"""
+    conn = sqlite3.connect(DB_PATH)
+
+    try:
+        # The dictionary migration expects the integer amount/day layout
+        upgrade_to_integer_storage(conn)
+        converted = upgrade_to_category_ids(conn)
+        if converted:
+            for table in converted:
+                print(f"✓ Converted {table}")
+        else:
+            print("✓ Tables already use category ids")
+
+        create_indexes(conn)
+        conn.commit()
+
+        count = conn.execute('SELECT COUNT(*) FROM categories').fetchone()[0]
+        print(f"\n✅ Database migration completed successfully! ({count} dictionary entries)")
+
+    except Exception as e:
+        print(f"\n❌ Migration error: {e}")
+        conn.rollback()
+
+    finally:
+        conn.close()
+
+if __name__ == '__main__':
+    print("🔄 Starting database migration to the categories dictionary...")
+    print("=" * 60)
+    migrate_database()
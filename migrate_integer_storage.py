@@ -0,0 +1,44 @@
+"""
+Database migration to integer money and date storage
+Converts REAL amounts to integer paise and DATE text to day numbers (days since 1970-01-01)
+in expenses, income, savings and habit_logs. Run this after stopping the app.
+The app also performs this conversion on startup; this script additionally vacuums and reports sizes.
+"""
+import os
+import sqlite3
+
+from database import upgrade_to_integer_storage, create_indexes
+
+DB_PATH = 'finhabits.db'
+
+def migrate_database():
+    """Rebuild legacy tables into the integer layout and reclaim the freed space"""
+    size_before = os.path.getsize(DB_PATH)
+    conn = sqlite3.connect(DB_PATH)
+
+    try:
+        converted = upgrade_to_integer_storage(conn)
+        if converted:
+            for table in converted:
+                print(f"✓ Converted {table}")
+        else:
+            print("✓ Tables already use integer storage")
+
+        create_indexes(conn)
+        conn.commit()
+
+        conn.execute('VACUUM')
+        size_after = os.path.getsize(DB_PATH)
+        print(f"\n✅ Database migration completed successfully! ({size_before:,} → {size_after:,} bytes)")
+
+    except Exception as e:
+        print(f"\n❌ Migration error: {e}")
+        conn.rollback()
+
+    finally:
+        conn.close()
+
+if __name__ == '__main__':
+    print("🔄 Starting database migration to integer money and date storage...")
+    print("=" * 60)
+    migrate_database()
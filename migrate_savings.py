@@ -20,9 +20,9 @@ def migrate_database():
                 CREATE TABLE savings (
                     id INTEGER PRIMARY KEY AUTOINCREMENT,
                     user_id INTEGER NOT NULL,
-                    amount REAL NOT NULL,
+                    amount_paise INTEGER NOT NULL,
                     goal TEXT,
-                    date DATE NOT NULL,
+                    day INTEGER NOT NULL,
                     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
                     FOREIGN KEY (user_id) REFERENCES users (id)
                 )
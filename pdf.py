@@ -0,0 +1,121 @@
+"""
+Minimal PDF writer for server-rendered reports
+Each page is compressed and written to the file as soon as it is finished, so only the
+object offsets stay in memory however long the document gets. Text uses the standard
+Helvetica fonts every PDF viewer ships with, so nothing is embedded; text is limited to
+Latin-1 and other characters print as '?'.
+"""
+import zlib
+
+PAGE_WIDTH = 595      # A4 in points
+PAGE_HEIGHT = 842
+
+# style -> (resource name, base font)
+FONTS = {
+    'regular': ('F1', 'Helvetica'),
+    'bold': ('F2', 'Helvetica-Bold'),
+    'italic': ('F3', 'Helvetica-Oblique')
+}
+FIRST_FONT_OBJECT = 3     # 1 is the catalog, 2 the page tree
+
+# Helvetica advance widths (1/1000 em) of the characters amounts and dates are made of;
+# anything else counts as AVERAGE_WIDTH, close enough for centering and right-aligning
+CHAR_WIDTHS = {**dict.fromkeys('0123456789', 556), '.': 278, ',': 278, ' ': 278, '-': 333, ':': 278,
+               '/': 278, '%': 889, 'R': 722, 's': 500}
+AVERAGE_WIDTH = 520
+
+
+def text_width(text, size):
+    """Approximate width of text in points"""
+    return sum(CHAR_WIDTHS.get(char, AVERAGE_WIDTH) for char in text) * size / 1000
+
+
+def _escape(text):
+    text = ' '.join(str(text).split()).encode('latin-1', 'replace').decode('latin-1')
+    return text.replace('\\', '\\\\').replace('(', '\\(').replace(')', '\\)')
+
+
+def _rgb(color):
+    return ' '.join(f'{value / 255:.3f}' for value in color)
+
+
+class PdfWriter:
+    """
+    Writes a PDF to a binary file page by page: begin_page(), then text(), rect() and line()
+    with y measured from the top of the page, end_page(), and close() once at the end.
+    """
+
+    def __init__(self, file, title=''):
+        self.file = file
+        self.title = title
+        self._position = 0
+        self._offsets = {}
+        self._pages = []
+        self._ops = None
+        self._next_object = FIRST_FONT_OBJECT + len(FONTS)
+        self._write(b'%PDF-1.4\n%\xe2\xe3\xcf\xd3\n')
+        for number, (_, base_font) in enumerate(FONTS.values(), FIRST_FONT_OBJECT):
+            self._object(number, f'<< /Type /Font /Subtype /Type1 /BaseFont /{base_font} '
+                                 f'/Encoding /WinAnsiEncoding >>')
+
+    def _write(self, data):
+        self.file.write(data)
+        self._position += len(data)
+
+    def _object(self, number, body):
+        if isinstance(body, str):
+            body = body.encode('latin-1')
+        self._offsets[number] = self._position
+        self._write(b'%d 0 obj\n%s\nendobj\n' % (number, body))
+
+    def _allocate(self):
+        number = self._next_object
+        self._next_object += 1
+        return number
+
+    def begin_page(self):
+        self._ops = []
+
+    def text(self, x, y, text, size=10, style='regular', color=(0, 0, 0)):
+        """Text with its baseline at y"""
+        font = FONTS[style][0]
+        self._ops.append(f'BT /{font} {size} Tf {_rgb(color)} rg {x:.2f} {PAGE_HEIGHT - y:.2f} Td '
+                         f'({_escape(text)}) Tj ET')
+
+    def rect(self, x, y, width, height, color):
+        """Filled rectangle with its top left corner at (x, y)"""
+        self._ops.append(f'{_rgb(color)} rg {x:.2f} {PAGE_HEIGHT - y - height:.2f} {width:.2f} {height:.2f} re f')
+
+    def line(self, x1, y1, x2, y2, color, width=0.5):
+        self._ops.append(f'{_rgb(color)} RG {width} w {x1:.2f} {PAGE_HEIGHT - y1:.2f} m '
+                         f'{x2:.2f} {PAGE_HEIGHT - y2:.2f} l S')
+
+    def end_page(self):
+        content = zlib.compress('\n'.join(self._ops).encode('latin-1'))
+        self._ops = None
+        content_number = self._allocate()
+        self._object(content_number, b'<< /Length %d /Filter /FlateDecode >>\nstream\n%s\nendstream'
+                     % (len(content), content))
+        fonts = ' '.join(f'/{name} {number} 0 R'
+                         for number, (name, _) in enumerate(FONTS.values(), FIRST_FONT_OBJECT))
+        page_number = self._allocate()
+        self._object(page_number, f'<< /Type /Page /Parent 2 0 R /MediaBox [0 0 {PAGE_WIDTH} {PAGE_HEIGHT}] '
+                                  f'/Resources << /Font << {fonts} >> >> /Contents {content_number} 0 R >>')
+        self._pages.append(page_number)
+
+    def close(self):
+        """Finish the open page and write the page tree, catalog and cross-reference table"""
+        if self._ops is not None:
+            self.end_page()
+        kids = ' '.join(f'{number} 0 R' for number in self._pages)
+        self._object(2, f'<< /Type /Pages /Kids [{kids}] /Count {len(self._pages)} >>')
+        self._object(1, '<< /Type /Catalog /Pages 2 0 R >>')
+        info = self._allocate()
+        self._object(info, f'<< /Title ({_escape(self.title)}) /Producer (FinHabits) >>')
+
+        xref = self._position
+        lines = [f'xref\n0 {self._next_object}\n', '0000000000 65535 f \n']
+        lines += [f'{self._offsets[number]:010d} 00000 n \n' for number in range(1, self._next_object)]
+        lines.append(f'trailer\n<< /Size {self._next_object} /Root 1 0 R /Info {info} 0 R >>\n'
+                     f'startxref\n{xref}\n%%EOF\n')
+        self._write(''.join(lines).encode('latin-1'))
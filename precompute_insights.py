@@ -0,0 +1,176 @@
+"""
+Nightly precomputation of monthly AI insights
+Walks users who were active in the target month and fills the insights cache,
+so /api/insights is a cache read when everyone opens last month's insights.
+
+    python precompute_insights.py                     # previous month
+    python precompute_insights.py --month 2026-01 --workers 4 --rate 2
+
+Run it from cron (or any scheduler) shortly after midnight, e.g.
+    15 0 * * * cd /path/to/FinHabits && python precompute_insights.py
+Interrupted runs resume from the checkpoint file.
+"""
+import argparse
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime
+from dotenv import load_dotenv
+
+# Load .env before ai_advisor reads GEMINI_API_KEY
+load_dotenv()
+
+from database import get_shard_connection, all_shards, init_db, month_days
+from insights_cache import get_cached_insights, get_or_generate_insights
+from recurring import materialize as materialize_recurring
+import ai_gateway
+
+
+class RateLimiter:
+    """Spaces calls at least 1/rate seconds apart across all worker threads"""
+
+    def __init__(self, rate):
+        self.interval = 1.0 / rate if rate > 0 else 0
+        self.next_slot = time.monotonic()
+        self._lock = threading.Lock()
+
+    def wait(self):
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self.next_slot)
+            self.next_slot = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
+
+
+class Checkpoint:
+    """JSON file of user ids already done for a month, rewritten after each user"""
+
+    def __init__(self, path):
+        self.path = path
+        self.done = set()
+        self._lock = threading.Lock()
+        if os.path.exists(path):
+            with open(path) as f:
+                self.done = set(json.load(f).get('done', []))
+
+    def mark_done(self, user_id):
+        with self._lock:
+            self.done.add(user_id)
+            tmp_path = self.path + '.tmp'
+            with open(tmp_path, 'w') as f:
+                json.dump({'done': sorted(self.done)}, f)
+            os.replace(tmp_path, self.path)
+
+
+def previous_month(today=None):
+    today = today or datetime.now()
+    return (today.year - 1, 12) if today.month == 1 else (today.year, today.month - 1)
+
+
+def get_active_users(year, month):
+    """Users with any expense, income or habit log dated in the month, or a recurring rule running in it"""
+    start, end = month_days(year, month)
+    user_ids = set()
+    for shard in all_shards():
+        conn = get_shard_connection(shard)
+        try:
+            rows = conn.execute('''
+                SELECT user_id FROM expenses WHERE day >= ? AND day < ?
+                UNION
+                SELECT user_id FROM income WHERE day >= ? AND day < ?
+                UNION
+                SELECT user_id FROM habit_logs WHERE day >= ? AND day < ?
+                UNION
+                SELECT user_id FROM recurring_rules WHERE start_day < ? AND (end_day IS NULL OR end_day >= ?)
+            ''', (start, end, start, end, start, end, end, start)).fetchall()
+        finally:
+            conn.close()
+        user_ids.update(row['user_id'] for row in rows)
+    return sorted(user_ids)
+
+
+def precompute_user(user_id, year, month, limiter, force):
+    """Fill the cache for one user; returns 'cached', 'generated' or 'fallback'"""
+    # Like /api/insights: write the month's recurring entries first, or the first request writes
+    # them, which drops the precomputed insights and pays for a second model call
+    materialize_recurring(user_id, month_days(year, month)[1])
+    if not force and get_cached_insights(user_id, year, month) is not None:
+        return 'cached'
+    limiter.wait()
+    insights = get_or_generate_insights(user_id, year, month, refresh=True)
+    return 'generated' if insights.get('ai_generated') else 'fallback'
+
+
+def run(year, month, workers, rate, checkpoint_path, force):
+    init_db()
+    checkpoint = Checkpoint(checkpoint_path)
+    user_ids = [u for u in get_active_users(year, month) if u not in checkpoint.done]
+    total = len(user_ids)
+
+    print(f"📅 Precomputing insights for {year}-{month:02d}")
+    print(f"👥 {total} active users to process ({len(checkpoint.done)} already done)")
+    print(f"⚙️  {workers} workers, {rate} calls/sec")
+
+    limiter = RateLimiter(rate)
+    counts = {'cached': 0, 'generated': 0, 'fallback': 0, 'error': 0}
+    started = time.monotonic()
+    stopped = threading.Event()
+
+    def work(user_id):
+        if stopped.is_set():
+            return None
+        return precompute_user(user_id, year, month, limiter, force)
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = {pool.submit(work, user_id): user_id for user_id in user_ids}
+        for processed, future in enumerate(as_completed(futures), start=1):
+            user_id = futures[future]
+            try:
+                outcome = future.result()
+            except Exception as e:
+                print(f"   ❌ user {user_id}: {e}")
+                outcome = 'error'
+            if outcome is None:
+                continue
+
+            counts[outcome] += 1
+            # Fallbacks and errors stay out of the checkpoint so a rerun retries them
+            if outcome in ('cached', 'generated'):
+                checkpoint.mark_done(user_id)
+
+            elapsed = time.monotonic() - started
+            eta = elapsed / processed * (total - processed)
+            print(f"   [{processed}/{total}] user {user_id}: {outcome} (elapsed {elapsed:.0f}s, eta {eta:.0f}s)")
+
+            if ai_gateway.breaker.state == 'open' and not stopped.is_set():
+                print("⚠️  AI circuit breaker is open, stopping early. Rerun to resume from the checkpoint.")
+                stopped.set()
+
+    print(f"\n✅ Done in {time.monotonic() - started:.1f}s: {counts['generated']} generated, "
+          f"{counts['cached']} already cached, {counts['fallback']} fallback, {counts['error']} errors")
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Precompute monthly AI insights into the insights cache')
+    parser.add_argument('--month', help='YYYY-MM to precompute (default: previous month)')
+    parser.add_argument('--workers', type=int, default=4, help='concurrent users in flight')
+    parser.add_argument('--rate', type=float, default=2.0, help='max model calls per second')
+    parser.add_argument('--checkpoint', help='checkpoint file (default: .precompute_insights_YYYY-MM.json)')
+    parser.add_argument('--force', action='store_true', help='regenerate even if already cached')
+    args = parser.parse_args()
+
+    if args.month:
+        year, month = (int(part) for part in args.month.split('-'))
+    else:
+        year, month = previous_month()
+
+    checkpoint_path = args.checkpoint or f'.precompute_insights_{year}-{month:02d}.json'
+    run(year, month, args.workers, args.rate, checkpoint_path, args.force)
+
+
+if __name__ == '__main__':
+    main()
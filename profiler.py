@@ -0,0 +1,184 @@
+"""
+Sampling profiler for Flask routes
+Profiles 1 in PROFILE_SAMPLE_RATE requests, plus any request carrying an X-Profile header
+equal to PROFILE_TOKEN. While a profiled request runs, one background thread records
+its Python stack every PROFILE_INTERVAL_MS; nothing is traced and unprofiled requests pay
+only a random draw. Stacks are aggregated per endpoint and written to PROFILE_DIR as
+collapsed stacks (<endpoint>.folded), ready for flamegraph.pl or https://speedscope.app.
+
+    PROFILE_SAMPLE_RATE=100 python app.py        # profile about 1% of requests
+    curl -H "X-Profile: $PROFILE_TOKEN" ...      # profile this request
+    python profiler.py                           # slowest functions per endpoint
+    python profiler.py expenses                  # the same for one endpoint
+"""
+import atexit
+import glob
+import json
+import os
+import random
+import sys
+import threading
+import time
+from collections import Counter
+
+from flask import request
+
+PROFILE_SAMPLE_RATE = int(os.getenv('PROFILE_SAMPLE_RATE', '0'))     # 1 in N requests, 0 = off
+PROFILE_TOKEN = os.getenv('PROFILE_TOKEN', '')                       # X-Profile value that forces profiling
+PROFILE_INTERVAL_MS = float(os.getenv('PROFILE_INTERVAL_MS', '5'))
+PROFILE_DIR = os.getenv('PROFILE_DIR', 'profiles')
+PROFILE_FLUSH_SECONDS = 30    # how often aggregated stacks are rewritten to PROFILE_DIR
+MAX_DEPTH = 80
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+FLASK_DIR = os.sep + 'flask' + os.sep
+
+
+def _label(code):
+    """'function (file:line)'; files outside the app keep their package, e.g. flask/app.py"""
+    path = code.co_filename
+    if path.startswith(APP_DIR + os.sep):
+        name = os.path.relpath(path, APP_DIR)
+    else:
+        name = os.path.join(os.path.basename(os.path.dirname(path)), os.path.basename(path))
+    return f"{code.co_name} ({name}:{code.co_firstlineno})"
+
+
+def collapse(frame):
+    """'root;...;leaf' for a frame, starting at Flask's dispatch_request so server frames are left out"""
+    labels = []
+    while frame is not None and len(labels) < MAX_DEPTH:
+        code = frame.f_code
+        labels.append(_label(code))
+        if code.co_name == 'dispatch_request' and FLASK_DIR in code.co_filename:
+            break
+        frame = frame.f_back
+    return ';'.join(reversed(labels))
+
+
+class SamplingProfiler:
+    """Samples the stacks of registered threads from one background thread"""
+
+    def __init__(self, interval):
+        self.interval = interval
+        self.stacks = {}          # endpoint -> Counter of collapsed stacks
+        self.requests = Counter()
+        self.seconds = Counter()
+        self._active = {}         # thread id -> endpoint
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+        self._last_flush = time.monotonic()
+
+    def start(self, endpoint):
+        with self._lock:
+            self._active[threading.get_ident()] = endpoint
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='profiler', daemon=True)
+                self._thread.start()
+        self._wake.set()
+
+    def stop(self, elapsed):
+        with self._lock:
+            endpoint = self._active.pop(threading.get_ident(), None)
+            if endpoint is None:
+                return
+            self.requests[endpoint] += 1
+            self.seconds[endpoint] += elapsed
+            if not self._active:
+                self._wake.clear()
+        if time.monotonic() - self._last_flush >= PROFILE_FLUSH_SECONDS:
+            self.flush()
+
+    def _run(self):
+        while True:
+            # Sleeps until a profiled request starts, so an idle profiler costs nothing
+            self._wake.wait()
+            time.sleep(self.interval)
+            with self._lock:
+                active = dict(self._active)
+            if not active:
+                continue
+            frames = sys._current_frames()
+            samples = [(endpoint, collapse(frames[ident])) for ident, endpoint in active.items() if ident in frames]
+            with self._lock:
+                for endpoint, stack in samples:
+                    self.stacks.setdefault(endpoint, Counter())[stack] += 1
+
+    def flush(self):
+        """Rewrite <endpoint>.folded and summary.json in PROFILE_DIR"""
+        with self._lock:
+            self._last_flush = time.monotonic()
+            stacks = {endpoint: dict(counts) for endpoint, counts in self.stacks.items()}
+            summary = {endpoint: {'requests': count, 'seconds': round(self.seconds[endpoint], 3),
+                                  'samples': sum(stacks.get(endpoint, {}).values())}
+                       for endpoint, count in self.requests.items()}
+        if not summary:
+            return
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        for endpoint, counts in stacks.items():
+            path = os.path.join(PROFILE_DIR, f'{endpoint}.folded')
+            with open(path + '.tmp', 'w') as f:
+                for stack, count in sorted(counts.items()):
+                    f.write(f'{stack} {count}\n')
+            os.replace(path + '.tmp', path)
+        with open(os.path.join(PROFILE_DIR, 'summary.json'), 'w') as f:
+            json.dump(summary, f, indent=2, sort_keys=True)
+
+
+profiler = SamplingProfiler(PROFILE_INTERVAL_MS / 1000)
+
+
+def _should_profile():
+    if PROFILE_TOKEN and request.headers.get('X-Profile') == PROFILE_TOKEN:
+        return True
+    return PROFILE_SAMPLE_RATE > 0 and random.randrange(PROFILE_SAMPLE_RATE) == 0
+
+
+def init_profiler(app):
+    """Register the request hooks when sampling or a profile token is configured"""
+    if PROFILE_SAMPLE_RATE <= 0 and not PROFILE_TOKEN:
+        return
+
+    @app.before_request
+    def start_profile():
+        if request.endpoint and request.endpoint != 'static' and _should_profile():
+            request.environ['finhabits.profile_started'] = time.perf_counter()
+            profiler.start(request.endpoint)
+
+    @app.teardown_request
+    def stop_profile(error=None):
+        started = request.environ.get('finhabits.profile_started')
+        if started is not None:
+            profiler.stop(time.perf_counter() - started)
+
+    atexit.register(profiler.flush)
+    print(f"Profiling 1 in {PROFILE_SAMPLE_RATE or '-'} requests"
+          f"{' and X-Profile requests' if PROFILE_TOKEN else ''} into {PROFILE_DIR}/")
+
+
+def top_functions(path, limit=15):
+    """Total samples in a .folded file and its top (self samples, total samples, function) by self time"""
+    own, total = Counter(), Counter()
+    for line in open(path):
+        stack, _, count = line.rstrip('\n').rpartition(' ')
+        frames = stack.split(';')
+        own[frames[-1]] += int(count)
+        for name in set(frames):
+            total[name] += int(count)
+    return sum(own.values()), [(count, total[name], name) for name, count in own.most_common(limit)]
+
+
+if __name__ == '__main__':
+    pattern = f'{sys.argv[1]}.folded' if len(sys.argv) > 1 else '*.folded'
+    paths = sorted(glob.glob(os.path.join(PROFILE_DIR, pattern)))
+    if not paths:
+        print(f"No profiles in {PROFILE_DIR}/ yet (set PROFILE_SAMPLE_RATE or PROFILE_TOKEN)")
+        sys.exit(1)
+
+    for path in paths:
+        samples, rows = top_functions(path)
+        print(f"📊 {os.path.basename(path)[:-len('.folded')]} ({samples} samples)")
+        print(f"   {'self':>6} {'total':>6}  function")
+        for own, total, name in rows:
+            print(f"   {own / samples:6.1%} {total / samples:6.1%}  {name}")
+        print()
@@ -0,0 +1,198 @@
+"""
+Prompt builder for Gemini calls
+Keeps prompts inside a token budget and defines the JSON shape insights come back in
+"""
+import json
+import os
+
+INSIGHTS_PROMPT_BUDGET = int(os.getenv('INSIGHTS_PROMPT_BUDGET', '500'))
+CHATBOT_PROMPT_BUDGET = int(os.getenv('CHATBOT_PROMPT_BUDGET', '800'))
+
+# Row caps for the chatbot context; the SQL uses these as LIMITs too
+CHATBOT_MAX_EXPENSE_ROWS = 10
+CHATBOT_MAX_INCOME_ROWS = 5
+CHATBOT_MAX_QUESTION_CHARS = 500
+
+# Categories beyond this many are folded into a single "other" entry
+MAX_CATEGORIES = 6
+
+# Strongest habit/spending correlations included in the insights prompt
+MAX_HABIT_LINKS = 3
+
+INSIGHTS_SCHEMA = {
+    'type': 'object',
+    'properties': {
+        'summary': {'type': 'string'},
+        'comparison': {'type': 'string'},
+        'suggestions': {'type': 'array', 'items': {'type': 'string'}}
+    },
+    'required': ['summary', 'comparison', 'suggestions']
+}
+
+INSIGHTS_GENERATION_CONFIG = {
+    'response_mime_type': 'application/json',
+    'response_schema': INSIGHTS_SCHEMA
+}
+
+
+def estimate_tokens(text):
+    """Rough token count (about 4 characters per token), good enough for budgeting"""
+    return (len(text) + 3) // 4
+
+
+def compact_categories(category_spending, limit=MAX_CATEGORIES):
+    """Render category totals on one line, largest first, with the tail folded into 'other'"""
+    items = sorted(category_spending.items(), key=lambda x: x[1], reverse=True)
+    total = sum(amount for _, amount in items)
+    if len(items) > limit:
+        items = items[:limit - 1] + [('other', sum(amount for _, amount in items[limit - 1:]))]
+
+    parts = []
+    for category, amount in items:
+        share = f' ({amount / total * 100:.0f}%)' if total > 0 else ''
+        parts.append(f'{category} {amount:.0f}{share}')
+    return ', '.join(parts) if parts else 'none'
+
+
+def fit_lines(fixed_text, lines, budget):
+    """Return the prefix of lines that fits in the budget left over after fixed_text"""
+    used = estimate_tokens(fixed_text)
+    kept = []
+    for line in lines:
+        cost = estimate_tokens(line) + 1
+        if used + cost > budget:
+            break
+        kept.append(line)
+        used += cost
+    return kept
+
+
+def describe_habit_link(link):
+    """One correlations.py finding as a short line, e.g. 'Gym done -> food spending 120 vs 210 on skipped days ...'"""
+    when = {0: 'same day', 1: 'next day'}.get(link['lag_days'], f"{link['lag_days']} days later")
+    spending = 'total spending' if link['category'] == 'total' else f"{link['category']} spending"
+    return (f"{link['habit']} done -> {spending} {link['avg_spend_done']:.0f} vs "
+            f"{link['avg_spend_skipped']:.0f} on skipped days ({when}, r={link['correlation']:+.2f})")
+
+
+def build_insights_prompt(year, month, current, previous, habit_statuses, habit_links=()):
+    """
+    Build the monthly insights prompt.
+    current/previous are dicts with total_income, total_expenses, category_spending (and year/month for previous);
+    habit_statuses is a list of (habit name, regularity label); habit_links are correlations.py findings, strongest first.
+    """
+    header = (
+        "You are a friendly financial advisor for a student. Amounts are in ₹.\n"
+        f"This month ({year}-{month:02d}): income {current['total_income']:.0f}, "
+        f"expenses {current['total_expenses']:.0f}, "
+        f"net {current['total_income'] - current['total_expenses']:.0f}\n"
+        f"Categories: {compact_categories(current['category_spending'])}\n"
+        f"Previous month ({previous['year']}-{previous['month']:02d}): income {previous['total_income']:.0f}, "
+        f"expenses {previous['total_expenses']:.0f}; categories: {compact_categories(previous['category_spending'], limit=3)}\n"
+    )
+    instructions = (
+        "Reply with JSON only: summary = 2-3 encouraging sentences on their finances, "
+        "comparison = 1-2 sentences against the previous month, "
+        "suggestions = 3 specific, actionable tips for spending or habits. "
+        "Comment on habit regularity but never give habit day counts. "
+        "No predictions or financial guarantees."
+    )
+    if habit_links:
+        instructions += " Where a habit link stands out, mention how that habit goes with spending."
+
+    habit_lines = [f'{name}: {status}' for name, status in habit_statuses]
+    kept = fit_lines(header + instructions + 'Habits: \n', habit_lines, INSIGHTS_PROMPT_BUDGET)
+    habits_text = '; '.join(kept) if kept else 'none tracked'
+    if len(kept) < len(habit_lines):
+        habits_text += f'; +{len(habit_lines) - len(kept)} more'
+
+    links_text = ''
+    if habit_links:
+        link_lines = [describe_habit_link(link) for link in habit_links[:MAX_HABIT_LINKS]]
+        kept_links = fit_lines(header + f'Habits: {habits_text}\n' + instructions + 'Habit links: \n',
+                               link_lines, INSIGHTS_PROMPT_BUDGET)
+        if kept_links:
+            links_text = f"Habit links: {'; '.join(kept_links)}\n"
+
+    return f"{header}Habits: {habits_text}\n{links_text}{instructions}"
+
+
+def build_chatbot_prompt(question, today, stats, category_spending, recent_income, recent_expenses, habits):
+    """
+    Build the chatbot context for the last 30 days.
+    stats holds total_income, total_expenses, income_count and expense_count; recent rows are newest first.
+    """
+    question = question[:CHATBOT_MAX_QUESTION_CHARS]
+    net_balance = stats['total_income'] - stats['total_expenses']
+    habit_text = ', '.join(
+        f"{h['name']} {h['completed_days']}/{h['total_tracked_days']}" for h in habits
+    ) if habits else 'none tracked'
+
+    head = (
+        "You are a personal financial advisor chatbot. Amounts are in ₹.\n"
+        f"Last 30 days to {today}: income {stats['total_income']:,.2f} ({stats['income_count']} entries), "
+        f"expenses {stats['total_expenses']:,.2f} ({stats['expense_count']} entries), "
+        f"net {net_balance:,.2f}{' (saving)' if net_balance > 0 else ' (overspending)'}\n"
+        f"By category: {compact_categories(category_spending)}\n"
+        f"Habits (days completed/tracked): {habit_text}\n"
+    )
+    tail = (
+        "Answer with specific, personalized advice using their numbers, strictly 50 to 80 words, "
+        "friendly, supportive and actionable.\n"
+        f"Question: {question}\n"
+    )
+
+    # Individual rows are the first thing to go when the budget is tight
+    rows = [f"- income {i['source']}: {i['amount']:,.2f} on {i['date']}" for i in recent_income]
+    rows += [f"- {e['category']}: {e['amount']:,.2f} on {e['date']} ({e['description'] or '-'})" for e in recent_expenses]
+    kept = fit_lines(head + tail + 'Recent entries:\n', rows, CHATBOT_PROMPT_BUDGET)
+
+    recent_text = 'Recent entries:\n' + '\n'.join(kept) + '\n' if kept else ''
+    return head + recent_text + tail
+
+
+def _validate(value, schema, path='reply'):
+    """Check value against the small JSON-schema subset used by INSIGHTS_SCHEMA"""
+    expected = schema['type']
+    if expected == 'object':
+        if not isinstance(value, dict):
+            raise ValueError(f'{path} should be an object')
+        for key in schema.get('required', []):
+            if key not in value:
+                raise ValueError(f'{path}.{key} is missing')
+        for key, sub_schema in schema.get('properties', {}).items():
+            if key in value:
+                _validate(value[key], sub_schema, f'{path}.{key}')
+    elif expected == 'array':
+        if not isinstance(value, list):
+            raise ValueError(f'{path} should be a list')
+        for index, item in enumerate(value):
+            _validate(item, schema['items'], f'{path}[{index}]')
+    elif expected == 'string':
+        if not isinstance(value, str):
+            raise ValueError(f'{path} should be a string')
+
+
+def parse_insights_reply(text):
+    """Parse and validate the model's JSON insights; raises ValueError if it does not match the schema"""
+    text = text.strip()
+    if text.startswith('```'):
+        # Tolerate a fenced block even though JSON mode should not produce one
+        text = text.strip('`')
+        text = text[text.find('{'):]
+
+    try:
+        data = json.loads(text)
+    except json.JSONDecodeError as e:
+        raise ValueError(f'Insights reply is not valid JSON: {e}')
+
+    _validate(data, INSIGHTS_SCHEMA)
+    suggestions = [s.strip() for s in data['suggestions'] if s.strip()]
+    if not data['summary'].strip() or not suggestions:
+        raise ValueError('Insights reply is missing a summary or suggestions')
+
+    return {
+        'summary': data['summary'].strip(),
+        'comparison': data['comparison'].strip(),
+        'suggestions': suggestions[:5]
+    }
@@ -0,0 +1,226 @@
+"""
+Rebalance users across database shards
+Moves every user whose rows are not on the shard the SHARDS setting assigns them, e.g.
+after first enabling sharding or after changing the shard count. Stop the app first:
+running workers cache which shard each user lives on.
+
+    SHARDS=8 python rebalance_shards.py             # spread users over 8 shard files
+    SHARDS=user python rebalance_shards.py          # one file per user
+    SHARDS=0 python rebalance_shards.py             # fold everyone back into finhabits.db
+    SHARDS=8 python rebalance_shards.py --dry-run   # only show the moves
+
+A move copies the user's rows into the target shard and checks the counts, then
+switches the directory entry, then deletes the old copy. An interrupted run leaves
+at most a stale copy, which the next run cleans up.
+"""
+import argparse
+import glob
+import os
+import time
+
+from database import (init_db, connect, get_shard_connection, shard_path, shard_for_user, hash_shard,
+                      assign_shard, DB_PATH, MAIN_SHARD, SHARDS, USER_TABLES)
+
+# Rows get fresh ids in the target shard, so these references are remapped on the way
+ID_REFERENCES = {
+    'expenses': ('category_id', 'categories'),
+    'income': ('source_id', 'categories'),
+    'habit_logs': ('habit_id', 'habits'),
+    'recurring_rules': ('category_id', 'categories'),
+    'budgets': ('category_id', 'categories'),
+    'budget_alerts': ('category_id', 'categories'),
+    'savings': ('goal_id', 'savings_goals')
+}
+
+# Totals the triggers rebuild as the referencing rows are copied in
+TRIGGER_COLUMNS = {
+    'savings_goals': ('saved_paise', 'contributions')
+}
+
+
+def table_exists(conn, schema, table):
+    return conn.execute(
+        f"SELECT 1 FROM {schema}.sqlite_master WHERE type = 'table' AND name = ?", (table,)
+    ).fetchone() is not None
+
+
+def table_columns(conn, schema, table):
+    return [row[1] for row in conn.execute(f'PRAGMA {schema}.table_info({table})')]
+
+
+def shard_files():
+    """Main database plus every shard file on disk"""
+    base, ext = os.path.splitext(DB_PATH)
+    shards = [MAIN_SHARD]
+    for path in sorted(glob.glob(f'{base}_shard*{ext}') + glob.glob(f'{base}_user*{ext}')):
+        shards.append(os.path.basename(path)[len(os.path.basename(base)) + 1:-len(ext) or None])
+    return shards
+
+
+def copy_user(conn, user_id):
+    """Copy one user's rows from the attached 'src' shard into conn's database; returns rows per table"""
+    conn.execute('DELETE FROM id_map')
+    counts = {}
+
+    # Leftovers from an interrupted earlier move would otherwise be duplicated
+    for table in reversed(USER_TABLES):
+        if table_exists(conn, 'main', table):
+            conn.execute(f'DELETE FROM main.{table} WHERE user_id = ?', (user_id,))
+
+    for table in USER_TABLES:
+        if not table_exists(conn, 'src', table):
+            continue
+        if not table_exists(conn, 'main', table):
+            create_sql = conn.execute(
+                "SELECT sql FROM src.sqlite_master WHERE type = 'table' AND name = ?", (table,)
+            ).fetchone()[0]
+            conn.execute(create_sql)
+
+        source_columns = table_columns(conn, 'src', table)
+        columns = [c for c in table_columns(conn, 'main', table)
+                   if c in source_columns and c != 'id' and c not in TRIGGER_COLUMNS.get(table, ())]
+        column_list = ', '.join(columns)
+
+        if table in ('categories', 'habits', 'savings_goals'):
+            # Referenced rows go one at a time so their new ids can be recorded
+            rows = conn.execute(
+                f'SELECT id, {column_list} FROM src.{table} WHERE user_id = ?', (user_id,)
+            ).fetchall()
+            for row in rows:
+                cursor = conn.execute(
+                    f'INSERT INTO main.{table} ({column_list}) VALUES ({", ".join("?" * len(columns))})',
+                    tuple(row)[1:]
+                )
+                conn.execute('INSERT INTO id_map (tbl, old_id, new_id) VALUES (?, ?, ?)',
+                             (table, row[0], cursor.lastrowid))
+        else:
+            reference = ID_REFERENCES.get(table)
+            select = ', '.join('m.new_id' if reference and c == reference[0] else f's.{c}' for c in columns)
+            join = (f"JOIN id_map m ON m.tbl = '{reference[1]}' AND m.old_id = s.{reference[0]}"
+                    if reference else '')
+            conn.execute(f'''
+                INSERT INTO main.{table} ({column_list})
+                SELECT {select} FROM src.{table} s {join} WHERE s.user_id = ?
+            ''', (user_id,))
+
+        copied = conn.execute(f'SELECT COUNT(*) FROM main.{table} WHERE user_id = ?', (user_id,)).fetchone()[0]
+        expected = conn.execute(f'SELECT COUNT(*) FROM src.{table} WHERE user_id = ?', (user_id,)).fetchone()[0]
+        if copied != expected:
+            raise RuntimeError(f'{table}: copied {copied} of {expected} rows')
+        counts[table] = copied
+
+    # The copies have new ids, so sync cursors from before the move must start over
+    conn.execute('''
+        INSERT OR REPLACE INTO main.sync_resets (user_id, seq)
+        SELECT ?, COALESCE(MAX(seq), 0) FROM main.change_log WHERE user_id = ?
+    ''', (user_id, user_id))
+    return counts
+
+
+def delete_user_rows(shard, user_id):
+    """Remove a user's rows from one shard"""
+    conn = get_shard_connection(shard)
+    try:
+        for table in reversed(USER_TABLES):
+            if table_exists(conn, 'main', table):
+                conn.execute(f'DELETE FROM {table} WHERE user_id = ?', (user_id,))
+        # Deleting the rows logged tombstones the user will never sync from here
+        for table in ('change_log', 'sync_resets'):
+            if table_exists(conn, 'main', table):
+                conn.execute(f'DELETE FROM {table} WHERE user_id = ?', (user_id,))
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def move_user(user_id, source, target):
+    """Copy, switch the directory entry, then delete the old rows; returns rows per table"""
+    conn = get_shard_connection(target)
+    try:
+        conn.execute('CREATE TEMP TABLE IF NOT EXISTS id_map (tbl TEXT, old_id INTEGER, new_id INTEGER, '
+                     'PRIMARY KEY (tbl, old_id))')
+        conn.execute('ATTACH DATABASE ? AS src', (shard_path(source),))
+        conn.execute('BEGIN')
+        try:
+            counts = copy_user(conn, user_id)
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        conn.execute('DETACH DATABASE src')
+    finally:
+        conn.close()
+
+    directory = connect(DB_PATH)
+    try:
+        assign_shard(directory, user_id, target)
+        directory.commit()
+    finally:
+        directory.close()
+
+    delete_user_rows(source, user_id)
+    return counts
+
+
+def purge_stale_rows():
+    """Delete rows left on a shard the directory no longer points to (from interrupted moves)"""
+    purged = 0
+    for shard in shard_files():
+        conn = get_shard_connection(shard)
+        try:
+            tables = [t for t in USER_TABLES if table_exists(conn, 'main', t)]
+            user_ids = {row[0] for t in tables for row in conn.execute(f'SELECT DISTINCT user_id FROM {t}')}
+        finally:
+            conn.close()
+        for user_id in sorted(user_ids):
+            if shard_for_user(user_id) != shard:
+                print(f"   🧹 removing stale copy of user {user_id} from {shard}")
+                delete_user_rows(shard, user_id)
+                purged += 1
+    return purged
+
+
+def rebalance(dry_run=False):
+    init_db()
+    directory = connect(DB_PATH)
+    try:
+        user_ids = [row['id'] for row in directory.execute('SELECT id FROM users ORDER BY id')]
+    finally:
+        directory.close()
+
+    moves = [(user_id, shard_for_user(user_id), hash_shard(user_id)) for user_id in user_ids]
+    moves = [(user_id, source, target) for user_id, source, target in moves if source != target]
+    print(f"🔀 SHARDS={SHARDS}: {len(moves)} of {len(user_ids)} users need to move")
+
+    started = time.monotonic()
+    moved = failed = 0
+    for user_id, source, target in moves:
+        if dry_run:
+            print(f"   user {user_id}: {source} → {target}")
+            continue
+        try:
+            counts = move_user(user_id, source, target)
+            moved += 1
+            detail = ', '.join(f'{count} {table}' for table, count in counts.items() if count)
+            print(f"   ✅ user {user_id}: {source} → {target} ({detail or 'no rows'})")
+        except Exception as e:
+            failed += 1
+            print(f"   ❌ user {user_id}: {source} → {target} failed: {e}")
+
+    if dry_run:
+        return
+
+    purged = purge_stale_rows()
+    print(f"\n✅ Moved {moved} users in {time.monotonic() - started:.1f}s "
+          f"({failed} failed, {purged} stale copies removed)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Move users to the shard the SHARDS setting assigns them')
+    parser.add_argument('--dry-run', action='store_true', help='list the moves without changing anything')
+    args = parser.parse_args()
+    rebalance(args.dry_run)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,176 @@
+"""
+Recurring expenses and income
+A rule stores one amount, category (or income source) and schedule. Its occurrences are
+written into the expenses or income table lazily, only up to the day being looked at.
+Each rule remembers how many occurrences it has produced and the day of the next one
+(next_day, indexed), so a request with nothing due costs one index lookup and catching
+up after months away is one batch insert.
+
+    python recurring.py      # write everything due up to today for every user (cron-friendly)
+"""
+import calendar
+from datetime import date
+from database import (get_db, get_read_db, get_shard_connection, all_shards, init_db, get_category_id,
+                      to_paise, from_paise, to_day, from_day)
+from insights_cache import invalidate_insights
+
+FREQUENCIES = ('daily', 'weekly', 'monthly')
+MAX_EVERY = 366
+
+
+def occurrence_day(start_day, frequency, every, n):
+    """Day of a rule's n-th occurrence (0 is the start); monthly rules keep the start's day of month, clamped"""
+    if frequency == 'daily':
+        return start_day + n * every
+    if frequency == 'weekly':
+        return start_day + 7 * n * every
+    start = date.fromisoformat(from_day(start_day))
+    months = start.month - 1 + n * every
+    year, month = start.year + months // 12, months % 12 + 1
+    return to_day(date(year, month, min(start.day, calendar.monthrange(year, month)[1])))
+
+
+def _default_through():
+    """Occurrences are written up to and including today, never for future days"""
+    return to_day(date.today()) + 1
+
+
+def materialize_rules(conn, user_id, through_day):
+    """Write occurrences of the user's rules due before through_day on conn (caller commits); returns the count"""
+    rules = conn.execute(
+        'SELECT * FROM recurring_rules WHERE user_id = ? AND next_day < ?', (user_id, through_day)
+    ).fetchall()
+
+    expenses, income, months = [], [], set()
+    for rule in rules:
+        days = []
+        n, day = rule['occurrences'], rule['next_day']
+        while day is not None and day < through_day:
+            days.append(day)
+            n += 1
+            day = occurrence_day(rule['start_day'], rule['frequency'], rule['every'], n)
+            if rule['end_day'] is not None and day > rule['end_day']:
+                day = None
+
+        # Claim the occurrences: a concurrent request that got here first has already moved the counter on
+        claimed = conn.execute(
+            'UPDATE recurring_rules SET occurrences = ?, next_day = ? WHERE id = ? AND occurrences = ?',
+            (n, day, rule['id'], rule['occurrences'])
+        ).rowcount
+        if not claimed:
+            continue
+        if rule['kind'] == 'expense':
+            expenses.extend((user_id, rule['amount_paise'], rule['category_id'], rule['description'], d) for d in days)
+        else:
+            income.extend((user_id, rule['amount_paise'], rule['category_id'], d) for d in days)
+        months.update(from_day(d)[:7] + '-01' for d in days)
+
+    conn.executemany(
+        'INSERT INTO expenses (user_id, amount_paise, category_id, description, day) VALUES (?, ?, ?, ?, ?)',
+        expenses
+    )
+    conn.executemany('INSERT INTO income (user_id, amount_paise, source_id, day) VALUES (?, ?, ?, ?)', income)
+    if months:
+        invalidate_insights(conn, user_id, *sorted(months))
+    return len(expenses) + len(income)
+
+
+def materialize(user_id, through_day=None):
+    """Bring the user's recurring entries up to through_day (exclusive, capped at today); returns entries written"""
+    through_day = min(through_day or _default_through(), _default_through())
+    # Cheap check on the read connection first; the write connection is only opened when something is due
+    with get_read_db(user_id) as conn:
+        due = conn.execute(
+            'SELECT 1 FROM recurring_rules WHERE user_id = ? AND next_day < ? LIMIT 1', (user_id, through_day)
+        ).fetchone()
+    if not due:
+        return 0
+    with get_db(user_id) as conn:
+        created = materialize_rules(conn, user_id, through_day)
+        conn.commit()
+    return created
+
+
+def _rule(row):
+    return {
+        'id': row['id'],
+        'type': row['kind'],
+        'amount': from_paise(row['amount_paise']),
+        'category': row['category'],
+        'description': row['description'],
+        'frequency': row['frequency'],
+        'every': row['every'],
+        'start_date': from_day(row['start_day']),
+        'end_date': from_day(row['end_day']) if row['end_day'] is not None else None,
+        'occurrences': row['occurrences'],
+        'next_date': from_day(row['next_day']) if row['next_day'] is not None else None
+    }
+
+
+def get_rules(user_id):
+    with get_read_db(user_id) as conn:
+        rows = conn.execute('''
+            SELECT r.*, c.name AS category FROM recurring_rules r
+            JOIN categories c ON c.id = r.category_id
+            WHERE r.user_id = ?
+            ORDER BY r.next_day IS NULL, r.next_day, r.id
+        ''', (user_id,)).fetchall()
+    return [_rule(row) for row in rows]
+
+
+def add_rule(user_id, kind, amount, category, description='', frequency='monthly', every=1,
+             start_date=None, end_date=None):
+    """Store a rule and write any occurrences already due; returns the new rule id"""
+    if kind not in ('expense', 'income'):
+        raise ValueError('Type must be expense or income')
+    if frequency not in FREQUENCIES:
+        raise ValueError(f'Frequency must be one of {", ".join(FREQUENCIES)}')
+    every = int(every)
+    if not 1 <= every <= MAX_EVERY:
+        raise ValueError(f'Every must be between 1 and {MAX_EVERY}')
+    amount_paise = to_paise(amount)
+    if amount_paise <= 0:
+        raise ValueError('Amount must be greater than zero')
+    start_day = to_day(start_date or date.today())
+    end_day = to_day(end_date) if end_date else None
+    if end_day is not None and end_day < start_day:
+        raise ValueError('End date must not be before the start date')
+
+    with get_db(user_id) as conn:
+        cursor = conn.execute('''
+            INSERT INTO recurring_rules
+                (user_id, kind, amount_paise, category_id, description, frequency, every, start_day, end_day, next_day)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''', (user_id, kind, amount_paise, get_category_id(conn, user_id, kind, category), description,
+              frequency, every, start_day, end_day, start_day))
+        materialize_rules(conn, user_id, _default_through())
+        conn.commit()
+    return cursor.lastrowid
+
+
+def delete_rule(user_id, rule_id):
+    """Stop a rule; entries it already wrote stay as ordinary expenses/income. False if not found"""
+    with get_db(user_id) as conn:
+        deleted = conn.execute(
+            'DELETE FROM recurring_rules WHERE id = ? AND user_id = ?', (rule_id, user_id)
+        ).rowcount
+        conn.commit()
+    return deleted > 0
+
+
+if __name__ == '__main__':
+    init_db()
+    through_day = _default_through()
+    total = 0
+    for shard in all_shards():
+        conn = get_shard_connection(shard)
+        try:
+            user_ids = [row[0] for row in conn.execute(
+                'SELECT DISTINCT user_id FROM recurring_rules WHERE next_day < ?', (through_day,)
+            )]
+            for user_id in user_ids:
+                total += materialize_rules(conn, user_id, through_day)
+                conn.commit()
+        finally:
+            conn.close()
+    print(f"✅ Wrote {total} recurring entries up to {from_day(through_day - 1)}")
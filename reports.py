@@ -0,0 +1,327 @@
+"""
+Server-side PDF reports
+The export is rendered from aggregates SQLite computes (monthly totals, totals per category,
+source and habit, plus the most recent entries) on a background worker, so neither the
+browser nor the server ever holds a user's full history. Each report is cached in
+REPORT_DIR under the user's data version: their shard and latest change_log seq (see
+sync.py), which moves with every write to their expenses, income or habits. Asking again
+before anything changed returns the cached file at once.
+"""
+import glob
+import os
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from database import (get_read_db, shard_for_user, attached_archives, with_archives, from_day,
+                      CATEGORY_NAME, EXPENSE_FIELDS, INCOME_FIELDS, MONTH_KEY)
+from pdf import PdfWriter, PAGE_WIDTH, PAGE_HEIGHT, AVERAGE_WIDTH, text_width
+
+REPORT_DIR = os.path.abspath(os.getenv('REPORT_DIR', 'reports'))
+REPORT_WORKERS = int(os.getenv('REPORT_WORKERS', '2'))   # 0 renders inside the request instead
+REPORT_FORMAT = 1       # bump when the layout changes so cached reports are rendered again
+RECENT_ROWS = 50
+VERSION_PATTERN = re.compile(r'[A-Za-z0-9_-]+')
+
+MARGIN = 42
+TOP = 50
+BOTTOM = PAGE_HEIGHT - 60
+ROW_HEIGHT = 14
+TABLE_FONT_SIZE = 9
+FOOTER = 'FinHabits - Transform Your Financial Future'
+
+BLUE = (37, 99, 235)
+RED = (220, 38, 38)
+GREEN = (34, 197, 94)
+PURPLE = (124, 58, 237)
+GREY = (100, 100, 100)
+LIGHT_GREY = (150, 150, 150)
+RULE = (210, 210, 210)
+
+# Per-month totals; hot expenses come from the category_spend counters, already summed by month
+MONTH = MONTH_KEY.format('day')
+MONTHLY_PARTS = (
+    ('SELECT month, SUM(spent_paise) AS spent, 0 AS earned, 0 AS done, 0 AS minutes '
+     'FROM category_spend WHERE user_id = ? GROUP BY month',
+     f'SELECT {MONTH}, SUM(amount_paise), 0, 0, 0 FROM {{db}}.expenses WHERE user_id = ? GROUP BY 1'),
+    (f'SELECT {MONTH}, 0, SUM(amount_paise), 0, 0 FROM income WHERE user_id = ? GROUP BY 1',
+     f'SELECT {MONTH}, 0, SUM(amount_paise), 0, 0 FROM {{db}}.income WHERE user_id = ? GROUP BY 1'),
+    (f'SELECT {MONTH}, 0, 0, SUM(completed), SUM(duration_minutes) FROM habit_logs WHERE user_id = ? GROUP BY 1',
+     f'SELECT {MONTH}, 0, 0, SUM(completed), SUM(duration_minutes) FROM {{db}}.habit_logs WHERE user_id = ? GROUP BY 1')
+)
+CATEGORY_TOTALS = (
+    f"SELECT {CATEGORY_NAME.format('category_id')} AS name, SUM(spent_paise) AS total "
+    'FROM category_spend WHERE user_id = ? GROUP BY category_id',
+    'SELECT category, SUM(amount_paise) FROM {db}.expenses WHERE user_id = ? GROUP BY category'
+)
+SOURCE_TOTALS = (
+    f"SELECT {CATEGORY_NAME.format('source_id')} AS name, SUM(amount_paise) AS total "
+    'FROM income WHERE user_id = ? GROUP BY source_id',
+    'SELECT source, SUM(amount_paise) FROM {db}.income WHERE user_id = ? GROUP BY source'
+)
+HABIT_TOTALS = (
+    'SELECT (SELECT name FROM habits WHERE habits.id = habit_id) AS name, SUM(completed) AS done, '
+    'SUM(duration_minutes) AS minutes, MAX(CASE WHEN completed THEN day END) AS last_day '
+    'FROM habit_logs WHERE user_id = ? GROUP BY +habit_id',
+    'SELECT habit_name, SUM(completed), SUM(duration_minutes), MAX(CASE WHEN completed THEN day END) '
+    'FROM {db}.habit_logs WHERE user_id = ? GROUP BY habit_name'
+)
+RECENT_EXPENSES = f'SELECT {EXPENSE_FIELDS} FROM expenses WHERE user_id = ? ORDER BY day DESC LIMIT ?'
+RECENT_INCOME = f'SELECT {INCOME_FIELDS} FROM income WHERE user_id = ? ORDER BY day DESC LIMIT ?'
+
+_executor = ThreadPoolExecutor(REPORT_WORKERS, thread_name_prefix='report') if REPORT_WORKERS > 0 else None
+_jobs = {}      # user_id -> Future of the render in progress
+_lock = threading.Lock()
+
+
+def money(paise):
+    return f"Rs {(paise or 0) / 100:,.2f}"
+
+
+def duration(minutes):
+    minutes = minutes or 0
+    return f"{minutes // 60}h {minutes % 60}m"
+
+
+def month_label(month):
+    """YYYYMM -> 'Jan 2024'"""
+    return datetime(month // 100, month % 100, 1).strftime('%b %Y')
+
+
+def share(part, total):
+    return f"{part * 100 / total:.1f}%" if total else '-'
+
+
+def fit(text, width, size=TABLE_FONT_SIZE):
+    """text cut short with '...' so it fits in width points"""
+    text = ' '.join(str(text if text is not None else '').split())
+    if text_width(text, size) <= width:
+        return text
+    keep = max(int(width * 1000 / (AVERAGE_WIDTH * size)) - 3, 1)
+    return text[:keep] + '...'
+
+
+class ReportLayout:
+    """
+    Flows a title, headings, text lines and table rows down the pages, starting a new page
+    (with the current table's header repeated) when one fills up. Table columns are
+    (title, x, width, align) with align 'left' or 'right'.
+    """
+
+    def __init__(self, pdf):
+        self.pdf = pdf
+        self.page = 0
+        self.columns = None
+        self.y = TOP
+        self._new_page()
+
+    def _new_page(self):
+        if self.page:
+            self.pdf.end_page()
+        self.page += 1
+        self.pdf.begin_page()
+        self._center(PAGE_HEIGHT - 32, f'Page {self.page}', 8, LIGHT_GREY)
+        self._center(PAGE_HEIGHT - 22, FOOTER, 8, LIGHT_GREY)
+        self.y = TOP
+
+    def _center(self, y, text, size, color, style='regular'):
+        self.pdf.text((PAGE_WIDTH - text_width(text, size)) / 2, y, text, size, style, color)
+
+    def _room(self, height):
+        if self.y + height > BOTTOM:
+            self._new_page()
+            if self.columns:
+                self._table_header()
+
+    def title(self, text, subtitle):
+        self.y += 10
+        self._center(self.y, text, 22, BLUE, 'bold')
+        self.y += 18
+        self._center(self.y, subtitle, 10, GREY)
+        self.y += 10
+
+    def heading(self, text, color):
+        """Section heading, moved to the next page unless a few rows fit under it"""
+        self.columns = None
+        self._room(ROW_HEIGHT * 5)
+        self.y += 26
+        self.pdf.text(MARGIN, self.y, text, 14, 'bold', color)
+        self.y += 4
+
+    def line(self, text, style='regular', color=GREY):
+        self._room(ROW_HEIGHT)
+        self.y += ROW_HEIGHT
+        self.pdf.text(MARGIN + 6, self.y, text, 10, style, color)
+
+    def table(self, columns):
+        self.columns = columns
+        self._room(ROW_HEIGHT * 2)
+        self._table_header()
+
+    def _table_header(self):
+        self.y += ROW_HEIGHT
+        self._cells([title for title, _, _, _ in self.columns], 'bold')
+        self.pdf.line(MARGIN, self.y + 4, PAGE_WIDTH - MARGIN, self.y + 4, RULE)
+        self.y += 2
+
+    def row(self, values):
+        self._room(ROW_HEIGHT)
+        self.y += ROW_HEIGHT
+        self._cells(values, 'regular')
+
+    def _cells(self, values, style):
+        for (_, x, width, align), value in zip(self.columns, values):
+            text = fit(value, width)
+            if align == 'right':
+                x += width - text_width(text, TABLE_FONT_SIZE)
+            self.pdf.text(x, self.y, text, TABLE_FONT_SIZE, style)
+
+
+def _totals(conn, parts, schemas, user_id, columns='SUM(total) AS total', order='total'):
+    """Rows of name plus columns summed over the hot tables and every archive, largest first"""
+    query = with_archives(parts[0], parts[1], schemas)
+    return conn.execute(
+        f'SELECT name, {columns} FROM ({query}) GROUP BY name ORDER BY {order} DESC',
+        (user_id,) * (len(schemas) + 1)
+    )
+
+
+def write_report(layout, conn, user_id):
+    """Lay out the whole report from conn (a read snapshot with the archives attached)"""
+    schemas = attached_archives(conn)
+    monthly = ' UNION ALL '.join(with_archives(hot, archive, schemas) for hot, archive in MONTHLY_PARTS)
+    months = conn.execute(f'''
+        SELECT month, SUM(spent) AS spent, SUM(earned) AS earned, SUM(done) AS done, SUM(minutes) AS minutes
+        FROM ({monthly}) GROUP BY month ORDER BY month
+    ''', (user_id,) * (len(MONTHLY_PARTS) * (len(schemas) + 1))).fetchall()
+
+    spent = sum(row['spent'] for row in months)
+    earned = sum(row['earned'] for row in months)
+    layout.title('FinHabits Report', f"Data as of {datetime.now().strftime('%d %b %Y, %H:%M')}")
+
+    layout.heading('Summary', (0, 0, 0))
+    layout.line(f"Total Expenses: {money(spent)}")
+    layout.line(f"Total Income: {money(earned)}")
+    layout.line(f"Net Savings: {money(earned - spent)}")
+    layout.line(f"Completed Habit Logs: {sum(row['done'] or 0 for row in months)}")
+    layout.line(f"Time Logged: {duration(sum(row['minutes'] or 0 for row in months))}")
+    if months:
+        layout.line(f"Period: {month_label(months[0]['month'])} - {month_label(months[-1]['month'])}")
+    else:
+        layout.line('No entries yet', 'italic')
+
+    if months:
+        layout.heading('Monthly Overview', BLUE)
+        layout.table([('Month', MARGIN, 80, 'left'), ('Expenses', 130, 85, 'right'), ('Income', 225, 85, 'right'),
+                      ('Net', 320, 85, 'right'), ('Habit Days', 415, 60, 'right'), ('Time', 485, 68, 'right')])
+        for row in months:
+            layout.row([month_label(row['month']), money(row['spent']), money(row['earned']),
+                        money(row['earned'] - row['spent']), row['done'] or 0, duration(row['minutes'])])
+
+    if spent:
+        layout.heading('Spending by Category', RED)
+        layout.table([('Category', MARGIN, 250, 'left'), ('Total', 320, 110, 'right'), ('Share', 440, 60, 'right')])
+        for row in _totals(conn, CATEGORY_TOTALS, schemas, user_id):
+            if row['total']:
+                layout.row([row['name'], money(row['total']), share(row['total'], spent)])
+
+    if earned:
+        layout.heading('Income by Source', GREEN)
+        layout.table([('Source', MARGIN, 250, 'left'), ('Total', 320, 110, 'right'), ('Share', 440, 60, 'right')])
+        for row in _totals(conn, SOURCE_TOTALS, schemas, user_id):
+            if row['total']:
+                layout.row([row['name'], money(row['total']), share(row['total'], earned)])
+
+    habits = _totals(conn, HABIT_TOTALS, schemas, user_id,
+                     'SUM(done) AS done, SUM(minutes) AS minutes, MAX(last_day) AS last_day', 'done').fetchall()
+    if habits:
+        layout.heading('Habits', PURPLE)
+        layout.table([('Habit', MARGIN, 200, 'left'), ('Days Completed', 260, 90, 'right'),
+                      ('Time Logged', 360, 80, 'right'), ('Last Completed', 450, 100, 'right')])
+        for row in habits:
+            last = from_day(row['last_day']) if row['last_day'] is not None else '-'
+            layout.row([row['name'], row['done'] or 0, duration(row['minutes']), last])
+
+    recent = conn.execute(RECENT_EXPENSES, (user_id, RECENT_ROWS)).fetchall()
+    if recent:
+        layout.heading(f'Recent Expenses (last {len(recent)})', RED)
+        layout.table([('Date', MARGIN, 70, 'left'), ('Category', 115, 100, 'left'),
+                      ('Description', 220, 230, 'left'), ('Amount', 455, 98, 'right')])
+        for row in recent:
+            layout.row([row['date'], row['category'], row['description'], money(round(row['amount'] * 100))])
+
+    recent = conn.execute(RECENT_INCOME, (user_id, RECENT_ROWS)).fetchall()
+    if recent:
+        layout.heading(f'Recent Income (last {len(recent)})', GREEN)
+        layout.table([('Date', MARGIN, 70, 'left'), ('Source', 115, 330, 'left'), ('Amount', 455, 98, 'right')])
+        for row in recent:
+            layout.row([row['date'], row['source'], money(round(row['amount'] * 100))])
+
+
+def data_version(conn, user_id):
+    """Version tag of the user's data as seen by conn"""
+    seq = conn.execute('SELECT COALESCE(MAX(seq), 0) FROM change_log WHERE user_id = ?', (user_id,)).fetchone()[0]
+    return f'{shard_for_user(user_id)}-{seq}-r{REPORT_FORMAT}'
+
+
+def report_path(user_id, version):
+    return os.path.join(REPORT_DIR, str(int(user_id)), f'{version}.pdf')
+
+
+def render_report(user_id):
+    """Render the report for the user's current data into the cache; returns its version"""
+    with get_read_db(user_id, archives=True) as conn:
+        version = data_version(conn, user_id)
+        path = report_path(user_id, version)
+        if os.path.exists(path):
+            return version
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+        try:
+            with open(temp_path, 'wb') as f:
+                pdf = PdfWriter(f, title='FinHabits Report')
+                write_report(ReportLayout(pdf), conn, user_id)
+                pdf.close()
+            os.replace(temp_path, path)
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+
+    # Older versions can never be asked for again
+    for old in glob.glob(os.path.join(os.path.dirname(path), '*.pdf')):
+        if old != path:
+            os.remove(old)
+    return version
+
+
+def request_report(user_id):
+    """
+    {'status': 'ready' | 'rendering', 'version', 'url'} for the user's current data. A cached
+    report is ready at once; otherwise a render is started (one per user at a time) and the
+    caller asks again until the status is 'ready'.
+    """
+    with get_read_db(user_id) as conn:
+        version = data_version(conn, user_id)
+    if not os.path.exists(report_path(user_id, version)):
+        if _executor is None:
+            version = render_report(user_id)
+        else:
+            with _lock:
+                job = _jobs.get(user_id)
+                if job is not None and job.done():
+                    del _jobs[user_id]
+                    job.result()    # a failed render is reported once; the next request tries again
+                    job = None
+                if job is None:
+                    _jobs[user_id] = _executor.submit(render_report, user_id)
+            return {'status': 'rendering', 'version': version, 'url': f'/api/reports/{version}'}
+    return {'status': 'ready', 'version': version, 'url': f'/api/reports/{version}'}
+
+
+def report_file(user_id, version):
+    """Path of a cached report, or None when that version is not (or no longer) cached"""
+    if not VERSION_PATTERN.fullmatch(version):
+        raise ValueError('Invalid report version')
+    path = report_path(user_id, version)
+    return path if os.path.exists(path) else None
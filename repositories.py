@@ -0,0 +1,754 @@
+"""
+Repository layer for expenses, income, habits, habit logs and stats
+Routes and ai_advisor reach user data only through the process-wide `repos`. Amounts go in
+as integer paise and dates as day numbers; rows come back in the API's shape (rupees,
+YYYY-MM-DD), indexable by column name like sqlite3.Row. Two backends:
+
+    sqlite   the shard databases, with yearly archives in exports and all-time totals (default)
+    memory   plain dicts guarded by one lock, for benchmarking route logic without I/O
+             and for fast tests; archives, insights caching and change_log do not apply
+
+    STORAGE_BACKEND=memory python app.py
+    repos.use('memory')            # switch every caller, e.g. from a test fixture
+
+Users, recurring rules, budgets, savings goals, search, sync and the caches stay in SQLite either way.
+"""
+import os
+import threading
+from datetime import date, datetime
+
+from database import (get_db, get_read_db, get_category_id, attached_archives, with_archives, archive_years,
+                      to_day, from_day,
+                      EXPENSE_FIELDS, INCOME_FIELDS, HABIT_LOG_FIELDS, ARCHIVE_EXPENSE_FIELDS,
+                      ARCHIVE_INCOME_FIELDS, ARCHIVE_HABIT_LOG_FIELDS, API_DATE, CATEGORY_NAME)
+from insights_cache import invalidate_insights
+from recurring import materialize as materialize_recurring
+from timeslots import parse_time_slots, weekday, SLOTS, SLOT_SUMS
+from timeseries import bucket_key, full_months, BUCKET_KEYS
+
+STORAGE_BACKEND = os.getenv('STORAGE_BACKEND', 'sqlite')
+
+EXPENSE_COLUMNS = ('id', 'user_id', 'amount', 'category', 'description', 'date', 'created_at')
+INCOME_COLUMNS = ('id', 'user_id', 'amount', 'source', 'date', 'created_at')
+HABIT_COLUMNS = ('id', 'user_id', 'name', 'is_custom', 'created_at')
+HABIT_LOG_COLUMNS = ('id', 'habit_id', 'user_id', 'date', 'completed', 'duration_minutes', 'time_slots', 'topic',
+                     'tasks', 'notes', 'created_at', 'name')
+HABIT_LOG_VALUES = ('completed', 'duration_minutes', 'time_slots', 'topic', 'tasks', 'notes')
+
+
+# ==================== SQLITE ====================
+
+class SqliteEntries:
+    """Queries shared by expenses and income; writes commit together with the insights cache invalidation"""
+    table = None
+    fields = None
+    archive_fields = None
+
+    def for_day(self, user_id, day):
+        with get_read_db(user_id) as conn:
+            return conn.execute(
+                f'SELECT {self.fields} FROM {self.table} WHERE user_id = ? AND day = ? ORDER BY id DESC',
+                (user_id, day)
+            ).fetchall()
+
+    def for_range(self, user_id, start_day, end_day):
+        with get_read_db(user_id) as conn:
+            return conn.execute(f'''
+                SELECT {self.fields} FROM {self.table}
+                WHERE user_id = ? AND day >= ? AND day < ?
+                ORDER BY day DESC
+            ''', (user_id, start_day, end_day)).fetchall()
+
+    def all(self, user_id):
+        """Every entry including the yearly archives, newest first"""
+        with get_read_db(user_id, archives=True) as conn:
+            schemas = attached_archives(conn)
+            query = with_archives(
+                f'SELECT {self.fields} FROM {self.table} WHERE user_id = ?',
+                f'SELECT {self.archive_fields} FROM {{db}}.{self.table} WHERE user_id = ?',
+                schemas
+            )
+            return conn.execute(query + ' ORDER BY date DESC', (user_id,) * (len(schemas) + 1)).fetchall()
+
+    def get(self, user_id, entry_id):
+        with get_read_db(user_id) as conn:
+            return conn.execute(f'SELECT {self.fields} FROM {self.table} WHERE id = ? AND user_id = ?',
+                                (entry_id, user_id)).fetchone()
+
+    def delete(self, user_id, entry_id):
+        """False when the entry does not exist or belongs to someone else"""
+        with get_db(user_id) as conn:
+            entry = conn.execute(f'SELECT day FROM {self.table} WHERE id = ? AND user_id = ?',
+                                 (entry_id, user_id)).fetchone()
+            if entry is None:
+                return False
+            conn.execute(f'DELETE FROM {self.table} WHERE id = ?', (entry_id,))
+            invalidate_insights(conn, user_id, from_day(entry['day']))
+            conn.commit()
+        return True
+
+
+class SqliteExpenses(SqliteEntries):
+    table = 'expenses'
+    fields = EXPENSE_FIELDS
+    archive_fields = ARCHIVE_EXPENSE_FIELDS
+
+    def add(self, user_id, amount_paise, category, description, day):
+        with get_db(user_id) as conn:
+            conn.execute(
+                'INSERT INTO expenses (user_id, amount_paise, category_id, description, day) VALUES (?, ?, ?, ?, ?)',
+                (user_id, amount_paise, get_category_id(conn, user_id, 'expense', category), description, day)
+            )
+            invalidate_insights(conn, user_id, from_day(day))
+            conn.commit()
+
+    def update(self, user_id, expense_id, amount_paise, category, description, day):
+        """False when the expense does not exist or belongs to someone else"""
+        with get_db(user_id) as conn:
+            expense = conn.execute('SELECT day FROM expenses WHERE id = ? AND user_id = ?',
+                                   (expense_id, user_id)).fetchone()
+            if expense is None:
+                return False
+            conn.execute(
+                'UPDATE expenses SET amount_paise = ?, category_id = ?, description = ?, day = ? WHERE id = ?',
+                (amount_paise, get_category_id(conn, user_id, 'expense', category), description, day, expense_id)
+            )
+            invalidate_insights(conn, user_id, from_day(expense['day']), from_day(day))
+            conn.commit()
+        return True
+
+
+class SqliteIncome(SqliteEntries):
+    table = 'income'
+    fields = INCOME_FIELDS
+    archive_fields = ARCHIVE_INCOME_FIELDS
+
+    def add(self, user_id, amount_paise, source, day):
+        with get_db(user_id) as conn:
+            conn.execute(
+                'INSERT INTO income (user_id, amount_paise, source_id, day) VALUES (?, ?, ?, ?)',
+                (user_id, amount_paise, get_category_id(conn, user_id, 'income', source), day)
+            )
+            invalidate_insights(conn, user_id, from_day(day))
+            conn.commit()
+
+    def update(self, user_id, income_id, amount_paise, source, day):
+        """False when the entry does not exist or belongs to someone else"""
+        with get_db(user_id) as conn:
+            income = conn.execute('SELECT day FROM income WHERE id = ? AND user_id = ?',
+                                  (income_id, user_id)).fetchone()
+            if income is None:
+                return False
+            conn.execute(
+                'UPDATE income SET amount_paise = ?, source_id = ?, day = ? WHERE id = ?',
+                (amount_paise, get_category_id(conn, user_id, 'income', source), day, income_id)
+            )
+            invalidate_insights(conn, user_id, from_day(income['day']), from_day(day))
+            conn.commit()
+        return True
+
+
+class SqliteHabits:
+    def list(self, user_id):
+        with get_read_db(user_id) as conn:
+            return conn.execute('SELECT * FROM habits WHERE user_id = ? ORDER BY id', (user_id,)).fetchall()
+
+    def add(self, user_id, names, is_custom=True):
+        """Add one habit per name"""
+        with get_db(user_id) as conn:
+            conn.executemany('INSERT INTO habits (user_id, name, is_custom) VALUES (?, ?, ?)',
+                             [(user_id, name, is_custom) for name in names])
+            if is_custom:
+                invalidate_insights(conn, user_id, datetime.now().strftime('%Y-%m-%d'))
+            conn.commit()
+
+
+class SqliteHabitLogs:
+    QUERY = f'''
+        SELECT {HABIT_LOG_FIELDS}, h.name
+        FROM habit_logs hl
+        JOIN habits h ON hl.habit_id = h.id
+    '''
+
+    def for_day(self, user_id, day):
+        with get_read_db(user_id) as conn:
+            return conn.execute(self.QUERY + 'WHERE hl.user_id = ? AND hl.day = ?', (user_id, day)).fetchall()
+
+    def for_range(self, user_id, start_day, end_day):
+        with get_read_db(user_id) as conn:
+            return conn.execute(
+                self.QUERY + 'WHERE hl.user_id = ? AND hl.day >= ? AND hl.day < ? ORDER BY hl.day DESC',
+                (user_id, start_day, end_day)
+            ).fetchall()
+
+    def all(self, user_id):
+        """Every log including the yearly archives, newest first"""
+        with get_read_db(user_id, archives=True) as conn:
+            schemas = attached_archives(conn)
+            query = with_archives(
+                self.QUERY + 'WHERE hl.user_id = ?',
+                f'SELECT {ARCHIVE_HABIT_LOG_FIELDS} FROM {{db}}.habit_logs hl WHERE hl.user_id = ?',
+                schemas
+            )
+            return conn.execute(query + ' ORDER BY date DESC', (user_id,) * (len(schemas) + 1)).fetchall()
+
+    def save(self, user_id, habit_id, day, **values):
+        """Insert or replace the habit's log for the day; values are HABIT_LOG_VALUES"""
+        row = tuple(values.get(name) for name in HABIT_LOG_VALUES) + (parse_time_slots(values.get('time_slots')),)
+        with get_db(user_id) as conn:
+            existing = conn.execute(
+                'SELECT id FROM habit_logs WHERE habit_id = ? AND day = ?',
+                (habit_id, day)
+            ).fetchone()
+
+            if existing:
+                conn.execute('''
+                    UPDATE habit_logs
+                    SET completed = ?, duration_minutes = ?, time_slots = ?, topic = ?, tasks = ?, notes = ?,
+                        slot_bits = ?
+                    WHERE habit_id = ? AND day = ?
+                ''', row + (habit_id, day))
+            else:
+                conn.execute('''
+                    INSERT INTO habit_logs
+                    (habit_id, user_id, day, completed, duration_minutes, time_slots, topic, tasks, notes, slot_bits)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                ''', (habit_id, user_id, day) + row)
+
+            invalidate_insights(conn, user_id, from_day(day))
+            conn.commit()
+
+
+class SqliteStats:
+    def today(self, user_id, day, start_day, end_day):
+        """Spending on day, spending and income over [start_day, end_day), and the days in it with every habit done"""
+        with get_read_db(user_id) as conn:
+            today_expenses = conn.execute(
+                'SELECT SUM(amount_paise) as total FROM expenses WHERE user_id = ? AND day = ?',
+                (user_id, day)
+            ).fetchone()
+            month_expenses = conn.execute('''
+                SELECT SUM(amount_paise) as total FROM expenses
+                WHERE user_id = ? AND day >= ? AND day < ?
+            ''', (user_id, start_day, end_day)).fetchone()
+            month_income = conn.execute('''
+                SELECT SUM(amount_paise) as total FROM income
+                WHERE user_id = ? AND day >= ? AND day < ?
+            ''', (user_id, start_day, end_day)).fetchone()
+
+            # Days where ALL habits were completed (none without any habit)
+            total_habits = conn.execute(
+                'SELECT COUNT(*) as count FROM habits WHERE user_id = ?',
+                (user_id,)
+            ).fetchone()['count'] or 0
+            all_done_days = 0
+            if total_habits > 0:
+                all_done_days = conn.execute('''
+                    SELECT COUNT(DISTINCT day) as days_count
+                    FROM (
+                        SELECT day, COUNT(*) as completed_count
+                        FROM habit_logs
+                        WHERE user_id = ?
+                        AND completed = 1
+                        AND day >= ?
+                        AND day < ?
+                        GROUP BY day
+                        HAVING completed_count = ?
+                    )
+                ''', (user_id, start_day, end_day, total_habits)).fetchone()['days_count'] or 0
+
+        return {
+            'day_expenses_paise': today_expenses['total'] or 0,
+            'expenses_paise': month_expenses['total'] or 0,
+            'income_paise': month_income['total'] or 0,
+            'all_habits_days': all_done_days
+        }
+
+    def totals(self, user_id):
+        """All-time expenses, income and completed habit logs, including the yearly archives"""
+        with get_read_db(user_id, archives=True) as conn:
+            schemas = attached_archives(conn)
+            params = (user_id,) * (len(schemas) + 1)
+
+            query = with_archives(
+                'SELECT SUM(amount_paise) AS total FROM expenses WHERE user_id = ?',
+                'SELECT SUM(amount_paise) FROM {db}.expenses WHERE user_id = ?',
+                schemas
+            )
+            total_expenses = conn.execute(f'SELECT SUM(total) as total FROM ({query})', params).fetchone()
+
+            query = with_archives(
+                'SELECT SUM(amount_paise) AS total FROM income WHERE user_id = ?',
+                'SELECT SUM(amount_paise) FROM {db}.income WHERE user_id = ?',
+                schemas
+            )
+            total_income = conn.execute(f'SELECT SUM(total) as total FROM ({query})', params).fetchone()
+
+            query = with_archives(
+                'SELECT COUNT(*) AS count FROM habit_logs WHERE user_id = ? AND completed = 1',
+                'SELECT COUNT(*) FROM {db}.habit_logs WHERE user_id = ? AND completed = 1',
+                schemas
+            )
+            total_habit_logs = conn.execute(f'SELECT SUM(count) as count FROM ({query})', params).fetchone()
+
+        return {
+            'expenses_paise': total_expenses['total'] or 0,
+            'income_paise': total_income['total'] or 0,
+            'completed_logs': total_habit_logs['count'] or 0
+        }
+
+    def completed_days(self, user_id):
+        """(habit row, days it was completed, newest first) for every habit; recent days are never archived"""
+        with get_read_db(user_id) as conn:
+            habits = conn.execute('SELECT * FROM habits WHERE user_id = ?', (user_id,)).fetchall()
+            return [(habit, [row['day'] for row in conn.execute('''
+                SELECT day, completed FROM habit_logs
+                WHERE habit_id = ? AND completed = 1
+                ORDER BY day DESC
+            ''', (habit['id'],))]) for habit in habits]
+
+    def daily(self, user_id, start_day, end_day):
+        """({day: spending in paise}, {day: completed habit logs}) for days in [start_day, end_day)"""
+        with get_read_db(user_id) as conn:
+            daily_expenses = conn.execute('''
+                SELECT day, SUM(amount_paise) as total
+                FROM expenses
+                WHERE user_id = ? AND day >= ? AND day < ?
+                GROUP BY day
+            ''', (user_id, start_day, end_day)).fetchall()
+            daily_habits = conn.execute('''
+                SELECT day, COUNT(*) as completed_count
+                FROM habit_logs
+                WHERE user_id = ? AND completed = 1
+                AND day >= ? AND day < ?
+                GROUP BY day
+            ''', (user_id, start_day, end_day)).fetchall()
+        return ({row['day']: row['total'] for row in daily_expenses},
+                {row['day']: row['completed_count'] for row in daily_habits})
+
+    def period_data(self, user_id, start_day, end_day):
+        """Expenses and income (amount_paise, oldest first) and completed days per habit, for AI insights"""
+        with get_read_db(user_id) as conn:
+            expenses = conn.execute(f'''
+                SELECT amount_paise, {CATEGORY_NAME.format('expenses.category_id')} as category, description,
+                       {API_DATE.format('day')} as date
+                FROM expenses
+                WHERE user_id = ? AND day >= ? AND day < ?
+                ORDER BY day
+            ''', (user_id, start_day, end_day)).fetchall()
+            income = conn.execute(f'''
+                SELECT amount_paise, {CATEGORY_NAME.format('income.source_id')} as source, {API_DATE.format('day')} as date
+                FROM income
+                WHERE user_id = ? AND day >= ? AND day < ?
+                ORDER BY day
+            ''', (user_id, start_day, end_day)).fetchall()
+            habits = conn.execute('''
+                SELECT h.name, COUNT(hl.id) as completed_days
+                FROM habits h
+                LEFT JOIN habit_logs hl ON h.id = hl.habit_id
+                    AND hl.completed = 1
+                    AND hl.day >= ?
+                    AND hl.day < ?
+                WHERE h.user_id = ?
+                GROUP BY h.id, h.name
+            ''', (start_day, end_day, user_id)).fetchall()
+        return {
+            'expenses': [dict(e) for e in expenses],
+            'income': [dict(i) for i in income],
+            'habits': [dict(h) for h in habits]
+        }
+
+    def slot_counts(self, user_id, start_day, end_day, habit_id=None):
+        """{weekday: logs covering each half hour} over [start_day, end_day), for one habit or all"""
+        habit_filter = 'AND habit_id = ?' if habit_id is not None else ''
+        params = (user_id, start_day, end_day) + ((habit_id,) if habit_id is not None else ())
+        with get_read_db(user_id) as conn:
+            rows = conn.execute(f'''
+                SELECT (day + 3) % 7 AS weekday, {SLOT_SUMS}
+                FROM habit_logs
+                WHERE user_id = ? AND day >= ? AND day < ? AND slot_bits != 0 {habit_filter}
+                GROUP BY weekday
+            ''', params).fetchall()
+        return {row[0]: list(row[1:]) for row in rows}
+
+    def series(self, user_id, start_day, end_day, granularity, category=None, habit_id=None):
+        """
+        {bucket key: (spent_paise, earned_paise, completed habit logs)} over [start_day, end_day)
+        (see timeseries.py), for one expense category and one habit when given. Whole months of
+        spending come from the category_spend counters when buckets are months or years; the
+        rest are range reads of the (user_id, day) indexes, plus the archives the range reaches.
+        """
+        bucket = BUCKET_KEYS[granularity].format('day')
+        years = [year for year in archive_years()
+                 if to_day(date(year, 1, 1)) < end_day and to_day(date(year + 1, 1, 1)) > start_day]
+        parts, params = [], []
+
+        def add(query, *values):
+            parts.append(query)
+            params.extend(values)
+
+        with get_read_db(user_id, archives=bool(years)) as conn:
+            schemas = [schema for schema in attached_archives(conn) if int(schema[len('archive'):]) in years]
+            # The union's column names come from this first part
+            add(f'SELECT {bucket} AS bucket, 0 AS spent, SUM(amount_paise) AS earned, 0 AS completed FROM income '
+                'WHERE user_id = ? AND day >= ? AND day < ? GROUP BY 1', user_id, start_day, end_day)
+
+            category_id = None
+            if category is not None:
+                row = conn.execute("SELECT id FROM categories WHERE user_id = ? AND kind = 'expense' AND name = ?",
+                                   (user_id, category)).fetchone()
+                category_id = row['id'] if row else None
+
+            if category is None or category_id is not None:
+                category_filter = 'AND category_id = ?' if category_id is not None else ''
+                category_param = (category_id,) if category_id is not None else ()
+                months = full_months(start_day, end_day) if granularity in ('month', 'year') else None
+                scans = [(start_day, end_day)]
+                if months:
+                    add(f'''SELECT {'month' if granularity == 'month' else 'month / 100'}, SUM(spent_paise), 0, 0
+                            FROM category_spend WHERE user_id = ? AND month >= ? AND month < ? {category_filter}
+                            GROUP BY 1''',
+                        user_id, bucket_key(months[0], 'month'), bucket_key(months[1], 'month'), *category_param)
+                    scans = [(start_day, months[0]), (months[1], end_day)]
+                for first, last in scans:
+                    if first < last:
+                        add(f'''SELECT {bucket}, SUM(amount_paise), 0, 0 FROM expenses
+                                WHERE user_id = ? AND day >= ? AND day < ? {category_filter} GROUP BY 1''',
+                            user_id, first, last, *category_param)
+
+            habit_filter = 'AND habit_id = ?' if habit_id is not None else ''
+            habit_param = (habit_id,) if habit_id is not None else ()
+            add(f'SELECT {bucket}, 0, 0, SUM(completed) FROM habit_logs '
+                f'WHERE user_id = ? AND day >= ? AND day < ? {habit_filter} GROUP BY 1',
+                user_id, start_day, end_day, *habit_param)
+
+            for schema in schemas:
+                category_filter = 'AND category = ?' if category is not None else ''
+                add(f'SELECT {bucket}, SUM(amount_paise), 0, 0 FROM {schema}.expenses '
+                    f'WHERE user_id = ? AND day >= ? AND day < ? {category_filter} GROUP BY 1',
+                    user_id, start_day, end_day, *((category,) if category is not None else ()))
+                add(f'SELECT {bucket}, 0, SUM(amount_paise), 0 FROM {schema}.income '
+                    'WHERE user_id = ? AND day >= ? AND day < ? GROUP BY 1', user_id, start_day, end_day)
+                add(f'SELECT {bucket}, 0, 0, SUM(completed) FROM {schema}.habit_logs '
+                    f'WHERE user_id = ? AND day >= ? AND day < ? {habit_filter} GROUP BY 1',
+                    user_id, start_day, end_day, *habit_param)
+
+            rows = conn.execute(f'''
+                SELECT bucket, SUM(spent), SUM(earned), SUM(completed)
+                FROM ({' UNION ALL '.join(parts)})
+                GROUP BY bucket
+            ''', params).fetchall()
+        return {row[0]: tuple(row[1:]) for row in rows}
+
+
+# ==================== MEMORY ====================
+
+class MemoryRow(tuple):
+    """sqlite3.Row stand-in: a tuple of values that can also be indexed by column name"""
+
+    def __new__(cls, columns, values):
+        row = super().__new__(cls, values)
+        row.columns = columns
+        return row
+
+    def keys(self):
+        return list(self.columns)
+
+    def __getitem__(self, key):
+        if isinstance(key, str):
+            key = self.columns.index(key)
+        return super().__getitem__(key)
+
+
+def _timestamp():
+    """CURRENT_TIMESTAMP's format: UTC, to the second"""
+    return datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S')
+
+
+class MemoryStore:
+    """Every user's rows as table -> user_id -> {id: dict}, plus the id counters"""
+
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.tables = {'expenses': {}, 'income': {}, 'habits': {}, 'habit_logs': {}}
+        self.last_ids = dict.fromkeys(self.tables, 0)
+
+    def rows(self, table, user_id):
+        return self.tables[table].setdefault(user_id, {})
+
+    def insert(self, table, user_id, row):
+        self.last_ids[table] += 1
+        row.update(id=self.last_ids[table], user_id=user_id, created_at=_timestamp())
+        self.rows(table, user_id)[row['id']] = row
+        return row
+
+
+class MemoryEntries:
+    """Expenses or income kept in a MemoryStore; name is the category or source column"""
+    table = None
+    columns = None
+    name = None
+
+    def __init__(self, store):
+        self.store = store
+
+    def _row(self, entry):
+        values = {**entry, 'amount': entry['amount_paise'] / 100, 'date': from_day(entry['day'])}
+        return MemoryRow(self.columns, [values[column] for column in self.columns])
+
+    def _entries(self, user_id, keep=lambda entry: True):
+        with self.store.lock:
+            return [entry for entry in self.store.rows(self.table, user_id).values() if keep(entry)]
+
+    def for_day(self, user_id, day):
+        entries = self._entries(user_id, lambda entry: entry['day'] == day)
+        return [self._row(entry) for entry in sorted(entries, key=lambda entry: entry['id'], reverse=True)]
+
+    def for_range(self, user_id, start_day, end_day):
+        # Newest day first; within a day in the order of the (user_id, day, amount_paise) index
+        entries = self._entries(user_id, lambda entry: start_day <= entry['day'] < end_day)
+        entries.sort(key=lambda entry: (entry['day'], entry['amount_paise'], entry['id']), reverse=True)
+        return [self._row(entry) for entry in entries]
+
+    def all(self, user_id):
+        entries = sorted(self._entries(user_id), key=lambda entry: entry['day'], reverse=True)
+        return [self._row(entry) for entry in entries]
+
+    def get(self, user_id, entry_id):
+        with self.store.lock:
+            entry = self.store.rows(self.table, user_id).get(entry_id)
+        return self._row(entry) if entry else None
+
+    def _add(self, user_id, **values):
+        if values[self.name] is None:
+            raise ValueError(f'{self.name.capitalize()} is required')
+        with self.store.lock:
+            self.store.insert(self.table, user_id, values)
+
+    def _update(self, user_id, entry_id, **values):
+        if values[self.name] is None:
+            raise ValueError(f'{self.name.capitalize()} is required')
+        with self.store.lock:
+            entry = self.store.rows(self.table, user_id).get(entry_id)
+            if entry is None:
+                return False
+            entry.update(values)
+        return True
+
+    def delete(self, user_id, entry_id):
+        with self.store.lock:
+            return self.store.rows(self.table, user_id).pop(entry_id, None) is not None
+
+
+class MemoryExpenses(MemoryEntries):
+    table = 'expenses'
+    columns = EXPENSE_COLUMNS
+    name = 'category'
+
+    def add(self, user_id, amount_paise, category, description, day):
+        self._add(user_id, amount_paise=amount_paise, category=category, description=description, day=day)
+
+    def update(self, user_id, expense_id, amount_paise, category, description, day):
+        return self._update(user_id, expense_id, amount_paise=amount_paise, category=category,
+                            description=description, day=day)
+
+
+class MemoryIncome(MemoryEntries):
+    table = 'income'
+    columns = INCOME_COLUMNS
+    name = 'source'
+
+    def add(self, user_id, amount_paise, source, day):
+        self._add(user_id, amount_paise=amount_paise, source=source, day=day)
+
+    def update(self, user_id, income_id, amount_paise, source, day):
+        return self._update(user_id, income_id, amount_paise=amount_paise, source=source, day=day)
+
+
+class MemoryHabits:
+    def __init__(self, store):
+        self.store = store
+
+    def list(self, user_id):
+        with self.store.lock:
+            habits = sorted(self.store.rows('habits', user_id).values(), key=lambda habit: habit['id'])
+            return [MemoryRow(HABIT_COLUMNS, [habit[column] for column in HABIT_COLUMNS]) for habit in habits]
+
+    def add(self, user_id, names, is_custom=True):
+        with self.store.lock:
+            for name in names:
+                self.store.insert('habits', user_id, {'name': name, 'is_custom': int(is_custom)})
+
+
+class MemoryHabitLogs:
+    def __init__(self, store):
+        self.store = store
+
+    def _rows(self, user_id, keep, newest_first=False):
+        with self.store.lock:
+            habits = self.store.rows('habits', user_id)
+            logs = [log for log in self.store.rows('habit_logs', user_id).values()
+                    if log['habit_id'] in habits and keep(log)]
+            if newest_first:
+                logs.sort(key=lambda log: log['day'], reverse=True)
+            return [MemoryRow(HABIT_LOG_COLUMNS, [
+                {**log, 'date': from_day(log['day']), 'name': habits[log['habit_id']]['name']}[column]
+                for column in HABIT_LOG_COLUMNS
+            ]) for log in logs]
+
+    def for_day(self, user_id, day):
+        return self._rows(user_id, lambda log: log['day'] == day)
+
+    def for_range(self, user_id, start_day, end_day):
+        return self._rows(user_id, lambda log: start_day <= log['day'] < end_day, newest_first=True)
+
+    def all(self, user_id):
+        return self._rows(user_id, lambda log: True, newest_first=True)
+
+    def save(self, user_id, habit_id, day, **values):
+        habit_id = int(habit_id)    # the column's INTEGER affinity in SQLite
+        values = {name: values.get(name) for name in HABIT_LOG_VALUES}
+        if isinstance(values['completed'], bool):
+            values['completed'] = int(values['completed'])
+        with self.store.lock:
+            logs = self.store.rows('habit_logs', user_id)
+            existing = next((log for log in logs.values() if log['habit_id'] == habit_id and log['day'] == day), None)
+            values['slot_bits'] = parse_time_slots(values['time_slots'])
+            if existing:
+                existing.update(values)
+            else:
+                self.store.insert('habit_logs', user_id, {'habit_id': habit_id, 'day': day, **values})
+
+
+class MemoryStats:
+    def __init__(self, store):
+        self.store = store
+
+    def _rows(self, table, user_id):
+        return list(self.store.rows(table, user_id).values())
+
+    def today(self, user_id, day, start_day, end_day):
+        with self.store.lock:
+            expenses = self._rows('expenses', user_id)
+            income = self._rows('income', user_id)
+            habit_count = len(self.store.rows('habits', user_id))
+            completed = {}
+            for log in self._rows('habit_logs', user_id):
+                if log['completed'] == 1 and start_day <= log['day'] < end_day:
+                    completed[log['day']] = completed.get(log['day'], 0) + 1
+        return {
+            'day_expenses_paise': sum(entry['amount_paise'] for entry in expenses if entry['day'] == day),
+            'expenses_paise': sum(entry['amount_paise'] for entry in expenses if start_day <= entry['day'] < end_day),
+            'income_paise': sum(entry['amount_paise'] for entry in income if start_day <= entry['day'] < end_day),
+            'all_habits_days': sum(1 for count in completed.values() if habit_count and count == habit_count)
+        }
+
+    def totals(self, user_id):
+        with self.store.lock:
+            return {
+                'expenses_paise': sum(entry['amount_paise'] for entry in self._rows('expenses', user_id)),
+                'income_paise': sum(entry['amount_paise'] for entry in self._rows('income', user_id)),
+                'completed_logs': sum(1 for log in self._rows('habit_logs', user_id) if log['completed'] == 1)
+            }
+
+    def completed_days(self, user_id):
+        with self.store.lock:
+            days = {}
+            for log in self._rows('habit_logs', user_id):
+                if log['completed'] == 1:
+                    days.setdefault(log['habit_id'], []).append(log['day'])
+            return [(MemoryRow(HABIT_COLUMNS, [habit[column] for column in HABIT_COLUMNS]),
+                     sorted(days.get(habit_id, []), reverse=True))
+                    for habit_id, habit in sorted(self.store.rows('habits', user_id).items())]
+
+    def daily(self, user_id, start_day, end_day):
+        expenses, habits = {}, {}
+        with self.store.lock:
+            for entry in self._rows('expenses', user_id):
+                if start_day <= entry['day'] < end_day:
+                    expenses[entry['day']] = expenses.get(entry['day'], 0) + entry['amount_paise']
+            for log in self._rows('habit_logs', user_id):
+                if log['completed'] == 1 and start_day <= log['day'] < end_day:
+                    habits[log['day']] = habits.get(log['day'], 0) + 1
+        return expenses, habits
+
+    def period_data(self, user_id, start_day, end_day):
+        with self.store.lock:
+            expenses = sorted((entry for entry in self._rows('expenses', user_id)
+                               if start_day <= entry['day'] < end_day), key=lambda entry: entry['day'])
+            income = sorted((entry for entry in self._rows('income', user_id)
+                             if start_day <= entry['day'] < end_day), key=lambda entry: entry['day'])
+            completed = {}
+            for log in self._rows('habit_logs', user_id):
+                if log['completed'] == 1 and start_day <= log['day'] < end_day:
+                    completed[log['habit_id']] = completed.get(log['habit_id'], 0) + 1
+            habits = sorted(self.store.rows('habits', user_id).items())
+        return {
+            'expenses': [{'amount_paise': entry['amount_paise'], 'category': entry['category'],
+                          'description': entry['description'], 'date': from_day(entry['day'])} for entry in expenses],
+            'income': [{'amount_paise': entry['amount_paise'], 'source': entry['source'],
+                        'date': from_day(entry['day'])} for entry in income],
+            'habits': [{'name': habit['name'], 'completed_days': completed.get(habit_id, 0)}
+                       for habit_id, habit in habits]
+        }
+
+    def slot_counts(self, user_id, start_day, end_day, habit_id=None):
+        counts = {}
+        with self.store.lock:
+            for log in self._rows('habit_logs', user_id):
+                if (log['slot_bits'] and start_day <= log['day'] < end_day
+                        and (habit_id is None or log['habit_id'] == habit_id)):
+                    slots = counts.setdefault(weekday(log['day']), [0] * SLOTS)
+                    for slot in range(SLOTS):
+                        slots[slot] += (log['slot_bits'] >> slot) & 1
+        return counts
+
+    def series(self, user_id, start_day, end_day, granularity, category=None, habit_id=None):
+        totals = {}
+
+        def add(day, column, value):
+            bucket = totals.setdefault(bucket_key(day, granularity), [0, 0, 0])
+            bucket[column] += value
+
+        with self.store.lock:
+            for entry in self._rows('expenses', user_id):
+                if start_day <= entry['day'] < end_day and (category is None or entry['category'] == category):
+                    add(entry['day'], 0, entry['amount_paise'])
+            for entry in self._rows('income', user_id):
+                if start_day <= entry['day'] < end_day:
+                    add(entry['day'], 1, entry['amount_paise'])
+            for log in self._rows('habit_logs', user_id):
+                if start_day <= log['day'] < end_day and (habit_id is None or log['habit_id'] == habit_id):
+                    add(log['day'], 2, log['completed'] or 0)
+        return {key: tuple(bucket) for key, bucket in totals.items()}
+
+
+# ==================== BACKENDS ====================
+
+class Repositories:
+    """The active backend's expenses, income, habits, habit_logs and stats repositories"""
+
+    def __init__(self, backend=STORAGE_BACKEND):
+        self.use(backend)
+
+    def use(self, backend):
+        """Switch every caller to 'sqlite' or 'memory'; each switch to memory starts from an empty store"""
+        if backend == 'sqlite':
+            self.expenses, self.income = SqliteExpenses(), SqliteIncome()
+            self.habits, self.habit_logs, self.stats = SqliteHabits(), SqliteHabitLogs(), SqliteStats()
+        elif backend == 'memory':
+            store = MemoryStore()
+            self.expenses, self.income = MemoryExpenses(store), MemoryIncome(store)
+            self.habits, self.habit_logs, self.stats = MemoryHabits(store), MemoryHabitLogs(store), MemoryStats(store)
+        else:
+            raise ValueError(f'Unknown storage backend: {backend}')
+        self.backend = backend
+
+    def materialize(self, user_id, through_day=None):
+        """Write due recurring entries (see recurring.py); the memory backend has no recurring rules"""
+        if self.backend == 'sqlite':
+            return materialize_recurring(user_id, through_day)
+        return 0
+
+
+repos = Repositories()
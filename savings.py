@@ -0,0 +1,204 @@
+"""
+Savings goals and their contributions
+Each goal's saved amount and contribution count live on its savings_goals row, kept current by
+the savings triggers in database.py in the same transaction as every contribution, so progress
+and projections come from one row per goal rather than a sum over its contributions.
+The projection assumes the goal keeps growing at its average daily rate since start_day.
+
+    python savings.py rebuild      # recount goal totals from the savings tables
+"""
+import sqlite3
+import sys
+from datetime import date
+from math import ceil
+from database import (get_db, get_read_db, get_shard_connection, all_shards, init_db, rebuild_savings_totals,
+                      to_paise, from_paise, to_day, from_day)
+
+RECENT_CONTRIBUTIONS = 20
+
+
+def _parse_target(target, target_date):
+    target_paise = to_paise(target if target is not None else 0)
+    if target_paise <= 0:
+        raise ValueError('Goal target must be greater than zero')
+    target_day = to_day(target_date) if target_date else None
+    return target_paise, target_day
+
+
+def _goal(row, today):
+    """API shape of a savings_goals row, with progress and projected completion"""
+    saved, target = row['saved_paise'], row['target_paise']
+    remaining = max(target - saved, 0)
+    daily_rate = saved / max(today - row['start_day'] + 1, 1)
+    target_day = row['target_day']
+
+    projected_day = None
+    if not target:
+        status = 'no_target'
+    elif remaining == 0:
+        status = 'completed'
+    elif daily_rate <= 0:
+        status = 'stalled'
+    else:
+        projected_day = today + ceil(remaining / daily_rate)
+        status = 'behind' if target_day is not None and projected_day > target_day else 'on_track'
+
+    needed = None
+    if target_day is not None and remaining:
+        needed = from_paise(ceil(remaining / max(target_day - today + 1, 1)))
+    return {
+        'id': row['id'],
+        'name': row['name'],
+        'target': from_paise(target),
+        'saved': from_paise(saved),
+        'remaining': from_paise(remaining),
+        'percent': round(saved * 100 / target, 1) if target else None,
+        'contributions': row['contributions'],
+        'target_date': from_day(target_day) if target_day is not None else None,
+        'daily_rate': from_paise(round(daily_rate)),
+        'needed_per_day': needed,
+        'projected_date': from_day(projected_day) if projected_day is not None else None,
+        'status': status
+    }
+
+
+def goal_status(user_id):
+    """Every goal with its progress and projection, plus totals across goals"""
+    today = to_day(date.today())
+    with get_read_db(user_id) as conn:
+        rows = conn.execute('SELECT * FROM savings_goals WHERE user_id = ? ORDER BY id', (user_id,)).fetchall()
+    goals = [_goal(row, today) for row in rows]
+    return {
+        'goals': goals,
+        'total_saved': from_paise(sum(row['saved_paise'] for row in rows)),
+        'total_target': from_paise(sum(row['target_paise'] for row in rows)),
+        'completed': sum(1 for goal in goals if goal['status'] == 'completed')
+    }
+
+
+def get_goal(user_id, goal_id):
+    """One goal with its most recent contributions, or None"""
+    with get_read_db(user_id) as conn:
+        row = conn.execute('SELECT * FROM savings_goals WHERE id = ? AND user_id = ?', (goal_id, user_id)).fetchone()
+        if row is None:
+            return None
+        contributions = conn.execute('''
+            SELECT id, amount_paise, day, created_at FROM savings
+            WHERE goal_id = ?
+            ORDER BY day DESC, id DESC
+            LIMIT ?
+        ''', (goal_id, RECENT_CONTRIBUTIONS)).fetchall()
+    goal = _goal(row, to_day(date.today()))
+    goal['recent_contributions'] = [{
+        'id': c['id'],
+        'amount': from_paise(c['amount_paise']),
+        'date': from_day(c['day']),
+        'created_at': c['created_at']
+    } for c in contributions]
+    return goal
+
+
+def add_goal(user_id, name, target, target_date=None):
+    """Create a goal; returns its id"""
+    name = (name or '').strip()
+    if not name:
+        raise ValueError('Goal name is required')
+    target_paise, target_day = _parse_target(target, target_date)
+    with get_db(user_id) as conn:
+        try:
+            goal_id = conn.execute('''
+                INSERT INTO savings_goals (user_id, name, target_paise, target_day, start_day)
+                VALUES (?, ?, ?, ?, ?)
+            ''', (user_id, name, target_paise, target_day, to_day(date.today()))).lastrowid
+        except sqlite3.IntegrityError:
+            raise ValueError(f'A goal named {name} already exists')
+        conn.commit()
+    return goal_id
+
+
+def update_goal(user_id, goal_id, name, target, target_date=None):
+    """Rename a goal or change its target; returns False if it does not exist"""
+    name = (name or '').strip()
+    if not name:
+        raise ValueError('Goal name is required')
+    target_paise, target_day = _parse_target(target, target_date)
+    with get_db(user_id) as conn:
+        try:
+            changed = conn.execute('''
+                UPDATE savings_goals SET name = ?, target_paise = ?, target_day = ?
+                WHERE id = ? AND user_id = ?
+            ''', (name, target_paise, target_day, goal_id, user_id)).rowcount
+        except sqlite3.IntegrityError:
+            raise ValueError(f'A goal named {name} already exists')
+        conn.commit()
+    return changed > 0
+
+
+def delete_goal(user_id, goal_id):
+    """Remove a goal and its contributions; returns False if it does not exist"""
+    with get_db(user_id) as conn:
+        conn.execute('DELETE FROM savings WHERE goal_id = ? AND user_id = ?', (goal_id, user_id))
+        deleted = conn.execute('DELETE FROM savings_goals WHERE id = ? AND user_id = ?', (goal_id, user_id)).rowcount
+        conn.commit()
+    return deleted > 0
+
+
+def add_contribution(user_id, goal_id, amount, date_str=None):
+    """Add to a goal (a negative amount withdraws); returns False if the goal does not exist"""
+    amount_paise = to_paise(amount if amount is not None else 0)
+    if amount_paise == 0:
+        raise ValueError('Amount must not be zero')
+    day = to_day(date_str) if date_str else to_day(date.today())
+    with get_db(user_id) as conn:
+        # Check and write under one write lock, so concurrent withdrawals cannot overdraw the goal
+        conn.execute('BEGIN IMMEDIATE')
+        goal = conn.execute('SELECT saved_paise FROM savings_goals WHERE id = ? AND user_id = ?',
+                            (goal_id, user_id)).fetchone()
+        if goal is None:
+            conn.rollback()
+            return False
+        if goal['saved_paise'] + amount_paise < 0:
+            conn.rollback()
+            raise ValueError('Cannot withdraw more than the goal has saved')
+        conn.execute('INSERT INTO savings (user_id, goal_id, amount_paise, day) VALUES (?, ?, ?, ?)',
+                     (user_id, goal_id, amount_paise, day))
+        conn.commit()
+    return True
+
+
+def delete_contribution(user_id, contribution_id):
+    """Remove a contribution; returns False if it does not exist"""
+    with get_db(user_id) as conn:
+        # Like add_contribution: removing a deposit must not leave the goal below zero
+        conn.execute('BEGIN IMMEDIATE')
+        row = conn.execute('''
+            SELECT s.amount_paise, g.saved_paise FROM savings s
+            LEFT JOIN savings_goals g ON g.id = s.goal_id
+            WHERE s.id = ? AND s.user_id = ?
+        ''', (contribution_id, user_id)).fetchone()
+        if row is None:
+            conn.rollback()
+            return False
+        if row['saved_paise'] is not None and row['saved_paise'] - row['amount_paise'] < 0:
+            conn.rollback()
+            raise ValueError('Cannot remove a deposit the goal has already withdrawn')
+        conn.execute('DELETE FROM savings WHERE id = ?', (contribution_id,))
+        conn.commit()
+    return True
+
+
+if __name__ == '__main__':
+    if sys.argv[1:] != ['rebuild']:
+        print("Usage: python savings.py rebuild")
+        sys.exit(1)
+
+    init_db()
+    count = 0
+    for shard in all_shards():
+        conn = get_shard_connection(shard)
+        try:
+            count += rebuild_savings_totals(conn)
+            conn.commit()
+        finally:
+            conn.close()
+    print(f"✅ Rebuilt totals of {count} savings goals")
@@ -0,0 +1,147 @@
+"""
+Full-text search over expenses, income and habit logs
+Queries the search_index FTS5 table that database.py keeps in sync with triggers,
+plus the search_index of every yearly archive file (see archive.py).
+
+    python search.py rebuild      # repopulate the index from scratch
+"""
+import re
+import sys
+from database import (get_read_db, get_shard_connection, all_shards, init_db, rebuild_search_index, to_day,
+                      attached_archives, SEARCH_SOURCES, EXPENSE_FIELDS, INCOME_FIELDS, HABIT_LOG_FIELDS,
+                      ARCHIVE_EXPENSE_FIELDS, ARCHIVE_INCOME_FIELDS, ARCHIVE_HABIT_LOG_FIELDS)
+
+MAX_PER_PAGE = 100
+
+# Snippet highlight markers, same **bold** the chat UI already renders
+HIGHLIGHT = ('**', '**')
+
+
+# Archived rows are looked up by their rowid in the archive file
+ARCHIVE_ITEMS = {
+    'expense': ('expenses', ARCHIVE_EXPENSE_FIELDS),
+    'income': ('income', ARCHIVE_INCOME_FIELDS),
+    'habit': ('habit_logs', ARCHIVE_HABIT_LOG_FIELDS)
+}
+
+
+def build_match_query(text):
+    """Turn free text into an FTS5 query where every word is a prefix term, e.g. 'lun caf' -> "lun"* "caf"*"""
+    terms = re.findall(r'\w+', text.lower())
+    return ' '.join(f'"{term}"*' for term in terms)
+
+
+def _load_items(conn, user_id, kind, ids, schema='main'):
+    """Fetch the full rows for the given ids of one kind, keyed by id (by rowid for an archive schema)"""
+    placeholders = ','.join('?' * len(ids))
+    if schema != 'main':
+        table, fields = ARCHIVE_ITEMS[kind]
+        query = f'''
+            SELECT {fields}, hl.rowid AS ref_id FROM {schema}.{table} hl
+            WHERE hl.user_id = ? AND hl.rowid IN ({placeholders})
+        '''
+        rows = conn.execute(query, (user_id, *ids)).fetchall()
+        return {row['ref_id']: {key: row[key] for key in row.keys() if key != 'ref_id'} for row in rows}
+    if kind == 'expense':
+        query = f'SELECT {EXPENSE_FIELDS} FROM expenses WHERE user_id = ? AND id IN ({placeholders})'
+    elif kind == 'income':
+        query = f'SELECT {INCOME_FIELDS} FROM income WHERE user_id = ? AND id IN ({placeholders})'
+    else:
+        query = f'''
+            SELECT {HABIT_LOG_FIELDS}, h.name FROM habit_logs hl
+            JOIN habits h ON hl.habit_id = h.id
+            WHERE hl.user_id = ? AND hl.id IN ({placeholders})
+        '''
+    rows = conn.execute(query, (user_id, *ids)).fetchall()
+    return {row['id']: dict(row) for row in rows}
+
+
+def search(user_id, text, kind=None, category=None, date_from=None, date_to=None, page=1, per_page=20):
+    """
+    Ranked search of one user's entries.
+    kind limits to 'expense', 'income' or 'habit'; category matches an expense category or income source name;
+    date_from/date_to are inclusive YYYY-MM-DD bounds. Returns {'results', 'page', 'per_page', 'has_more'}.
+    """
+    if kind is not None and kind not in SEARCH_SOURCES:
+        raise ValueError(f"type must be one of {', '.join(SEARCH_SOURCES)}")
+    page = max(int(page), 1)
+    per_page = min(max(int(per_page), 1), MAX_PER_PAGE)
+    response = {'results': [], 'page': page, 'per_page': per_page, 'has_more': False}
+
+    terms = build_match_query(text or '')
+    if not terms:
+        return response
+
+    with get_read_db(user_id, archives=True) as conn:
+        selects, params = [], []
+        for schema in ['main'] + attached_archives(conn):
+            match = f'owner:u{int(user_id)} AND body:({terms})'
+            if kind:
+                match += f' AND tags:{kind}'
+            if category and schema == 'main':
+                category_ids = [row[0] for row in conn.execute(
+                    'SELECT id FROM categories WHERE user_id = ? AND name = ? COLLATE NOCASE', (user_id, category)
+                )]
+                if not category_ids:
+                    continue
+                match += ' AND tags:(' + ' OR '.join(f'c{cid}' for cid in category_ids) + ')'
+            elif category:
+                # Archives tag entries with the category name itself
+                name = re.findall(r'\w+', category.lower())
+                if not name:
+                    continue
+                match += f' AND tags:"{" ".join(name)}"'
+
+            conditions = ['search_index MATCH ?']
+            params += [*HIGHLIGHT, match]
+            if date_from:
+                conditions.append('day >= ?')
+                params.append(to_day(date_from))
+            if date_to:
+                conditions.append('day <= ?')
+                params.append(to_day(date_to))
+            selects.append(f'''
+                SELECT '{schema}' AS db, kind, ref_id, snippet(search_index, 2, ?, ?, '…', 12) AS snippet, rank
+                FROM {schema}.search_index
+                WHERE {' AND '.join(conditions)}
+            ''')
+        if not selects:
+            return response
+
+        # One extra row tells us whether another page exists without counting every match
+        hits = conn.execute(
+            ' UNION ALL '.join(selects) + ' ORDER BY rank LIMIT ? OFFSET ?',
+            (*params, per_page + 1, (page - 1) * per_page)
+        ).fetchall()
+
+        response['has_more'] = len(hits) > per_page
+        hits = hits[:per_page]
+
+        items = {}
+        for db, hit_kind in {(hit['db'], hit['kind']) for hit in hits}:
+            ids = [hit['ref_id'] for hit in hits if hit['db'] == db and hit['kind'] == hit_kind]
+            items[db, hit_kind] = _load_items(conn, user_id, hit_kind, ids, db)
+
+    for hit in hits:
+        item = items[hit['db'], hit['kind']].get(hit['ref_id'])
+        if item is not None:
+            response['results'].append({'type': hit['kind'], 'snippet': hit['snippet'], 'item': item,
+                                        'archived': hit['db'] != 'main'})
+    return response
+
+
+if __name__ == '__main__':
+    if sys.argv[1:] != ['rebuild']:
+        print("Usage: python search.py rebuild")
+        sys.exit(1)
+
+    init_db()
+    count = 0
+    for shard in all_shards():
+        conn = get_shard_connection(shard)
+        try:
+            count += rebuild_search_index(conn)
+            conn.commit()
+        finally:
+            conn.close()
+    print(f"✅ Search index rebuilt with {count} entries")
@@ -0,0 +1,390 @@
+"""
+Bank statement import for expenses and income
+Streams CSV or OFX statements row by row, skips rows that already exist and inserts
+the rest in batches, committing every batch so memory stays flat on large files.
+
+    python statement_import.py --user demo_user statement.csv
+    python statement_import.py --user demo_user --map date="Txn Date" --map amount=Amount --date-format %d/%m/%Y statement.csv
+    python statement_import.py --user demo_user --format ofx statement.ofx
+"""
+import argparse
+import csv
+import hashlib
+import re
+import time
+from datetime import datetime
+from functools import lru_cache
+from decimal import Decimal, InvalidOperation
+
+from database import get_db, init_db, get_category_id, to_paise, to_day, from_day, CATEGORY_NAME
+from insights_cache import invalidate_insights
+
+BATCH_SIZE = 5000
+MAX_REPORTED_ERRORS = 100
+
+DEFAULT_EXPENSE_CATEGORY = 'others'
+DEFAULT_INCOME_SOURCE = 'Bank import'
+
+# Header names recognised when no column mapping is given (compared lowercased)
+COLUMN_ALIASES = {
+    'date': ('date', 'txn date', 'transaction date', 'value date', 'posting date'),
+    'amount': ('amount', 'amt', 'transaction amount'),
+    'debit': ('debit', 'withdrawal', 'withdrawal amt.', 'withdrawal amount', 'dr'),
+    'credit': ('credit', 'deposit', 'deposit amt.', 'deposit amount', 'cr'),
+    'category': ('category', 'type'),
+    'description': ('description', 'narration', 'details', 'particulars', 'remarks', 'memo')
+}
+
+# Tried in order when no date format is given; day-first like Indian bank statements
+DATE_FORMATS = ('%Y-%m-%d', '%d/%m/%Y', '%d-%m-%Y', '%d/%m/%y', '%d-%m-%y', '%d %b %Y', '%d-%b-%Y', '%d-%b-%y')
+
+
+def fingerprint(kind, day, amount_paise, text):
+    """64-bit hash identifying an entry by type, day, amount and normalised description/source"""
+    normalised = ' '.join((text or '').lower().split())
+    digest = hashlib.blake2b(f'{kind}|{day}|{amount_paise}|{normalised}'.encode(), digest_size=8).digest()
+    return int.from_bytes(digest, 'big', signed=True)
+
+
+def parse_amount(value):
+    """Parse '1,234.50', '₹ 99', '(12.00)' or '-5' into a Decimal; blank gives None"""
+    value = (value or '').strip()
+    if not value:
+        return None
+    negative = value.startswith('(') and value.endswith(')')
+    cleaned = re.sub(r'[^0-9.\-]', '', value)
+    try:
+        amount = Decimal(cleaned)
+    except InvalidOperation:
+        raise ValueError(f'Invalid amount {value!r}')
+    return -amount if negative else amount
+
+
+@lru_cache(maxsize=8192)
+def parse_date(value, date_format=None):
+    """Parse a statement date into a date object (cached: statements repeat the same few thousand dates)"""
+    value = (value or '').strip()
+    for fmt in ((date_format,) if date_format else DATE_FORMATS):
+        try:
+            return datetime.strptime(value, fmt).date()
+        except ValueError:
+            continue
+    raise ValueError(f'Unrecognised date {value!r}')
+
+
+def resolve_columns(header, mapping=None):
+    """Map logical fields (date, amount, debit, credit, category, description) to column positions"""
+    lowered = [name.strip().lower() for name in header]
+    columns = {}
+    for field, aliases in COLUMN_ALIASES.items():
+        wanted = (mapping or {}).get(field)
+        candidates = (wanted.strip().lower(),) if wanted else aliases
+        for candidate in candidates:
+            if candidate in lowered:
+                columns[field] = lowered.index(candidate)
+                break
+        else:
+            if wanted:
+                raise ValueError(f'Column {wanted!r} for {field} not found in header')
+
+    if 'date' not in columns:
+        raise ValueError('Could not find a date column; pass a mapping for date')
+    if 'amount' not in columns and not ('debit' in columns or 'credit' in columns):
+        raise ValueError('Could not find an amount (or debit/credit) column; pass a mapping for amount')
+    return columns
+
+
+def _cell(row, columns, field):
+    index = columns.get(field)
+    return row[index] if index is not None and index < len(row) else ''
+
+
+def read_csv(stream, mapping=None, date_format=None):
+    """Yield (line number, record dict or exception) for each data row of a CSV statement"""
+    reader = csv.reader(stream)
+    header = next(reader, None)
+    if header is None:
+        return
+    columns = resolve_columns(header, mapping)
+
+    for row in reader:
+        if not any(cell.strip() for cell in row):
+            continue
+        try:
+            if 'amount' in columns:
+                amount = parse_amount(_cell(row, columns, 'amount'))
+            else:
+                debit, credit = parse_amount(_cell(row, columns, 'debit')), parse_amount(_cell(row, columns, 'credit'))
+                amount = -(debit or 0) + (credit or 0)
+            if amount is None:
+                raise ValueError('Missing amount')
+            yield reader.line_num, {
+                'date': parse_date(_cell(row, columns, 'date'), date_format),
+                'amount': amount,
+                'category': _cell(row, columns, 'category').strip() or None,
+                'description': _cell(row, columns, 'description').strip()
+            }
+        except ValueError as e:
+            yield reader.line_num, e
+
+
+def read_ofx(stream, date_format=None):
+    """Yield (line number, record dict or exception) for each <STMTTRN> of an OFX (SGML or XML) statement"""
+    transaction, start_line = None, 0
+    for line_num, line in enumerate(stream, start=1):
+        for closing, tag, value in re.findall(r'<(/?)([A-Za-z0-9.]+)>([^<]*)', line):
+            tag = tag.upper()
+            if tag == 'STMTTRN' and not closing:
+                transaction, start_line = {}, line_num
+            elif tag == 'STMTTRN' and closing and transaction is not None:
+                try:
+                    amount = parse_amount(transaction.get('TRNAMT'))
+                    if amount is None:
+                        raise ValueError('Missing TRNAMT')
+                    posted = transaction.get('DTPOSTED', '')
+                    yield start_line, {
+                        'date': parse_date(posted, date_format) if date_format else parse_date(posted[:8], '%Y%m%d'),
+                        'amount': amount,
+                        'category': None,
+                        'description': transaction.get('NAME') or transaction.get('MEMO') or ''
+                    }
+                except ValueError as e:
+                    yield start_line, e
+                transaction = None
+            elif transaction is not None and not closing and value.strip():
+                transaction[tag] = value.strip()
+
+
+class StatementImporter:
+    """Dedupes and batch-inserts parsed statement records for one user"""
+
+    def __init__(self, conn, user_id, kind='auto', batch_size=BATCH_SIZE, progress=None):
+        self.conn = conn
+        self.user_id = user_id
+        self.kind = kind
+        self.batch_size = batch_size
+        self.progress = progress
+        self.category_ids = {}
+        self.batch = {'expense': [], 'income': []}
+        self.batch_days = set()
+        self.loaded_days = set()
+        self.report = {'rows': 0, 'imported': 0, 'duplicates': 0, 'error_count': 0, 'errors': []}
+        self._create_temp_tables()
+
+    def _create_temp_tables(self):
+        """
+        import_seen is the dedupe hash index: rows the user had per fingerprint before the import,
+        and the statement's rows per fingerprint so far. Staging tables hold each batch
+        """
+        self.conn.create_function('fingerprint', 4, fingerprint, deterministic=True)
+        self.conn.execute('''
+            CREATE TEMP TABLE IF NOT EXISTS import_seen (
+                hash INTEGER PRIMARY KEY, existing INTEGER NOT NULL, occurrences INTEGER NOT NULL DEFAULT 0
+            )
+        ''')
+        self.conn.execute('DELETE FROM import_seen')
+        self.conn.execute('''
+            CREATE TEMP TABLE IF NOT EXISTS import_expenses (
+                user_id INTEGER, amount_paise INTEGER, category_id INTEGER, description TEXT, day INTEGER
+            )
+        ''')
+        self.conn.execute('''
+            CREATE TEMP TABLE IF NOT EXISTS import_income (
+                user_id INTEGER, amount_paise INTEGER, source_id INTEGER, day INTEGER
+            )
+        ''')
+        self.conn.commit()
+
+    def _load_existing_hashes(self, days):
+        """
+        Fingerprint the user's existing rows on days the statement reaches for the first time, so an
+        import reads the days it covers (through the (user_id, day) indexes) and not the whole history
+        """
+        days = sorted(days - self.loaded_days)
+        for start in range(0, len(days), 500):
+            chunk = days[start:start + 500]
+            marks = ','.join('?' * len(chunk))
+            self.conn.execute(f'''
+                INSERT OR IGNORE INTO import_seen (hash, existing)
+                SELECT fingerprint('expense', day, amount_paise, description), COUNT(*) FROM expenses
+                WHERE user_id = ? AND day IN ({marks}) GROUP BY 1
+            ''', (self.user_id, *chunk))
+            self.conn.execute(f'''
+                INSERT OR IGNORE INTO import_seen (hash, existing)
+                SELECT fingerprint('income', day, amount_paise, {CATEGORY_NAME.format('income.source_id')}), COUNT(*)
+                FROM income WHERE user_id = ? AND day IN ({marks}) GROUP BY 1
+            ''', (self.user_id, *chunk))
+        self.loaded_days.update(days)
+
+    def _category_id(self, kind, name):
+        # Exact names, as in get_category_id: income sources "Salary" and "salary" are two sources
+        key = (kind, name)
+        if key not in self.category_ids:
+            self.category_ids[key] = get_category_id(self.conn, self.user_id, kind, name)
+        return self.category_ids[key]
+
+    def add_error(self, line, error):
+        self.report['error_count'] += 1
+        if len(self.report['errors']) < MAX_REPORTED_ERRORS:
+            self.report['errors'].append({'line': line, 'error': str(error)})
+
+    def add(self, line, record):
+        """Queue one parsed record; flushes when the batch is full"""
+        self.report['rows'] += 1
+        if isinstance(record, Exception):
+            self.add_error(line, record)
+            return
+
+        amount = record['amount']
+        kind = self.kind if self.kind != 'auto' else ('expense' if amount < 0 else 'income')
+        if amount == 0:
+            self.add_error(line, 'Amount is zero')
+            return
+        if record['date'] > datetime.now().date():
+            self.add_error(line, 'Date is in the future')
+            return
+
+        paise, day = to_paise(abs(amount)), to_day(record['date'])
+        if kind == 'expense':
+            category = (record['category'] or DEFAULT_EXPENSE_CATEGORY).lower()
+            description = record['description']
+            key = fingerprint(kind, day, paise, description)
+            row = (self.user_id, paise, self._category_id(kind, category), description, day)
+        else:
+            source = record['category'] or DEFAULT_INCOME_SOURCE
+            key = fingerprint(kind, day, paise, source)
+            row = (self.user_id, paise, self._category_id(kind, source), day)
+
+        self.batch[kind].append((key, row))
+        self.batch_days.add(day)
+        if len(self.batch['expense']) + len(self.batch['income']) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        """Drop duplicates from the pending batch, insert the rest and commit"""
+        pending = self.batch['expense'] + self.batch['income']
+        if not pending:
+            return
+
+        # fingerprint -> [rows the user had before the import, statement rows so far]. The n-th
+        # statement row with a fingerprint is a duplicate while n <= existing, so two identical
+        # ₹20 bus tickets on one day stay two entries, and importing the statement again adds none
+        self._load_existing_hashes(self.batch_days)
+        keys = list({key for key, _ in pending})
+        counts = {key: [0, 0] for key in keys}
+        for start in range(0, len(keys), 500):
+            chunk = keys[start:start + 500]
+            for key, existing, occurrences in self.conn.execute(
+                f'SELECT hash, existing, occurrences FROM import_seen WHERE hash IN ({",".join("?" * len(chunk))})',
+                chunk
+            ):
+                counts[key] = [existing, occurrences]
+
+        new_rows = {'expense': [], 'income': []}
+        for kind in new_rows:
+            for key, row in self.batch[kind]:
+                count = counts[key]
+                count[1] += 1
+                if count[1] <= count[0]:
+                    self.report['duplicates'] += 1
+                else:
+                    new_rows[kind].append(row)
+
+        # Stage in temp tables and copy with one INSERT ... SELECT per table: the search index triggers
+        # then run inside a single statement, so FTS5 buffers the batch instead of flushing per row
+        self.conn.executemany(
+            'INSERT INTO import_expenses (user_id, amount_paise, category_id, description, day) VALUES (?, ?, ?, ?, ?)',
+            new_rows['expense']
+        )
+        self.conn.executemany(
+            'INSERT INTO import_income (user_id, amount_paise, source_id, day) VALUES (?, ?, ?, ?)',
+            new_rows['income']
+        )
+        self.conn.execute('''
+            INSERT INTO expenses (user_id, amount_paise, category_id, description, day)
+            SELECT user_id, amount_paise, category_id, description, day FROM import_expenses
+        ''')
+        self.conn.execute('''
+            INSERT INTO income (user_id, amount_paise, source_id, day)
+            SELECT user_id, amount_paise, source_id, day FROM import_income
+        ''')
+        self.conn.execute('DELETE FROM import_expenses')
+        self.conn.execute('DELETE FROM import_income')
+        self.conn.executemany('INSERT OR REPLACE INTO import_seen (hash, existing, occurrences) VALUES (?, ?, ?)',
+                              [(key, existing, occurrences) for key, (existing, occurrences) in counts.items()])
+        months = {from_day(day)[:7] + '-01' for day in self.batch_days}
+        invalidate_insights(self.conn, self.user_id, *months)
+        self.conn.commit()
+
+        self.report['imported'] += len(new_rows['expense']) + len(new_rows['income'])
+        self.batch = {'expense': [], 'income': []}
+        self.batch_days = set()
+        if self.progress:
+            self.progress(self.report)
+
+
+def import_statement(user_id, stream, fmt='csv', mapping=None, date_format=None, kind='auto',
+                     batch_size=BATCH_SIZE, progress=None):
+    """
+    Import a statement from a text stream into the user's expenses/income.
+    kind is 'auto' (negative amounts are expenses, positive are income), 'expense' or 'income'.
+    Returns a report with rows, imported, duplicates, error_count and the first errors by line.
+    """
+    if fmt not in ('csv', 'ofx'):
+        raise ValueError('Format must be csv or ofx')
+    if kind not in ('auto', 'expense', 'income'):
+        raise ValueError('Kind must be auto, expense or income')
+
+    records = read_csv(stream, mapping, date_format) if fmt == 'csv' else read_ofx(stream, date_format)
+    with get_db(user_id) as conn:
+        importer = StatementImporter(conn, user_id, kind, batch_size, progress)
+        for line, record in records:
+            importer.add(line, record)
+        importer.flush()
+    return importer.report
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Import a bank statement (CSV or OFX) into FinHabits')
+    parser.add_argument('file', help='statement file')
+    parser.add_argument('--user', required=True, help='username to import into')
+    parser.add_argument('--format', choices=('csv', 'ofx'), help='statement format (default: from file extension)')
+    parser.add_argument('--map', action='append', default=[], metavar='FIELD=COLUMN',
+                        help='column mapping, e.g. --map date="Txn Date" (fields: ' + ', '.join(COLUMN_ALIASES) + ')')
+    parser.add_argument('--date-format', help='strptime format for the date column, e.g. %%d/%%m/%%Y')
+    parser.add_argument('--kind', choices=('auto', 'expense', 'income'), default='auto',
+                        help='auto: negative amounts are expenses, positive are income')
+    parser.add_argument('--batch-size', type=int, default=BATCH_SIZE, help='rows per insert batch and transaction')
+    args = parser.parse_args()
+
+    mapping = dict(item.split('=', 1) for item in args.map)
+    fmt = args.format or ('ofx' if args.file.lower().endswith(('.ofx', '.qfx')) else 'csv')
+
+    init_db()
+    with get_db() as conn:
+        user = conn.execute('SELECT id FROM users WHERE username = ?', (args.user,)).fetchone()
+    if not user:
+        print(f"❌ User '{args.user}' not found")
+        return
+
+    started = time.monotonic()
+
+    def progress(report):
+        print(f"   {report['rows']:,} rows read, {report['imported']:,} imported, "
+              f"{report['duplicates']:,} duplicates, {report['error_count']:,} errors "
+              f"({time.monotonic() - started:.1f}s)")
+
+    print(f"📥 Importing {args.file} ({fmt}) for {args.user}...")
+    with open(args.file, encoding='utf-8-sig', errors='replace', newline='') as f:
+        report = import_statement(user['id'], f, fmt, mapping, args.date_format, args.kind, args.batch_size, progress)
+
+    for error in report['errors']:
+        print(f"   ⚠️  line {error['line']}: {error['error']}")
+    if report['error_count'] > len(report['errors']):
+        print(f"   ... and {report['error_count'] - len(report['errors'])} more errors")
+    print(f"\n✅ Imported {report['imported']:,} of {report['rows']:,} rows in {time.monotonic() - started:.1f}s "
+          f"({report['duplicates']:,} duplicates skipped, {report['error_count']:,} errors)")
+
+
+if __name__ == '__main__':
+    main()
@@ -5,11 +5,12 @@ let selectedDate = null;
 let editingExpenseId = null;
 let editingIncomeId = null;
 let deleteCallback = null;
+let liveStats = null; // latest stats from the /api/live stream, null while it is not connected
 
 // Load dashboard data on page load
 document.addEventListener('DOMContentLoaded', () => {
     setupTabSwitching();
-    loadTodayStats();
+    connectLiveStats();
     setupCalendarWidget();
     setupEventListeners();
 
@@ -393,7 +394,7 @@ async function deleteExpense(id) {
             await apiCall(`/api/expenses/${id}`, 'DELETE');
             showAlert('Expense deleted successfully', 'success');
             loadDataForDate(selectedDate);
-            loadTodayStats();
+            refreshStats();
         } catch (error) {
             showAlert('Failed to delete expense', 'error');
         }
@@ -438,7 +439,7 @@ async function deleteIncome(id) {
             await apiCall(`/api/income/${id}`, 'DELETE');
             showAlert('Income deleted successfully', 'success');
             loadDataForDate(selectedDate);
-            loadTodayStats();
+            refreshStats();
         } catch (error) {
             showAlert('Failed to delete income', 'error');
         }
@@ -469,7 +470,7 @@ async function handleExpenseSubmit(e) {
         resetExpenseForm();
         hideAllForms();
         loadDataForDate(selectedDate);
-        loadTodayStats();
+        refreshStats();
     } catch (error) {
         showAlert(error.message || 'Failed to save expense', 'error');
     }
@@ -498,7 +499,7 @@ async function handleIncomeSubmit(e) {
         resetIncomeForm();
         hideAllForms();
         loadDataForDate(selectedDate);
-        loadTodayStats();
+        refreshStats();
     } catch (error) {
         showAlert(error.message || 'Failed to save income', 'error');
     }
@@ -648,7 +649,7 @@ async function saveHabitDetails(habitId) {
         });
 
         showAlert('Habit details saved successfully! 🎉', 'success');
-        loadTodayStats();
+        refreshStats();
         loadHabitsForDate(date);
         loadDataForDate(date);
     } catch (error) {
@@ -707,22 +708,54 @@ async function handleDeleteConfirm() {
 // Load today's stats
 async function loadTodayStats() {
     try {
-        const stats = await apiCall('/api/stats/today');
-
-        const todaySpendingEl = document.getElementById('todaySpending');
-        const monthSpendingEl = document.getElementById('monthSpending');
-        const monthIncomeEl = document.getElementById('monthIncome');
-        const habitsCompletedEl = document.getElementById('habitsCompleted');
-
-        if (todaySpendingEl) todaySpendingEl.textContent = formatCurrency(stats.today_spending);
-        if (monthSpendingEl) monthSpendingEl.textContent = formatCurrency(stats.month_spending);
-        if (monthIncomeEl) monthIncomeEl.textContent = formatCurrency(stats.month_income || 0);
-        if (habitsCompletedEl) habitsCompletedEl.textContent = stats.habits_completed_today;
+        renderTodayStats(await apiCall('/api/stats/today'));
     } catch (error) {
         console.error('Error loading stats:', error);
     }
 }
 
+// Show today's stats
+function renderTodayStats(stats) {
+    const todaySpendingEl = document.getElementById('todaySpending');
+    const monthSpendingEl = document.getElementById('monthSpending');
+    const monthIncomeEl = document.getElementById('monthIncome');
+    const habitsCompletedEl = document.getElementById('habitsCompleted');
+
+    if (todaySpendingEl) todaySpendingEl.textContent = formatCurrency(stats.today_spending);
+    if (monthSpendingEl) monthSpendingEl.textContent = formatCurrency(stats.month_spending);
+    if (monthIncomeEl) monthIncomeEl.textContent = formatCurrency(stats.month_income || 0);
+    if (habitsCompletedEl) habitsCompletedEl.textContent = stats.habits_completed_today;
+}
+
+// Refresh stats after a change; the live stream already pushes them, so only fetch without it
+function refreshStats() {
+    if (!liveStats) loadTodayStats();
+}
+
+// Receive stat updates from the server (from any tab or device) instead of polling
+function connectLiveStats() {
+    if (!window.EventSource) {
+        loadTodayStats();
+        return;
+    }
+
+    const source = new EventSource('/api/live');
+
+    // The first event has every stat, later ones only what changed (streaks per habit)
+    source.addEventListener('stats', (event) => {
+        const update = JSON.parse(event.data);
+        const streaks = { ...(liveStats ? liveStats.streaks : {}) };
+        (update.streaks || []).forEach(streak => { streaks[streak.habit_id] = streak; });
+        liveStats = { ...liveStats, ...update, streaks };
+        renderTodayStats(liveStats);
+    });
+
+    // EventSource reconnects by itself and gets a full update again; fetch meanwhile
+    source.addEventListener('error', () => {
+        liveStats = null;
+    });
+}
+
 // Show user profile modal
 async function showUserProfile() {
     try {
@@ -820,217 +853,23 @@ function hideAboutModal() {
     document.getElementById('aboutModal').classList.add('hidden');
 }
 
-// Export data function - generates PDF report
+// Export data function - the server renders the PDF report from aggregates and caches it
+// until the data changes, so repeat exports download at once
 async function exportData() {
     try {
         showAlert('Preparing PDF export...', 'info');
 
-        // Fetch all user data
-        const [expenses, income, habits, habitLogs, stats] = await Promise.all([
-            apiCall('/api/expenses/all'),
-            apiCall('/api/income/all'),
-            apiCall('/api/habits'),
-            apiCall('/api/habits/log/all'),
-            apiCall('/api/stats/all-time')
-        ]);
-
-        // Initialize jsPDF
-        const { jsPDF } = window.jspdf;
-        const doc = new jsPDF();
-
-        let yPos = 20;
-        const pageWidth = doc.internal.pageSize.width;
-        const marginLeft = 15;
-        const marginRight = 15;
-        const contentWidth = pageWidth - marginLeft - marginRight;
-
-        // Header
-        doc.setFontSize(22);
-        doc.setTextColor(37, 99, 235); // Professional blue
-        doc.text('FinHabits Data Export', pageWidth / 2, yPos, { align: 'center' });
-
-        yPos += 10;
-        doc.setFontSize(10);
-        doc.setTextColor(100, 100, 100);
-        doc.text(`Generated: ${new Date().toLocaleString()}`, pageWidth / 2, yPos, { align: 'center' });
-
-        yPos += 15;
-
-        // Summary Statistics
-        doc.setFontSize(16);
-        doc.setTextColor(0, 0, 0);
-        doc.text('Summary', marginLeft, yPos);
-        yPos += 8;
-
-        doc.setFontSize(10);
-        doc.setTextColor(60, 60, 60);
-        const summaryData = [
-            `Total Expenses: ₹${(stats.total_expenses || 0).toFixed(2)}`,
-            `Total Income: ₹${(stats.total_income || 0).toFixed(2)}`,
-            `Net Savings: ₹${((stats.total_income || 0) - (stats.total_expenses || 0)).toFixed(2)}`,
-            `Habits Tracked: ${stats.total_habit_logs || 0}`,
-            `Current Streak: ${stats.current_streak || 0} days`
-        ];
-
-        summaryData.forEach(line => {
-            doc.text(line, marginLeft + 5, yPos);
-            yPos += 6;
-        });
-
-        yPos += 10;
-
-        // Expenses Section
-        if (expenses && expenses.length > 0) {
-            doc.setFontSize(14);
-            doc.setTextColor(220, 38, 38); // Red for expenses
-            doc.text('Expenses', marginLeft, yPos);
-            yPos += 8;
-
-            doc.setFontSize(9);
-            doc.setTextColor(0, 0, 0);
-
-            // Table header
-            doc.setFont(undefined, 'bold');
-            doc.text('Date', marginLeft, yPos);
-            doc.text('Category', marginLeft + 30, yPos);
-            doc.text('Description', marginLeft + 60, yPos);
-            doc.text('Amount', marginLeft + 130, yPos);
-            yPos += 5;
-
-            doc.setFont(undefined, 'normal');
-
-            // Expenses data
-            expenses.slice(0, 50).forEach(exp => {
-                if (yPos > 270) {
-                    doc.addPage();
-                    yPos = 20;
-                }
-
-                doc.text(exp.date || '', marginLeft, yPos);
-                doc.text((exp.category || '').substring(0, 12), marginLeft + 30, yPos);
-                doc.text((exp.description || '').substring(0, 30), marginLeft + 60, yPos);
-                doc.text(`₹${parseFloat(exp.amount).toFixed(2)}`, marginLeft + 130, yPos);
-                yPos += 5;
-            });
-
-            if (expenses.length > 50) {
-                doc.setFont(undefined, 'italic');
-                doc.text(`... and ${expenses.length - 50} more expenses`, marginLeft, yPos);
-                yPos += 5;
-                doc.setFont(undefined, 'normal');
-            }
-
-            yPos += 5;
+        let report = await apiCall('/api/reports', 'POST');
+        while (report.status === 'rendering') {
+            await new Promise(resolve => setTimeout(resolve, 500));
+            report = await apiCall('/api/reports', 'POST');
         }
-
-        // Income Section
-        if (income && income.length > 0) {
-            if (yPos > 200) {
-                doc.addPage();
-                yPos = 20;
-            }
-
-            doc.setFontSize(14);
-            doc.setTextColor(34, 197, 94); // Green for income
-            doc.text('Income', marginLeft, yPos);
-            yPos += 8;
-
-            doc.setFontSize(9);
-            doc.setTextColor(0, 0, 0);
-
-            // Table header
-            doc.setFont(undefined, 'bold');
-            doc.text('Date', marginLeft, yPos);
-            doc.text('Source', marginLeft + 30, yPos);
-            doc.text('Amount', marginLeft + 130, yPos);
-            yPos += 5;
-
-            doc.setFont(undefined, 'normal');
-
-            // Income data
-            income.slice(0, 50).forEach(inc => {
-                if (yPos > 270) {
-                    doc.addPage();
-                    yPos = 20;
-                }
-
-                doc.text(inc.date || '', marginLeft, yPos);
-                doc.text((inc.source || '').substring(0, 40), marginLeft + 30, yPos);
-                doc.text(`₹${parseFloat(inc.amount).toFixed(2)}`, marginLeft + 130, yPos);
-                yPos += 5;
-            });
-
-            if (income.length > 50) {
-                doc.setFont(undefined, 'italic');
-                doc.text(`... and ${income.length - 50} more income entries`, marginLeft, yPos);
-                yPos += 5;
-                doc.setFont(undefined, 'normal');
-            }
-
-            yPos += 5;
-        }
-
-        // Habits Section
-        if (habitLogs && habitLogs.length > 0) {
-            if (yPos > 200) {
-                doc.addPage();
-                yPos = 20;
-            }
-
-            doc.setFontSize(14);
-            doc.setTextColor(37, 99, 235); // Blue for habits
-            doc.text('Habits Tracked', marginLeft, yPos);
-            yPos += 8;
-
-            doc.setFontSize(9);
-            doc.setTextColor(0, 0, 0);
-
-            // Table header
-            doc.setFont(undefined, 'bold');
-            doc.text('Date', marginLeft, yPos);
-            doc.text('Habit', marginLeft + 30, yPos);
-            doc.text('Duration', marginLeft + 80, yPos);
-            doc.text('Topic', marginLeft + 110, yPos);
-            yPos += 5;
-
-            doc.setFont(undefined, 'normal');
-
-            // Habits data
-            habitLogs.slice(0, 50).forEach(log => {
-                if (yPos > 270) {
-                    doc.addPage();
-                    yPos = 20;
-                }
-
-                doc.text(log.date || '', marginLeft, yPos);
-                doc.text((log.name || '').substring(0, 20), marginLeft + 30, yPos);
-
-                const duration = log.duration_minutes ? `${Math.floor(log.duration_minutes / 60)}h ${log.duration_minutes % 60}m` : '-';
-                doc.text(duration, marginLeft + 80, yPos);
-                doc.text((log.topic || '-').substring(0, 25), marginLeft + 110, yPos);
-                yPos += 5;
-            });
-
-            if (habitLogs.length > 50) {
-                doc.setFont(undefined, 'italic');
-                doc.text(`... and ${habitLogs.length - 50} more habit logs`, marginLeft, yPos);
-                doc.setFont(undefined, 'normal');
-            }
-        }
-
-        // Footer on last page
-        const totalPages = doc.internal.pages.length - 1;
-        for (let i = 1; i <= totalPages; i++) {
-            doc.setPage(i);
-            doc.setFontSize(8);
-            doc.setTextColor(150, 150, 150);
-            doc.text(`Page ${i} of ${totalPages}`, pageWidth / 2, 285, { align: 'center' });
-            doc.text('FinHabits - Transform Your Financial Future', pageWidth / 2, 290, { align: 'center' });
+        if (report.error) {
+            throw new Error(report.error);
         }
 
-        // Save the PDF
-        const filename = `finhabits-report-${new Date().toISOString().split('T')[0]}.pdf`;
-        doc.save(filename);
+        // Served as an attachment, so the page stays where it is
+        window.location.href = report.url;
 
         showAlert('PDF report downloaded successfully! 📄', 'success');
     } catch (error) {
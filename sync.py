@@ -0,0 +1,91 @@
+"""
+Delta sync for offline-capable clients
+Triggers in database.py keep one change_log entry per expense, income, habit and habit
+log row, moved to the end of the log whenever the row is inserted, updated or deleted
+(deleted rows stay as tombstones). A client keeps the cursor from its last response and
+asks only for what changed after it, so a sync costs as much as the activity since the
+last visit rather than the size of the history.
+Sync covers the hot tables only. Archiving a year (archive.py) is not reported as deletions:
+it sets a reset point for every user it moved rows of, so each of their clients gets
+reset=True once and reloads the hot set. Archived years stay read-only and come from the
+/all endpoints.
+"""
+from database import (get_read_db, shard_for_user, SYNC_TABLES, EXPENSE_FIELDS, INCOME_FIELDS,
+                      HABIT_LOG_FIELDS)
+
+SYNC_PAGE_SIZE = 500
+MAX_SYNC_PAGE_SIZE = 5000
+
+CHANGED_IDS = 'SELECT row_id FROM change_log WHERE user_id = ? AND tbl = ? AND seq > ? AND seq <= ? AND NOT deleted'
+
+# Rows come back in the same shape as the list endpoints
+SYNC_QUERIES = {
+    'expenses': f'SELECT {EXPENSE_FIELDS} FROM expenses WHERE id IN ({CHANGED_IDS}) ORDER BY id',
+    'income': f'SELECT {INCOME_FIELDS} FROM income WHERE id IN ({CHANGED_IDS}) ORDER BY id',
+    'habits': f'SELECT * FROM habits WHERE id IN ({CHANGED_IDS}) ORDER BY id',
+    'habit_logs': f'''
+        SELECT {HABIT_LOG_FIELDS}, h.name
+        FROM habit_logs hl
+        JOIN habits h ON hl.habit_id = h.id
+        WHERE hl.id IN ({CHANGED_IDS})
+        ORDER BY hl.id
+    '''
+}
+
+
+def parse_cursor(cursor):
+    """'<shard>:<seq>' -> (shard, seq); None for a missing or malformed cursor"""
+    shard, _, seq = (cursor or '').rpartition(':')
+    if not shard or not seq.isdigit():
+        return None
+    return shard, int(seq)
+
+
+def get_changes(user_id, cursor=None, limit=SYNC_PAGE_SIZE):
+    """
+    Rows changed and ids deleted after cursor, at most limit changes per call.
+    reset is True when the client must drop its local copy first: no cursor, or one that can
+    no longer be continued (the user moved to another shard). Repeat with the returned cursor
+    while has_more is True.
+    """
+    limit = int(limit)
+    if not 1 <= limit <= MAX_SYNC_PAGE_SIZE:
+        raise ValueError(f'Limit must be between 1 and {MAX_SYNC_PAGE_SIZE}')
+
+    shard = shard_for_user(user_id)
+    position = parse_cursor(cursor)
+    with get_read_db(user_id) as conn:
+        reset_row = conn.execute('SELECT seq FROM sync_resets WHERE user_id = ?', (user_id,)).fetchone()
+        reset = position is None or position[0] != shard or position[1] < (reset_row[0] if reset_row else 0)
+        after = 0 if reset else position[1]
+
+        bound = conn.execute(
+            'SELECT seq FROM change_log WHERE user_id = ? AND seq > ? ORDER BY seq LIMIT 1 OFFSET ?',
+            (user_id, after, limit - 1)
+        ).fetchone()
+        if bound:
+            upto = bound[0]
+        else:
+            upto = conn.execute('SELECT MAX(seq) FROM change_log WHERE user_id = ?', (user_id,)).fetchone()[0]
+            upto = max(upto or 0, after)
+        has_more = conn.execute(
+            'SELECT 1 FROM change_log WHERE user_id = ? AND seq > ? LIMIT 1', (user_id, upto)
+        ).fetchone() is not None
+
+        changes = {table: [dict(row) for row in conn.execute(SYNC_QUERIES[table], (user_id, table, after, upto))]
+                   for table in SYNC_TABLES}
+        deleted = {table: [] for table in SYNC_TABLES}
+        if not reset:
+            for row in conn.execute(
+                'SELECT tbl, row_id FROM change_log WHERE user_id = ? AND seq > ? AND seq <= ? AND deleted ORDER BY seq',
+                (user_id, after, upto)
+            ):
+                deleted[row['tbl']].append(row['row_id'])
+
+    return {
+        'cursor': f'{shard}:{upto}',
+        'reset': reset,
+        'has_more': has_more,
+        'changes': changes,
+        'deleted': deleted
+    }
@@ -0,0 +1,113 @@
+"""
+Shared fixtures: a throwaway database filled with generated data, and the Flask app on top of it
+"""
+import os
+import random
+import sys
+from datetime import date
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# No AI calls from tests: routes take their fallback paths
+os.environ['GEMINI_API_KEY'] = ''
+os.environ.setdefault('SECRET_KEY', 'tests')
+# Reports render inside the request that asks for them, so their SQL is captured with it
+os.environ['REPORT_WORKERS'] = '0'
+
+FIXTURE_USERS = 3
+FIXTURE_DAYS = 730
+EXPENSE_CATEGORIES = ('food', 'transport', 'education', 'entertainment', 'others')
+INCOME_SOURCES = ('Monthly Allowance', 'Part-time Tutoring', 'Freelance Work')
+WORDS = ('lunch', 'bus', 'books', 'movie', 'coffee', 'groceries', 'rent', 'course', 'gift', 'fuel')
+
+
+def generate_user_data(conn, user_id, rng):
+    """Two years of expenses, income, habit logs and savings contributions up to today for one user"""
+    from database import get_category_id, to_day
+
+    categories = [get_category_id(conn, user_id, 'expense', name) for name in EXPENSE_CATEGORIES]
+    sources = [get_category_id(conn, user_id, 'income', name) for name in INCOME_SOURCES]
+    habits = [row['id'] for row in conn.execute('SELECT id FROM habits WHERE user_id = ?', (user_id,))]
+    last_day = to_day(date.today())
+
+    expenses, income, logs = [], [], []
+    for day in range(last_day - FIXTURE_DAYS, last_day + 1):
+        for _ in range(rng.randint(1, 4)):
+            expenses.append((user_id, rng.randint(2000, 50000), rng.choice(categories),
+                             ' '.join(rng.sample(WORDS, 2)), day))
+        if rng.random() < 0.15:
+            income.append((user_id, rng.randint(100000, 500000), rng.choice(sources), day))
+        for habit_id in habits:
+            if rng.random() < 0.7:
+                logs.append((habit_id, user_id, day, rng.random() < 0.8, rng.randint(10, 120), 'morning',
+                             rng.choice(WORDS), '', ''))
+
+    conn.executemany(
+        'INSERT INTO expenses (user_id, amount_paise, category_id, description, day) VALUES (?, ?, ?, ?, ?)',
+        expenses
+    )
+    conn.executemany('INSERT INTO income (user_id, amount_paise, source_id, day) VALUES (?, ?, ?, ?)', income)
+    conn.executemany('''
+        INSERT INTO habit_logs (habit_id, user_id, day, completed, duration_minutes, time_slots, topic, tasks, notes)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ''', logs)
+    conn.execute('''
+        INSERT INTO recurring_rules (user_id, kind, amount_paise, category_id, description, frequency, every,
+                                     start_day, next_day)
+        VALUES (?, 'expense', 49900, ?, 'phone plan', 'monthly', 1, ?, ?)
+    ''', (user_id, categories[-1], last_day - 90, last_day - 90))
+    conn.execute('INSERT INTO budgets (user_id, category_id, limit_paise) VALUES (?, ?, ?)',
+                 (user_id, categories[0], 500000))
+    goal_id = conn.execute('''
+        INSERT INTO savings_goals (user_id, name, target_paise, target_day, start_day) VALUES (?, 'Laptop', ?, ?, ?)
+    ''', (user_id, 8000000, last_day + 180, last_day - FIXTURE_DAYS)).lastrowid
+    conn.executemany('INSERT INTO savings (user_id, goal_id, amount_paise, day) VALUES (?, ?, ?, ?)',
+                     [(user_id, goal_id, rng.randint(100000, 300000), day)
+                      for day in range(last_day - FIXTURE_DAYS, last_day + 1, 30)])
+
+
+@pytest.fixture(scope='session')
+def fixture_db(tmp_path_factory):
+    """Point the app at a fresh database with FIXTURE_USERS users of generated data; yields their ids"""
+    import database
+    database.DB_PATH = str(tmp_path_factory.mktemp('db') / 'finhabits.db')
+    import reports
+    reports.REPORT_DIR = str(tmp_path_factory.mktemp('reports'))
+
+    from app import app
+    from database import get_db
+
+    client = app.test_client()
+    user_ids = []
+    for n in range(FIXTURE_USERS):
+        client.post('/signup', json={'username': f'user{n}', 'email': f'user{n}@example.com', 'password': 'secret'})
+        with get_db() as conn:
+            user_ids.append(conn.execute('SELECT id FROM users WHERE email = ?', (f'user{n}@example.com',)).fetchone()[0])
+
+    rng = random.Random(43)
+    for user_id in user_ids:
+        with get_db(user_id) as conn:
+            generate_user_data(conn, user_id, rng)
+            conn.commit()
+
+    # Production databases are analyzed by maintenance.py, so plans are checked with statistics in place
+    for path in {database.shard_path(shard) for shard in database.all_shards()}:
+        conn = database.connect(path)
+        conn.execute('ANALYZE')
+        conn.commit()
+        conn.close()
+    yield user_ids
+
+
+@pytest.fixture(scope='session')
+def app_client(fixture_db):
+    """Flask test client logged in as the first fixture user"""
+    from app import app
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session['user_id'] = fixture_db[0]
+        session['username'] = 'user0'
+    return client
@@ -0,0 +1,279 @@
+"""
+Query-plan regression tests
+Every route in app.py (and ai_advisor.get_monthly_data) is exercised against the generated
+fixture while each SQL statement it issues is recorded. Each statement is then run through
+EXPLAIN QUERY PLAN, and the tests fail when a query reads expenses, income or habit_logs by
+scanning the table, reaches them through an unexpected index, or when any plan differs from
+the recorded one in query_plans.json.
+
+    python -m pytest -q tests/test_query_plans.py
+    UPDATE_QUERY_PLANS=1 python -m pytest -q tests/test_query_plans.py   # accept plan changes
+"""
+import io
+import json
+import os
+import re
+import sqlite3
+from datetime import date
+
+import pytest
+
+PLANS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'query_plans.json')
+UPDATE_PLANS = os.getenv('UPDATE_QUERY_PLANS') == '1'
+
+# How the hot tables may be reached: their covering (user_id, day, ...) index, or a row id lookup.
+# habit_logs is also looked up by its UNIQUE(habit_id, day) constraint when a log is written.
+EXPECTED_INDEXES = {
+    'expenses': ('idx_expenses_user_day',),
+    'income': ('idx_income_user_day',),
+    'habit_logs': ('idx_habit_logs_user_day', 'sqlite_autoindex_habit_logs_1')
+}
+
+TODAY = date.today()
+THIS_MONTH = TODAY.strftime('%Y-%m')
+Y, M = TODAY.year, TODAY.month
+STATEMENT_CSV = 'Date,Description,Amount\n{today},Coffee,-120.50\n{today},Refund,300\n'
+
+# (name, method, path, request kwargs); {names} in paths and bodies are filled from the fixture ids
+ROUTE_CALLS = [
+    ('login', 'POST', '/login', {'json': {'email': 'user0@example.com', 'password': 'secret'}}),
+    ('expenses day', 'GET', f'/api/expenses?date={TODAY}', {}),
+    ('expenses month', 'GET', f'/api/expenses?month={THIS_MONTH}', {}),
+    ('add expense', 'POST', '/api/expenses', {'json': {'amount': 99.5, 'category': 'food', 'description': 'lunch'}}),
+    ('update expense', 'PUT', '/api/expenses/{expense_id}',
+     {'json': {'amount': 10, 'category': 'transport', 'description': 'bus', 'date': str(TODAY)}}),
+    ('delete expense', 'DELETE', '/api/expenses/{expense_id}', {}),
+    ('income day', 'GET', f'/api/income?date={TODAY}', {}),
+    ('income month', 'GET', f'/api/income?month={THIS_MONTH}', {}),
+    ('add income', 'POST', '/api/income', {'json': {'amount': 5000, 'source': 'Freelance Work'}}),
+    ('update income', 'PUT', '/api/income/{income_id}', {'json': {'amount': 2500, 'source': 'Gift', 'date': str(TODAY)}}),
+    ('delete income', 'DELETE', '/api/income/{income_id}', {}),
+    ('recurring list', 'GET', '/api/recurring', {}),
+    ('add recurring', 'POST', '/api/recurring',
+     {'json': {'type': 'income', 'amount': 100, 'source': 'Pocket money', 'frequency': 'weekly',
+               'start_date': f'{Y - 1}-01-01'}}),
+    ('delete recurring', 'DELETE', '/api/recurring/{rule_id}', {}),
+    ('habits', 'GET', '/api/habits', {}),
+    ('add habit', 'POST', '/api/habits', {'json': {'name': 'Reading'}}),
+    ('habit logs day', 'GET', f'/api/habits/log?date={TODAY}', {}),
+    ('habit logs month', 'GET', f'/api/habits/log?month={THIS_MONTH}', {}),
+    ('log habit', 'POST', '/api/habits/log', {'json': {'habit_id': '{habit_id}', 'completed': True}}),
+    ('habit heatmap', 'GET', '/api/habits/heatmap', {}),
+    ('habit heatmap one habit', 'GET', '/api/habits/heatmap?habit_id={habit_id}', {}),
+    ('streaks', 'GET', '/api/streaks', {}),
+    ('calendar', 'GET', f'/api/calendar/{Y}/{M}', {}),
+    ('insights', 'GET', f'/api/insights/{Y}/{M}', {}),
+    ('correlations', 'GET', f'/api/analytics/correlations/{Y}/{M}', {}),
+    ('budgets', 'GET', '/api/budgets', {}),
+    ('set budget', 'POST', '/api/budgets', {'json': {'category': 'transport', 'limit': 1500}}),
+    ('delete budget', 'DELETE', '/api/budgets/transport', {}),
+    ('budget alerts', 'GET', '/api/budgets/alerts?all=1', {}),
+    ('mark alerts seen', 'POST', '/api/budgets/alerts', {'json': {}}),
+    ('stats today', 'GET', '/api/stats/today', {}),
+    ('stats all-time', 'GET', '/api/stats/all-time', {}),
+    ('export expenses', 'GET', '/api/expenses/all', {}),
+    ('export income', 'GET', '/api/income/all', {}),
+    ('export habit logs', 'GET', '/api/habits/log/all', {}),
+    ('import', 'POST', '/api/import', {'statement': STATEMENT_CSV}),
+    ('search', 'GET', '/api/search?q=lunch', {}),
+    ('search filtered', 'GET', f'/api/search?q=bo&type=expense&category=food&from={Y - 1}-01-01&to={TODAY}', {}),
+    ('full sync', 'GET', '/api/sync?limit=1000', {}),
+    ('delta sync', 'GET', '/api/sync?cursor=main:1&limit=1000', {}),
+    ('report', 'POST', '/api/reports', {}),
+    ('series', 'GET', '/api/stats/series', {}),
+    ('series by year', 'GET', f'/api/stats/series?granularity=year&from={Y - 1}-03-15&category=food', {}),
+    ('series by week', 'GET', f'/api/stats/series?granularity=week&from={Y}-01-01&habit_id={{habit_id}}', {}),
+    ('series by day', 'GET', f'/api/stats/series?granularity=day&from={TODAY.replace(day=1)}&category=transport', {}),
+    ('savings goals', 'GET', '/api/savings/goals', {}),
+    ('add savings goal', 'POST', '/api/savings/goals', {'json': {'name': 'Trip', 'target': 20000,
+                                                                  'target_date': f'{Y + 1}-01-01'}}),
+    ('savings goal', 'GET', '/api/savings/goals/{goal_id}', {}),
+    ('update savings goal', 'PUT', '/api/savings/goals/{goal_id}', {'json': {'name': 'New laptop', 'target': 90000}}),
+    ('add contribution', 'POST', '/api/savings/goals/{goal_id}/contributions', {'json': {'amount': 1500}}),
+    ('delete contribution', 'DELETE', '/api/savings/contributions/{contribution_id}', {}),
+]
+
+# Query paths used outside a request: the chatbot's context (the route returns before it when
+# no API key is set) and the monthly data behind AI insights
+FUNCTION_CALLS = ['load_chatbot_context', 'ai_advisor.get_monthly_data']
+NAMES = [name for name, _, _, _ in ROUTE_CALLS] + FUNCTION_CALLS
+
+DML = re.compile(r'^\s*(SELECT|WITH|INSERT|UPDATE|DELETE|REPLACE)\b', re.IGNORECASE)
+# SQL functions the app registers on its connections (name -> argument count)
+APP_FUNCTIONS = {'fingerprint': 4, 'to_paise': 1, 'to_day': 1}
+TEMP_DDL = re.compile(r'^\s*CREATE\s+TEMP(ORARY)?\s', re.IGNORECASE)
+SQL_KEYWORDS = {'WHERE', 'JOIN', 'LEFT', 'INNER', 'CROSS', 'ON', 'USING', 'GROUP', 'ORDER', 'LIMIT', 'UNION',
+                'SET', 'VALUES', 'AS', 'NATURAL', 'EXCEPT', 'INTERSECT', 'HAVING', 'WINDOW'}
+
+
+def normalize(sql):
+    """Statement text with literals replaced by ?, used to match statements across runs"""
+    sql = re.sub(r"'(?:[^']|'')*'", '?', sql)
+    sql = re.sub(r'(?<![\w.])-?\d+(?:\.\d+)?\b', '?', sql)
+    sql = re.sub(r'\?(?:\s*,\s*\?)+', '?, ...', sql)
+    return ' '.join(sql.split())
+
+
+def table_aliases(sql):
+    """alias -> table for every FROM/JOIN (and UPDATE/INTO) in a statement"""
+    aliases = {}
+    pattern = r'\b(?:FROM|JOIN|UPDATE|INTO)\s+(?:\w+\.)?(\w+)(?:\s+(?:AS\s+)?(\w+))?'
+    for table, alias in re.findall(pattern, sql, re.IGNORECASE):
+        aliases[table] = table
+        if alias and alias.upper() not in SQL_KEYWORDS:
+            aliases[alias] = table
+    return aliases
+
+
+def query_plan(conn, sql):
+    """EXPLAIN QUERY PLAN lines, indented by depth"""
+    depth, plan = {0: -1}, []
+    for node, parent, _, detail in conn.execute(f'EXPLAIN QUERY PLAN {sql}'):
+        depth[node] = depth.get(parent, -1) + 1
+        plan.append('  ' * depth[node] + detail)
+    return plan
+
+
+def plan_problems(sql, plan, index_tables):
+    """Reasons a statement's plan reads a hot table the wrong way"""
+    aliases = table_aliases(sql)
+    problems = []
+    for line in plan:
+        match = re.match(r'\s*(SCAN|SEARCH) (\w+)(?: USING (?:COVERING )?INDEX (\w+)| USING (INTEGER PRIMARY KEY))?',
+                         line)
+        if not match:
+            continue
+        op, name, index, rowid = match.groups()
+        table = index_tables.get(index) or aliases.get(name, name)
+        if table not in EXPECTED_INDEXES:
+            continue
+        if op == 'SCAN':
+            problems.append(f'full scan of {table}: {line.strip()}')
+        elif not rowid and index not in EXPECTED_INDEXES[table]:
+            problems.append(f'{table} read through {index or "no index"}: {line.strip()}')
+    return problems
+
+
+@pytest.fixture(scope='module')
+def captured(fixture_db, app_client):
+    """
+    name -> {normalized statement: (statement, shard path)} issued by each call in NAMES,
+    plus the CREATE TEMP statements those calls ran, which EXPLAIN needs replayed
+    """
+    import database
+    import ai_advisor
+    from app import load_chatbot_context
+
+    user_id = fixture_db[0]
+    with database.get_read_db(user_id) as conn:
+        ids = {
+            'expense_id': conn.execute('SELECT MIN(id) FROM expenses WHERE user_id = ?', (user_id,)).fetchone()[0],
+            'income_id': conn.execute('SELECT MIN(id) FROM income WHERE user_id = ?', (user_id,)).fetchone()[0],
+            'rule_id': conn.execute('SELECT MIN(id) FROM recurring_rules WHERE user_id = ?', (user_id,)).fetchone()[0],
+            'habit_id': conn.execute('SELECT MIN(id) FROM habits WHERE user_id = ?', (user_id,)).fetchone()[0],
+            'goal_id': conn.execute('SELECT MIN(id) FROM savings_goals WHERE user_id = ?', (user_id,)).fetchone()[0],
+            'contribution_id': conn.execute('SELECT MIN(id) FROM savings WHERE user_id = ?', (user_id,)).fetchone()[0]
+        }
+
+    statements = []
+    connect, connect_readonly = database.connect, database.connect_readonly
+
+    def traced(open_connection):
+        def wrapper(path):
+            conn = open_connection(path)
+            conn.set_trace_callback(lambda sql: statements.append((sql, path)))
+            return conn
+        return wrapper
+
+    database.connect, database.connect_readonly = traced(connect), traced(connect_readonly)
+    # Pooled read connections were opened before tracing started
+    database.close_read_connections()
+    results = {}
+    try:
+        for name, method, path, kwargs in ROUTE_CALLS:
+            path = path.format(**ids)
+            kwargs = json.loads(json.dumps(kwargs).replace('"{habit_id}"', str(ids['habit_id'])))
+            if 'statement' in kwargs:
+                upload = (io.BytesIO(kwargs.pop('statement').format(today=TODAY).encode()), 'bank.csv')
+                kwargs['data'] = {'file': upload}
+            del statements[:]
+            response = app_client.open(path, method=method, **kwargs)
+            assert response.status_code < 400, f'{name}: {response.status_code} {response.get_data(as_text=True)}'
+            results[name] = list(statements)
+
+        del statements[:]
+        load_chatbot_context(user_id, 'How much did I spend on food this month?')
+        results['load_chatbot_context'] = list(statements)
+
+        del statements[:]
+        ai_advisor.get_monthly_data(user_id, Y, M)
+        results['ai_advisor.get_monthly_data'] = list(statements)
+    finally:
+        database.connect, database.connect_readonly = connect, connect_readonly
+        database.close_read_connections()
+
+    temp_tables = {sql: path for calls in results.values() for sql, path in calls if TEMP_DDL.match(sql)}
+    return ({name: {normalize(sql): (sql, path) for sql, path in calls if DML.match(sql)}
+             for name, calls in results.items()}, temp_tables)
+
+
+@pytest.fixture(scope='module')
+def plans(captured):
+    """name -> {normalized statement: plan lines}, plus index name -> table"""
+    by_name, temp_tables = captured
+    plans, index_tables = {}, {}
+    connections = {}
+    try:
+        for name, statements in by_name.items():
+            plans[name] = {}
+            for key, (sql, path) in sorted(statements.items()):
+                if path not in connections:
+                    connections[path] = sqlite3.connect(path)
+                    for function, args in APP_FUNCTIONS.items():
+                        connections[path].create_function(function, args, lambda *values: None)
+                    index_tables.update(connections[path].execute(
+                        "SELECT name, tbl_name FROM sqlite_master WHERE type = 'index'"
+                    ).fetchall())
+                    for ddl in (ddl for ddl, ddl_path in temp_tables.items() if ddl_path == path):
+                        connections[path].execute(ddl)
+                plans[name][key] = query_plan(connections[path], sql)
+    finally:
+        for conn in connections.values():
+            conn.close()
+    return plans, index_tables
+
+
+@pytest.mark.parametrize('name', NAMES)
+def test_hot_tables_use_expected_index(name, captured, plans):
+    by_name, _ = captured
+    by_statement, index_tables = plans
+    assert by_name[name], f'{name} issued no SQL'
+    problems = []
+    for key, plan in by_statement[name].items():
+        for problem in plan_problems(by_name[name][key][0], plan, index_tables):
+            problems.append(f'{problem}\n    in: {key}')
+    assert not problems, '\n'.join(problems)
+
+
+def test_plans_match_recorded(plans):
+    by_statement, _ = plans
+    current = {'sqlite_version': sqlite3.sqlite_version, 'plans': by_statement}
+    if UPDATE_PLANS or not os.path.exists(PLANS_PATH):
+        with open(PLANS_PATH, 'w') as f:
+            json.dump(current, f, indent=2, sort_keys=True)
+            f.write('\n')
+        return
+
+    with open(PLANS_PATH) as f:
+        recorded = json.load(f)
+    changes = []
+    for name in NAMES:
+        before, after = recorded['plans'].get(name, {}), by_statement.get(name, {})
+        for key in sorted(set(before) | set(after)):
+            if before.get(key) != after.get(key):
+                changes.append(f'{name}: {key}\n    recorded: {before.get(key)}\n    now:      {after.get(key)}')
+    assert not changes, (
+        f"Query plans changed (recorded with SQLite {recorded['sqlite_version']}, running {sqlite3.sqlite_version}).\n"
+        'Check them, then run UPDATE_QUERY_PLANS=1 python -m pytest tests/test_query_plans.py to accept:\n'
+        + '\n'.join(changes)
+    )
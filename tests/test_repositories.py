@@ -0,0 +1,109 @@
+"""
+Repository contract tests
+The same route calls run once on the SQLite backend and once on the memory backend, each
+for a freshly signed-up user, and every response must match. This keeps the memory backend
+a faithful stand-in for benchmarks and fast tests.
+
+    python -m pytest -q tests/test_repositories.py
+"""
+import re
+from datetime import date, timedelta
+
+import pytest
+
+from repositories import repos
+
+TODAY = date.today()
+YESTERDAY = TODAY - timedelta(days=1)
+# Differ between backends (ids, timestamps) or between users
+VOLATILE = {'id', 'user_id', 'habit_id', 'created_at', 'account_created'}
+
+
+def normalize(value):
+    """Response JSON without VOLATILE fields; lists are compared as multisets"""
+    if isinstance(value, dict):
+        return {key: normalize(item) for key, item in value.items() if key not in VOLATILE}
+    if isinstance(value, list):
+        return sorted((normalize(item) for item in value), key=repr)
+    return value
+
+
+def run_scenario(client, email):
+    """Sign up, log in and exercise every repository-backed route; returns the normalized responses"""
+    client.post('/signup', json={'username': email.split('@')[0], 'email': email, 'password': 'secret'})
+    client.post('/login', json={'email': email, 'password': 'secret'})
+    month = TODAY.strftime('%Y-%m')
+    results = []
+
+    def call(method, path, **kwargs):
+        response = client.open(path, method=method, **kwargs)
+        assert response.status_code < 500, f'{method} {path}: {response.get_data(as_text=True)}'
+        results.append((method, re.sub(r'\d+', '#', path.split('?')[0]), response.status_code, normalize(response.get_json())))
+        return response.get_json()
+
+    call('POST', '/api/expenses', json={'amount': 120.5, 'category': 'food', 'description': 'lunch'})
+    call('POST', '/api/expenses', json={'amount': 40, 'category': 'transport', 'date': str(YESTERDAY)})
+    call('POST', '/api/income', json={'amount': 5000, 'source': 'Freelance Work'})
+    call('POST', '/api/income', json={'amount': 300, 'source': 'Gift', 'date': str(YESTERDAY)})
+    expense_id = call('GET', f'/api/expenses?date={TODAY}')[0]['id']
+    income_id = call('GET', f'/api/income?date={YESTERDAY}')[0]['id']
+    call('PUT', f'/api/expenses/{expense_id}',
+         json={'amount': 99, 'category': 'education', 'description': 'books', 'date': str(YESTERDAY)})
+    call('DELETE', f'/api/income/{income_id}')
+    call('DELETE', f'/api/income/{income_id}')
+    call('PUT', f'/api/expenses/{expense_id + 10 ** 6}', json={'amount': 1, 'category': 'food', 'date': str(TODAY)})
+    call('GET', f'/api/expenses?month={month}')
+    call('GET', f'/api/income?month={month}')
+
+    call('POST', '/api/habits', json={'name': 'Reading'})
+    habits = call('GET', '/api/habits')
+    for habit in habits:
+        call('POST', '/api/habits/log', json={'habit_id': habit['id'], 'date': str(YESTERDAY), 'completed': True})
+    call('POST', '/api/habits/log', json={'habit_id': habits[0]['id'], 'completed': True, 'duration_minutes': 45,
+                                          'time_slots': '07:00-07:45', 'topic': 'algebra'})
+    call('POST', '/api/habits/log', json={'habit_id': habits[0]['id'], 'completed': False, 'notes': 'skipped'})
+    call('POST', '/api/habits/log', json={'habit_id': habits[1]['id'], 'completed': True,
+                                          'time_slots': '7-8pm, 21:30-22:15'})
+    call('GET', f'/api/habits/log?date={TODAY}')
+    call('GET', f'/api/habits/log?month={month}')
+    call('GET', '/api/habits/heatmap')
+    call('GET', f"/api/habits/heatmap?habit_id={habits[1]['id']}&from={YESTERDAY}")
+
+    call('GET', '/api/stats/today')
+    call('GET', '/api/stats/all-time')
+    call('GET', '/api/stats/series')
+    call('GET', f'/api/stats/series?granularity=day&from={YESTERDAY}&category=education')
+    call('GET', f"/api/stats/series?granularity=week&habit_id={habits[1]['id']}")
+    call('GET', '/api/streaks')
+    call('GET', f'/api/calendar/{TODAY.year}/{TODAY.month}')
+    call('GET', '/api/expenses/all')
+    call('GET', '/api/income/all')
+    call('GET', '/api/habits/log/all')
+    return results
+
+
+@pytest.fixture
+def memory_backend():
+    repos.use('memory')
+    yield
+    repos.use('sqlite')
+
+
+def test_backends_match(fixture_db, memory_backend):
+    from app import app
+
+    memory = run_scenario(app.test_client(), 'memory@example.com')
+    repos.use('sqlite')
+    sqlite = run_scenario(app.test_client(), 'sqlite@example.com')
+
+    assert len(memory) == len(sqlite)
+    for from_memory, from_sqlite in zip(memory, sqlite):
+        assert from_memory == from_sqlite
+
+
+def test_memory_user_data_is_separate(memory_backend):
+    repos.expenses.add(1, 1000, 'food', 'lunch', 100)
+    repos.expenses.add(2, 2000, 'food', 'dinner', 100)
+    assert [row['amount'] for row in repos.expenses.for_day(1, 100)] == [10.0]
+    assert repos.expenses.get(2, repos.expenses.for_day(1, 100)[0]['id']) is None
+    assert not repos.expenses.delete(2, repos.expenses.for_day(1, 100)[0]['id'])
@@ -0,0 +1,79 @@
+"""
+Savings goals: trigger-maintained totals and projections
+"""
+from datetime import date, timedelta
+
+import pytest
+
+TODAY = date.today()
+
+
+@pytest.fixture
+def client(fixture_db):
+    """A logged-in client for a fresh user"""
+    from app import app
+    client = app.test_client()
+    email = 'saver@example.com'
+    client.post('/signup', json={'username': 'saver', 'email': email, 'password': 'secret'})
+    client.post('/login', json={'email': email, 'password': 'secret'})
+    return client
+
+
+def test_totals_follow_contributions(client):
+    from database import get_read_db
+    from savings import goal_status
+
+    goal_id = client.post('/api/savings/goals', json={'name': 'Bike', 'target': 1000}).get_json()['id']
+    for amount, days_ago in ((300, 9), (200, 4), (-50, 0)):
+        response = client.post(f'/api/savings/goals/{goal_id}/contributions',
+                               json={'amount': amount, 'date': str(TODAY - timedelta(days=days_ago))})
+        assert response.status_code == 200
+    assert client.post(f'/api/savings/goals/{goal_id}/contributions', json={'amount': -1000}).status_code == 400
+
+    goal = client.get(f'/api/savings/goals/{goal_id}').get_json()
+    client.delete(f"/api/savings/contributions/{goal['recent_contributions'][0]['id']}")
+
+    goal = client.get(f'/api/savings/goals/{goal_id}').get_json()
+    assert (goal['saved'], goal['contributions'], goal['percent']) == (500, 2, 50.0)
+    # 500 saved over 10 days since the first contribution: 50 a day, 10 more days to go
+    assert goal['daily_rate'] == 50
+    assert goal['projected_date'] == str(TODAY + timedelta(days=10))
+    assert goal['status'] == 'on_track'
+
+    with client.session_transaction() as session:
+        user_id = session['user_id']
+    with get_read_db(user_id) as conn:
+        summed = conn.execute('SELECT SUM(amount_paise), COUNT(*) FROM savings WHERE goal_id = ?',
+                              (goal_id,)).fetchone()
+    assert tuple(summed) == (50000, 2)
+    assert goal_status(user_id)['total_saved'] == 500
+
+
+def test_deadline_and_validation(client):
+    deadline = str(TODAY + timedelta(days=2))
+    goal_id = client.post('/api/savings/goals',
+                          json={'name': 'Phone', 'target': 700, 'target_date': deadline}).get_json()['id']
+    client.post(f'/api/savings/goals/{goal_id}/contributions', json={'amount': 100})
+
+    goal = client.get('/api/savings/goals').get_json()['goals'][-1]
+    assert goal['status'] == 'behind' and goal['needed_per_day'] == 200
+
+    assert client.post('/api/savings/goals', json={'name': 'Phone', 'target': 10}).status_code == 400
+    assert client.post('/api/savings/goals', json={'name': 'Zero', 'target': 0}).status_code == 400
+    assert client.put(f'/api/savings/goals/{goal_id}', json={'name': 'Phone', 'target': 100}).status_code == 200
+    assert client.get(f'/api/savings/goals/{goal_id}').get_json()['status'] == 'completed'
+
+    assert client.delete(f'/api/savings/goals/{goal_id}').status_code == 200
+    assert client.get(f'/api/savings/goals/{goal_id}').status_code == 404
+    assert client.post(f'/api/savings/goals/{goal_id}/contributions', json={'amount': 5}).status_code == 404
+
+
+def test_removing_a_deposit_cannot_overdraw(client):
+    goal_id = client.post('/api/savings/goals', json={'name': 'Trip', 'target': 500}).get_json()['id']
+    client.post(f'/api/savings/goals/{goal_id}/contributions', json={'amount': 100})
+    client.post(f'/api/savings/goals/{goal_id}/contributions', json={'amount': -80})
+
+    deposit = client.get(f'/api/savings/goals/{goal_id}').get_json()['recent_contributions'][-1]
+    assert deposit['amount'] == 100
+    assert client.delete(f"/api/savings/contributions/{deposit['id']}").status_code == 400
+    assert client.get(f'/api/savings/goals/{goal_id}').get_json()['saved'] == 20
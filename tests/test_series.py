@@ -0,0 +1,78 @@
+"""
+Range summaries: rollup-backed and scanned buckets must match plain sums over the rows
+"""
+from datetime import date, timedelta
+
+import pytest
+
+from timeseries import bucket_key, buckets, parse_range
+
+TODAY = date.today()
+
+
+def expected_series(user_id, start_day, end_day, granularity, category=None, habit_id=None):
+    """The same buckets summed row by row"""
+    from database import get_read_db
+    totals = {}
+    with get_read_db(user_id) as conn:
+        rows = [('spent', row) for row in conn.execute('''
+            SELECT e.day, e.amount_paise FROM expenses e JOIN categories c ON c.id = e.category_id
+            WHERE e.user_id = ? AND e.day >= ? AND e.day < ? AND (? IS NULL OR c.name = ?)
+        ''', (user_id, start_day, end_day, category, category))]
+        rows += [('earned', row) for row in conn.execute(
+            'SELECT day, amount_paise FROM income WHERE user_id = ? AND day >= ? AND day < ?',
+            (user_id, start_day, end_day))]
+        rows += [('completed', row) for row in conn.execute(
+            'SELECT day, completed FROM habit_logs WHERE user_id = ? AND day >= ? AND day < ? '
+            'AND (? IS NULL OR habit_id = ?)', (user_id, start_day, end_day, habit_id, habit_id))]
+    for column, (day, value) in rows:
+        bucket = totals.setdefault(bucket_key(day, granularity), {'spent': 0, 'earned': 0, 'completed': 0})
+        bucket[column] += value
+    empty = {'spent': 0, 'earned': 0, 'completed': 0}
+    layout = [totals.get(key, empty) for key, _, _ in buckets(start_day, end_day, granularity)]
+    return ([b['spent'] / 100 for b in layout], [b['earned'] / 100 for b in layout],
+            [b['completed'] for b in layout])
+
+
+@pytest.mark.parametrize('query', [
+    {'granularity': 'month'},
+    {'granularity': 'month', 'from': str(TODAY - timedelta(days=400)), 'to': str(TODAY - timedelta(days=20))},
+    {'granularity': 'year', 'from': str(TODAY - timedelta(days=700)), 'category': 'food'},
+    {'granularity': 'week', 'from': str(TODAY - timedelta(days=90)), 'habit_id': 'first'},
+    {'granularity': 'day', 'from': str(TODAY - timedelta(days=10)), 'category': 'transport'},
+])
+def test_series_matches_rows(fixture_db, app_client, query):
+    from database import get_read_db
+    user_id = fixture_db[0]
+    if query.get('habit_id') == 'first':
+        with get_read_db(user_id) as conn:
+            query = {**query, 'habit_id': conn.execute('SELECT MIN(id) FROM habits WHERE user_id = ?',
+                                                       (user_id,)).fetchone()[0]}
+
+    result = app_client.get('/api/stats/series', query_string=query).get_json()
+    start_day, end_day, granularity = parse_range(query.get('from'), query.get('to'), query['granularity'])
+    spent, earned, completed = expected_series(user_id, start_day, end_day, granularity,
+                                               query.get('category'), query.get('habit_id'))
+
+    assert result['spent'] == pytest.approx(spent)
+    assert result['earned'] == pytest.approx(earned)
+    assert result['habits_completed'] == completed
+    assert len(result['starts']) == len(result['ends']) == len(spent)
+    assert result['totals']['spent'] == pytest.approx(sum(spent))
+
+
+def test_default_range_and_validation(app_client):
+    result = app_client.get('/api/stats/series').get_json()
+    assert len(result['starts']) == 12 and result['to'] == str(TODAY)
+    assert result['starts'][-1] == str(TODAY.replace(day=1))
+    assert app_client.get('/api/stats/series?granularity=hour').status_code == 400
+    assert app_client.get(f'/api/stats/series?from={TODAY}&to={TODAY - timedelta(days=1)}').status_code == 400
+    assert app_client.get('/api/stats/series?granularity=day&from=2000-01-01').status_code == 400
+
+
+def test_bucket_limit_is_checked_before_querying():
+    from timeseries import MAX_BUCKETS
+    start = TODAY - timedelta(days=MAX_BUCKETS - 1)
+    assert len(buckets(*parse_range(str(start), str(TODAY), 'day'))) == MAX_BUCKETS
+    with pytest.raises(ValueError):
+        parse_range(str(start - timedelta(days=1)), str(TODAY), 'day')
@@ -0,0 +1,50 @@
+"""
+Statement import: duplicates are counted per occurrence, not per fingerprint
+"""
+import io
+
+STATEMENT = '''Date,Description,Amount
+2001-03-05,bus ticket,-20
+2001-03-05,bus ticket,-20
+2001-03-05,lunch,-150
+2001-03-06,Part-time Tutoring,3000
+'''
+
+
+def count_rows(user_id):
+    from database import get_read_db, to_day
+    with get_read_db(user_id) as conn:
+        return conn.execute('SELECT COUNT(*) FROM expenses WHERE user_id = ? AND day = ? AND description = ?',
+                            (user_id, to_day('2001-03-05'), 'bus ticket')).fetchone()[0]
+
+
+def test_repeated_rows_are_kept_and_reimport_adds_nothing(fixture_db):
+    from statement_import import import_statement
+    user_id = fixture_db[-1]
+
+    first = import_statement(user_id, io.StringIO(STATEMENT), batch_size=2)
+    assert (first['imported'], first['duplicates']) == (4, 0)
+    assert count_rows(user_id) == 2
+
+    again = import_statement(user_id, io.StringIO(STATEMENT))
+    assert (again['imported'], again['duplicates']) == (0, 4)
+
+    # A statement with one more identical ticket adds just that one
+    third = import_statement(user_id, io.StringIO(STATEMENT + '2001-03-05,bus ticket,-20\n'))
+    assert (third['imported'], third['duplicates']) == (1, 4)
+    assert count_rows(user_id) == 3
+
+
+def test_income_sources_keep_their_spelling(fixture_db):
+    from database import get_read_db, to_day
+    from statement_import import import_statement
+    user_id = fixture_db[-1]
+    statement = 'Date,Category,Amount\n2001-04-01,Salary,5000\n2001-04-02,salary,6000\n'
+
+    assert import_statement(user_id, io.StringIO(statement))['imported'] == 2
+    with get_read_db(user_id) as conn:
+        sources = [row[0] for row in conn.execute('''
+            SELECT c.name FROM income i JOIN categories c ON c.id = i.source_id
+            WHERE i.user_id = ? AND i.day >= ? ORDER BY i.day
+        ''', (user_id, to_day('2001-04-01')))]
+    assert sources[:2] == ['Salary', 'salary']
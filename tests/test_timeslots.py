@@ -0,0 +1,40 @@
+"""
+Time slot parsing and the heatmap built from the bitmaps
+"""
+import pytest
+
+from timeslots import parse_time_slots, heatmap, SLOTS
+
+
+def slots(text):
+    bits = parse_time_slots(text)
+    return [slot for slot in range(SLOTS) if bits >> slot & 1]
+
+
+@pytest.mark.parametrize('text, expected', [
+    ('10:00 AM - 11:00 AM', [20, 21]),
+    ('07:00-07:45', [14, 15]),
+    ('7-8pm, 21:30-22:15', [38, 39, 43, 44]),
+    ('11-1pm', [22, 23, 24, 25]),
+    ('11pm-1am', [0, 1, 46, 47]),
+    ('9.30am to 10am', [19]),
+    ('10am-12pm\n2pm-3pm', [20, 21, 22, 23, 28, 29]),
+])
+def test_ranges(text, expected):
+    assert slots(text) == expected
+
+
+@pytest.mark.parametrize('text', ['', None, 'morning', '2024-05-01', '25:00-26:00', '13pm-14pm',
+                                  '10-13pm', '0-1pm', '13-14pm'])
+def test_text_without_ranges(text):
+    assert parse_time_slots(text) == 0
+
+
+def test_heatmap_minutes():
+    monday = [0] * SLOTS
+    monday[14] = monday[15] = 2         # two logs covering 07:00-08:00
+    result = heatmap({0: monday})
+    assert result['weekdays'][0]['minutes'][7] == 120
+    assert result['hours'][7] == 120 and result['total_minutes'] == 120
+    assert result['busiest_hour'] == 7
+    assert heatmap({})['busiest_hour'] is None
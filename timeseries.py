@@ -0,0 +1,126 @@
+"""
+Buckets for range summaries
+A range of days is cut into day, week (Monday first), month or year buckets. Every bucket has
+an integer key that SQL computes from a day number with BUCKET_KEYS and Python with
+bucket_key(), so a backend only groups rows by key; series() lays the totals out in order,
+empty buckets included, in the columnar shape charts use.
+"""
+from datetime import date
+
+from database import to_day, from_day, from_paise, MONTH_KEY
+
+GRANULARITIES = ('day', 'week', 'month', 'year')
+DEFAULT_BUCKETS = 12        # when no 'from' is given: the 12 buckets ending with 'to'
+MAX_BUCKETS = 1000
+
+# Day number -> bucket key: the day itself, the week's Monday, YYYYMM or YYYY
+BUCKET_KEYS = {
+    'day': '{}',
+    'week': '({0} - ({0} + 3) % 7)',
+    'month': MONTH_KEY,
+    'year': "CAST(strftime('%Y', {} * 86400, 'unixepoch') AS INTEGER)"
+}
+
+
+def bucket_key(day, granularity):
+    if granularity == 'day':
+        return day
+    if granularity == 'week':
+        return day - (day + 3) % 7
+    value = date.fromisoformat(from_day(day))
+    return value.year * 100 + value.month if granularity == 'month' else value.year
+
+
+def bucket_start(key, granularity):
+    """First day of the bucket with the given key"""
+    if granularity in ('day', 'week'):
+        return key
+    if granularity == 'month':
+        return to_day(date(key // 100, key % 100, 1))
+    return to_day(date(key, 1, 1))
+
+
+def next_bucket(day, granularity):
+    """First day of the bucket after the one starting on day"""
+    if granularity == 'day':
+        return day + 1
+    if granularity == 'week':
+        return day + 7
+    value = date.fromisoformat(from_day(day))
+    if granularity == 'month':
+        return to_day(date(value.year + value.month // 12, value.month % 12 + 1, 1))
+    return to_day(date(value.year + 1, 1, 1))
+
+
+def buckets(start_day, end_day, granularity):
+    """(key, first day, last day) of each bucket overlapping [start_day, end_day), clipped to it"""
+    result = []
+    day = bucket_start(bucket_key(start_day, granularity), granularity)
+    while day < end_day:
+        if len(result) >= MAX_BUCKETS:
+            raise ValueError(f'More than {MAX_BUCKETS} buckets; use a coarser granularity')
+        following = next_bucket(day, granularity)
+        result.append((bucket_key(day, granularity), max(day, start_day), min(following, end_day) - 1))
+        day = following
+    return result
+
+
+def full_months(start_day, end_day):
+    """[first, last) day span of the whole calendar months inside [start_day, end_day), or None"""
+    first = bucket_start(bucket_key(start_day, 'month'), 'month')
+    if first < start_day:
+        first = next_bucket(first, 'month')
+    last = bucket_start(bucket_key(end_day, 'month'), 'month')
+    return (first, last) if first < last else None
+
+
+def parse_range(date_from, date_to, granularity):
+    """
+    Inclusive YYYY-MM-DD bounds and a granularity -> (start_day, end_day, granularity).
+    Raises ValueError for a range of more than MAX_BUCKETS buckets, before anything is queried
+    """
+    granularity = granularity or 'month'
+    if granularity not in GRANULARITIES:
+        raise ValueError(f"Granularity must be one of {', '.join(GRANULARITIES)}")
+    end_day = to_day(date_to or date.today()) + 1
+    if date_from:
+        start_day = to_day(date_from)
+    else:
+        start_day = bucket_start(bucket_key(end_day - 1, granularity), granularity)
+        for _ in range(DEFAULT_BUCKETS - 1):
+            start_day = bucket_start(bucket_key(start_day - 1, granularity), granularity)
+    if start_day >= end_day:
+        raise ValueError("'from' must not be after 'to'")
+    buckets(start_day, end_day, granularity)
+    return start_day, end_day, granularity
+
+
+def series(totals, start_day, end_day, granularity):
+    """
+    API shape of {bucket key: (spent_paise, earned_paise, completed habit logs)}: one entry per
+    bucket in each list, plus the totals over the whole range
+    """
+    spent, earned, completed = [], [], []
+    layout = buckets(start_day, end_day, granularity)
+    for key, _, _ in layout:
+        bucket = totals.get(key, (0, 0, 0))
+        spent.append(bucket[0] or 0)
+        earned.append(bucket[1] or 0)
+        completed.append(bucket[2] or 0)
+    return {
+        'from': from_day(start_day),
+        'to': from_day(end_day - 1),
+        'granularity': granularity,
+        'starts': [from_day(first) for _, first, _ in layout],
+        'ends': [from_day(last) for _, _, last in layout],
+        'spent': [from_paise(value) for value in spent],
+        'earned': [from_paise(value) for value in earned],
+        'net': [from_paise(income - expense) for expense, income in zip(spent, earned)],
+        'habits_completed': completed,
+        'totals': {
+            'spent': from_paise(sum(spent)),
+            'earned': from_paise(sum(earned)),
+            'net': from_paise(sum(earned) - sum(spent)),
+            'habits_completed': sum(completed)
+        }
+    }
@@ -0,0 +1,87 @@
+"""
+Habit time slots as bitmaps
+habit_logs.time_slots is whatever the user typed ("10:00 AM - 11:00 AM", "7-8pm, 21:30-22:15").
+On write it is parsed once into habit_logs.slot_bits, 48 bits where bit i means the habit ran
+during the half hour starting at i * 30 minutes past midnight, so the heatmap adds up bits
+with integer operations instead of parsing text. Text that holds no time range gives 0.
+"""
+import re
+
+SLOT_MINUTES = 30
+SLOTS = 24 * 60 // SLOT_MINUTES
+DAY_MINUTES = 24 * 60
+WEEKDAYS = ('Mon', 'Tue', 'Wed', 'Thu', 'Fri', 'Sat', 'Sun')
+
+# "10:00 AM - 11:00 AM", "7-8pm", "07:00 to 07:45", "9.30am–10am"
+TIME = r'(\d{1,2})(?:[:.](\d{2}))?\s*([ap])?\.?\s*m?\.?'
+# Dates such as 2024-05-01 or 05-01-2024 are not ranges
+RANGE = re.compile(r'(?<![\w/-])' + TIME + r'\s*(?:-|–|—|to)\s*' + TIME + r'(?![\d/-])', re.IGNORECASE)
+
+# One count per slot of each weekday: SUM over the logs of each bit of slot_bits
+SLOT_SUMS = ', '.join(f'SUM((slot_bits >> {slot}) & 1)' for slot in range(SLOTS))
+
+
+def _minutes(hour, minute, meridiem):
+    hour, minute = int(hour), int(minute or 0)
+    if meridiem:
+        if not 1 <= hour <= 12:
+            return None
+        hour = hour % 12 + (12 if meridiem.lower() == 'p' else 0)
+    if hour > 24 or minute > 59 or hour * 60 + minute > DAY_MINUTES:
+        return None
+    return hour * 60 + minute
+
+
+def slot_mask(start, end):
+    """Bits of the half hours overlapping [start, end) minutes past midnight; a range past midnight wraps"""
+    if end == start:
+        return 0
+    if end < start:
+        return slot_mask(start, DAY_MINUTES) | slot_mask(0, end)
+    first, last = start // SLOT_MINUTES, (end - 1) // SLOT_MINUTES
+    return ((1 << (last - first + 1)) - 1) << first
+
+
+def parse_time_slots(text):
+    """slot_bits for a time_slots string"""
+    bits = 0
+    for match in RANGE.finditer(text or ''):
+        start_hour, start_minute, start_meridiem, end_hour, end_minute, end_meridiem = match.groups()
+        if start_meridiem is None and end_meridiem is not None:
+            # "7-8pm": the start shares the end's am/pm unless that puts it after the end ("11-1pm")
+            start_meridiem = end_meridiem
+            start, end = _minutes(start_hour, start_minute, start_meridiem), _minutes(end_hour, end_minute, end_meridiem)
+            if start is not None and end is not None and start > end:
+                start_meridiem = 'a' if end_meridiem.lower() == 'p' else 'p'
+        start = _minutes(start_hour, start_minute, start_meridiem)
+        end = _minutes(end_hour, end_minute, end_meridiem)
+        # An hour that does not exist on the clock it is read with ("13pm", "0pm") drops the range
+        if start is not None and end is not None:
+            bits |= slot_mask(start % DAY_MINUTES, end)
+    return bits
+
+
+def weekday(day):
+    """0 for Monday through 6 for Sunday; day 0 (1970-01-01) was a Thursday"""
+    return (day + 3) % 7
+
+
+def heatmap(slot_counts):
+    """
+    API shape of {weekday: [logs covering each slot]}: minutes spent per weekday and hour of
+    day, their totals per hour, and the busiest hour
+    """
+    grid = []
+    for index, name in enumerate(WEEKDAYS):
+        counts = slot_counts.get(index, [0] * SLOTS)
+        per_hour = SLOTS // 24
+        grid.append({'weekday': name, 'minutes': [sum(counts[hour * per_hour:(hour + 1) * per_hour]) * SLOT_MINUTES
+                                                  for hour in range(24)]})
+    hours = [sum(row['minutes'][hour] for row in grid) for hour in range(24)]
+    return {
+        'slot_minutes': SLOT_MINUTES,
+        'weekdays': grid,
+        'hours': hours,
+        'total_minutes': sum(hours),
+        'busiest_hour': hours.index(max(hours)) if any(hours) else None
+    }